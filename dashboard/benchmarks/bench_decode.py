@@ -0,0 +1,102 @@
+"""Compare the JSON decoders on a synthetic LIST response.
+
+The payload mimics a `GET /api/v1/namespaces` on a cluster with many
+namespaces, including the `managedFields` and annotations that real clusters
+attach to every object.
+
+Usage:
+    python -m benchmarks.bench_decode [--namespaces 10000] [--repeat 5]
+
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, List
+
+import src.decoders
+
+
+def make_payload(num: int) -> bytes:
+    """Return a realistic JSON LIST response with `num` namespaces."""
+    items = []
+    for i in range(num):
+        name = f"namespace-{i:06d}"
+        items.append({
+            "metadata": {
+                "name": name,
+                "uid": f"5d0e4c4a-{i:04x}-4a7e-9c43-0b8e1e0a{i:04x}",
+                "resourceVersion": str(1000 + i),
+                "creationTimestamp": "2023-04-01T12:00:00Z",
+                "labels": {"kubernetes.io/metadata.name": name, "team": f"team-{i % 40}"},
+                "annotations": {
+                    "kubectl.kubernetes.io/last-applied-configuration": json.dumps(
+                        {"apiVersion": "v1", "kind": "Namespace",
+                         "metadata": {"name": name}}),
+                },
+                "managedFields": [{
+                    "manager": "kubectl-client-side-apply",
+                    "operation": "Update",
+                    "apiVersion": "v1",
+                    "time": "2023-04-01T12:00:00Z",
+                    "fieldsType": "FieldsV1",
+                    "fieldsV1": {"f:metadata": {"f:labels": {".": {}, "f:team": {}}}},
+                }],
+            },
+            "spec": {"finalizers": ["kubernetes"]},
+            "status": {"phase": "Active"},
+        })
+    data = {
+        "kind": "NamespaceList",
+        "apiVersion": "v1",
+        "metadata": {"resourceVersion": "99999"},
+        "items": items,
+    }
+    return json.dumps(data).encode()
+
+
+def measure(func: Callable[[], object], repeat: int):
+    """Return best wall time (s) and peak traced allocation (bytes) of `func`."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    ret = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del ret
+    return best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--namespaces", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body = make_payload(args.namespaces)
+    print(f"Payload: {args.namespaces} namespaces, {len(body) / 2**20:.1f} MiB\n")
+
+    # The baseline is what `aiohttp.ClientResponse.json()` does: a full decode
+    # with the standard library and no projection.
+    cases: List[tuple] = [("stdlib (full, baseline)", lambda: json.loads(body))]
+    for name in src.decoders.available():
+        def run(name=name):
+            src.decoders.BACKEND = name
+            return src.decoders.loads_list_metadata(body)
+        cases.append((f"{name} (metadata)", run))
+
+    print(f"{'decoder':<26}{'time [ms]':>12}{'peak alloc [MiB]':>20}{'speedup':>10}")
+    baseline = None
+    for label, func in cases:
+        elapsed, peak = measure(func, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{label:<26}{elapsed * 1000:>12.1f}{peak / 2**20:>20.1f}"
+              f"{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure how many log records per second the event loop thread can emit.
+
+Compare the old synchronous pipeline, ie a `StreamHandler` that formats with
+the standard library and writes in the calling thread, against the queued
+pipeline of `src.logstreams`. The sink optionally sleeps on every write to
+mimic a slow stdout pipe.
+
+Usage:
+    python -m benchmarks.bench_logging [--records 50000] [--write-delay 0]
+
+"""
+import argparse
+import io
+import logging
+import queue
+import time
+
+import src.logstreams
+import src.metrics
+
+
+class SlowSink(io.StringIO):
+    """In-memory stream that takes `delay` seconds per write."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s: str) -> int:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return super().write(s)
+
+
+def emit(logger: logging.Logger, num: int) -> float:
+    """Return the records per second `logger` accepted from the calling thread."""
+    t0 = time.perf_counter()
+    for i in range(num):
+        logger.info("Served request", {"path": "/k8s-namespaces", "code": 200, "i": i})
+    return num / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--write-delay", type=float, default=0.0)
+    parser.add_argument("--queue-size", type=int, default=src.logstreams.QUEUE_SIZE)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    # Baseline: format with the standard library and write synchronously in
+    # the calling thread.
+    encoder = src.logstreams.dumps
+    src.logstreams.dumps = src.logstreams._dumps_stdlib
+    handler = logging.StreamHandler(SlowSink(args.write_delay))
+    handler.setFormatter(src.logstreams.JsonFormatter())
+    logger.handlers = [handler]
+    baseline = emit(logger, args.records)
+    src.logstreams.dumps = encoder
+
+    # Queued: the calling thread only formats and enqueues the record.
+    stream = logging.StreamHandler(SlowSink(args.write_delay))
+    records: queue.Queue = queue.Queue(args.queue_size)
+    listener = src.logstreams.Listener(records, stream)
+    listener.start()
+    logger.handlers = [src.logstreams.DroppingQueueHandler(records)]
+
+    dropped = src.metrics.PROM_LOG_DROPPED._value.get()
+    queued = emit(logger, args.records)
+    t0 = time.perf_counter()
+    listener.stop()
+    drain = time.perf_counter() - t0
+    dropped = src.metrics.PROM_LOG_DROPPED._value.get() - dropped
+
+    print(f"{'pipeline':<22}{'records/s':>14}")
+    print(f"{'sync stdlib (before)':<22}{baseline:>14,.0f}")
+    print(f"{'queued (after)':<22}{queued:>14,.0f}   {queued / baseline:.1f}x")
+    print(f"\nEncoder: {src.logstreams.dumps.__name__}, "
+          f"dropped {dropped:.0f} records, drained the queue in {drain * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare K8s protobuf with JSON LIST responses on the wire and in the decoder.
+
+Both payloads encode the same synthetic namespaces as `bench_decode`. The
+sizes are reported uncompressed and gzipped, since K8s compresses large
+responses if the client accepts it.
+
+Usage:
+    python -m benchmarks.bench_protobuf [--namespaces 10000] [--repeat 5]
+
+"""
+import argparse
+import gzip
+import json
+from typing import List
+
+import src.decoders
+import src.protobuf
+from benchmarks.bench_decode import make_payload, measure
+from tests.protobuf_encode import namespace_list
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--namespaces", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body_json = make_payload(args.namespaces)
+    data = json.loads(body_json)
+    body_pb = namespace_list(data["items"], data["metadata"])
+
+    print(f"Payload: {args.namespaces} namespaces\n")
+    print(f"{'encoding':<12}{'raw [KiB]':>12}{'gzip [KiB]':>12}")
+    for label, body in (("json", body_json), ("protobuf", body_pb)):
+        size, size_gz = len(body), len(gzip.compress(body, 6))
+        print(f"{label:<12}{size / 1024:>12.0f}{size_gz / 1024:>12.0f}")
+    print()
+
+    # The baseline is what `aiohttp.ClientResponse.json()` does: a full decode
+    # with the standard library and no projection.
+    cases: List[tuple] = [("stdlib (full, baseline)", lambda: json.loads(body_json))]
+    for name in src.decoders.available():
+        def run(name=name):
+            src.decoders.BACKEND = name
+            return src.decoders.loads_list_metadata(body_json)
+        cases.append((f"{name} (metadata)", run))
+    cases.append(("protobuf (metadata)",
+                  lambda: src.protobuf.loads_list_metadata(body_pb)))
+
+    print(f"{'decoder':<26}{'time [ms]':>12}{'peak alloc [MiB]':>20}{'speedup':>10}")
+    baseline = None
+    for label, func in cases:
+        elapsed, peak = measure(func, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{label:<26}{elapsed * 1000:>12.1f}{peak / 2**20:>20.1f}"
+              f"{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Load test the dashboard against a local stand-in for the K8s API.
+
+Three processes take part:
+
+  * a fake K8s API that serves LIST responses with `--namespaces` namespaces
+    (in chunks, like the real API server) and watch streams that modify
+    `--churn` namespaces per second,
+  * the dashboard itself, ie `src.server.FASTAPI_APP` under uvicorn,
+  * a load generator with `--clients` concurrent clients per path.
+
+The load generator reports the throughput and latency percentiles of every
+path, and the dashboard process reports its resident memory.
+
+Usage:
+    python -m benchmarks.bench_server [--namespaces 10000] [--clients 50]
+        [--duration 10] [--path /k8s-namespaces ...] [--min-rps 0]
+
+The script exits with a non-zero code if any path served fewer than
+`--min-rps` requests per second, which makes it usable as a regression gate.
+
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import aiohttp
+import uvicorn
+from aiohttp import web
+
+import src.endpoints
+import src.logstreams
+import src.server
+from src.models import Config
+
+# Dummy credentials that satisfy `src.k8s.create_session`.
+CREDS_PATH = Path(__file__).parent.parent / "tests" / "support"
+
+
+def free_port() -> int:
+    """Return a TCP port that is currently unused on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    """Block until a server accepts connections on `port`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def rss_mib() -> Tuple[float, float]:
+    """Return the current and peak resident memory of this process in MiB."""
+    pagesize = os.sysconf("SC_PAGE_SIZE")
+    with open("/proc/self/statm") as fd:
+        current = int(fd.read().split()[1]) * pagesize
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return current / 2**20, peak / 2**20
+
+
+# ----------------------------------------------------------------------
+#                              Fake K8s API
+# ----------------------------------------------------------------------
+def make_namespace(i: int, rv: int) -> dict:
+    """Return a namespace manifest of realistic size."""
+    name = f"namespace-{i:06d}"
+    return {
+        "metadata": {
+            "name": name,
+            "uid": f"5d0e4c4a-{i:04x}-4a7e-9c43-0b8e1e0a{i:04x}",
+            "resourceVersion": str(rv),
+            "creationTimestamp": "2023-04-01T12:00:00Z",
+            "labels": {"kubernetes.io/metadata.name": name, "team": f"team-{i % 40}"},
+            "managedFields": [{
+                "manager": "kubectl-client-side-apply",
+                "operation": "Update",
+                "apiVersion": "v1",
+                "time": "2023-04-01T12:00:00Z",
+                "fieldsType": "FieldsV1",
+                "fieldsV1": {"f:metadata": {"f:labels": {".": {}, "f:team": {}}}},
+            }],
+        },
+        "spec": {"finalizers": ["kubernetes"]},
+        "status": {"phase": "Active"},
+    }
+
+
+class FakeK8s:
+    """Serve namespace LISTs and watches like the K8s API server would."""
+
+    def __init__(self, num: int, churn: float):
+        self.items = [make_namespace(i, 1000) for i in range(num)]
+        self.churn = churn
+        self.rv = 1000
+
+    async def namespaces(self, request: web.Request) -> web.StreamResponse:
+        if request.query.get("watch") in ("1", "true"):
+            return await self.watch(request)
+
+        # Serve the LIST in chunks, the continue token is the start index.
+        limit = int(request.query.get("limit", "0")) or len(self.items)
+        start = int(request.query.get("continue") or "0")
+        stop = start + limit
+        cont = str(stop) if stop < len(self.items) else ""
+        body = {
+            "kind": "NamespaceList",
+            "apiVersion": "v1",
+            "metadata": {"resourceVersion": str(self.rv), "continue": cont},
+            "items": self.items[start:stop],
+        }
+        return web.json_response(body)
+
+    async def empty_list(self, request: web.Request) -> web.Response:
+        body = {"metadata": {"resourceVersion": str(self.rv)}, "items": []}
+        return web.json_response(body)
+
+    async def watch(self, request: web.Request) -> web.StreamResponse:
+        """Stream MODIFIED events for `churn` namespaces per second."""
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        deadline = time.monotonic() + int(request.query.get("timeoutSeconds", "300"))
+        i = 0
+        while self.churn > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(1 / self.churn)
+            self.rv += 1
+            obj = self.items[i % len(self.items)]
+            obj["metadata"]["resourceVersion"] = str(self.rv)
+            event = {"type": "MODIFIED", "object": obj}
+            await resp.write(json.dumps(event).encode() + b"\n")
+            i += 1
+        return resp
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v1/namespaces", self.namespaces)
+        app.router.add_get("/api/v1/services", self.empty_list)
+        app.router.add_get("/apis/apps/v1/deployments", self.empty_list)
+        return app
+
+
+def run_fake_k8s(port: int, num: int, churn: float) -> None:
+    """Serve the fake K8s API on `port` until killed."""
+    web.run_app(FakeK8s(num, churn).app(), host="127.0.0.1", port=port,
+                print=lambda *_: None, access_log=None)
+
+
+# ----------------------------------------------------------------------
+#                            Load generator
+# ----------------------------------------------------------------------
+async def hammer(url: str, clients: int, duration: float) -> Tuple[List[float], int]:
+    """Return the latencies and error count of `clients` looping over `url`."""
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(sess: aiohttp.ClientSession):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            async with sess.get(url) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    conn = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=conn) as sess:
+        await asyncio.gather(*[client(sess) for _ in range(clients)])
+    return latencies, errors
+
+
+def run_load(base: str, paths: List[str], clients: int, duration: float, results):
+    """Load test every path in turn and put one result dict per path."""
+    for path in paths:
+        latencies, errors = asyncio.run(hammer(base + path, clients, duration))
+        latencies.sort()
+        pct = statistics.quantiles(latencies, n=100, method="inclusive")
+        results.put({
+            "path": path,
+            "requests": len(latencies),
+            "rps": len(latencies) / duration,
+            "p50": pct[49], "p90": pct[89], "p99": pct[98], "max": latencies[-1],
+            "errors": errors,
+        })
+
+
+# ----------------------------------------------------------------------
+#                               Dashboard
+# ----------------------------------------------------------------------
+async def serve(args, k8s_port: int) -> int:
+    """Run the dashboard, drive it with the load generator and print the results."""
+    app = src.server.FASTAPI_APP
+    app.extra["config"] = Config(
+        k8s_session=None,
+        k8s_url=f"http://127.0.0.1:{k8s_port}",
+        k8s_creds_path=CREDS_PATH,
+    )
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=port, access_log=False, log_config=None,
+    ))
+    server_task = asyncio.create_task(server.serve())
+
+    # Wait until the informer has the complete namespace list.
+    t0 = time.perf_counter()
+    while "informer" not in app.extra:
+        await asyncio.sleep(0.01)
+    await asyncio.wait_for(app.extra["informer"].synced.wait(), timeout=60)
+    print(f"Informer synced {args.namespaces} namespaces in "
+          f"{time.perf_counter() - t0:.2f}s, RSS {rss_mib()[0]:.0f} MiB\n")
+
+    # Run the load generator in its own process, lest it competes with the
+    # dashboard for the event loop.
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=run_load, args=(
+        f"http://127.0.0.1:{port}", args.path, args.clients, args.duration, results))
+    proc.start()
+
+    rows: List[Dict] = []
+    while len(rows) < len(args.path):
+        rows.append(await asyncio.get_running_loop().run_in_executor(None, results.get))
+    proc.join()
+
+    server.should_exit = True
+    await server_task
+
+    print(f"{'path':<44}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for row in rows:
+        print(f"{row['path']:<44}{row['rps']:>9.0f}{row['p50'] * 1000:>9.1f}"
+              f"{row['p90'] * 1000:>9.1f}{row['p99'] * 1000:>9.1f}"
+              f"{row['max'] * 1000:>9.1f}{row['errors']:>8}")
+    current, peak = rss_mib()
+    print(f"\nDashboard RSS: {current:.0f} MiB (peak {peak:.0f} MiB)")
+
+    slow = [_["path"] for _ in rows if _["rps"] < args.min_rps]
+    if slow:
+        print(f"FAIL: below {args.min_rps} req/s: {', '.join(slow)}")
+    return 1 if slow else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--namespaces", type=int, default=10_000)
+    parser.add_argument("--churn", type=float, default=10,
+                        help="namespaces the fake API modifies per second")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to load test each path")
+    parser.add_argument("--path", action="append",
+                        help="path to load test, may be repeated")
+    parser.add_argument("--min-rps", type=float, default=0)
+    args = parser.parse_args()
+    args.path = args.path or ["/healthz", "/k8s-namespaces"]
+
+    # The dashboard must not spend the benchmark writing log lines.
+    src.logstreams.setup("warning")
+
+    k8s_port = free_port()
+    k8s = multiprocessing.get_context("spawn").Process(
+        target=run_fake_k8s, args=(k8s_port, args.namespaces, args.churn))
+    k8s.start()
+    try:
+        wait_for_port(k8s_port)
+        return asyncio.run(serve(args, k8s_port))
+    finally:
+        k8s.terminate()
+        k8s.join()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
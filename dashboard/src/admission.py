@@ -0,0 +1,176 @@
+"""Shed excess load early instead of queuing it.
+
+`RateLimiter` limits how many requests every client may make, and
+`RateLimitMiddleware` rejects the excess with "429 Too Many Requests".
+`Bulkhead` caps the number of concurrent K8s calls and rejects new ones with
+`Overloaded` once too many are waiting for their turn.
+
+"""
+import asyncio
+import contextlib
+import math
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Hashable, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import src.metrics
+
+# Probes must not compete with the clients for their tokens.
+EXEMPT_PATHS = {"/healthz", "/readyz"}
+
+
+class Overloaded(Exception):
+    """Too many K8s calls are in flight and waiting already."""
+
+
+class RateLimiter:
+    """Token bucket per client.
+
+    Every client may issue `burst` requests at once and then `rate` requests
+    per second on average. Only the `max_clients` most recently seen clients
+    are tracked, ie the memory stays bounded no matter how many there are.
+
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = time.monotonic
+
+        # Remaining tokens of each client and when we last updated them.
+        self._buckets: OrderedDict[Hashable, Tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: Hashable) -> float:
+        """Take a token from the bucket of `key`.
+
+        Return zero if the client may proceed, or else the seconds until its
+        next token becomes available.
+
+        """
+        now = self.clock()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+
+        delay = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            delay = (1 - tokens) / self.rate
+
+        # Forget the clients we have not heard from for the longest time.
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return delay
+
+
+def client_key(scope: Scope, header: Optional[str] = None, trusted_hops: int = 1) -> str:
+    """Return the identity of the client that sent the request in `scope`.
+
+    A proxy hides all clients behind its own address, so use the address it
+    appended to the `header`, eg "X-Forwarded-For", if that is set. Clients
+    may put anything into the header themselves, which is why only the
+    entries appended by our `trusted_hops` proxies count, ie the entry
+    `trusted_hops` positions from the right.
+
+    """
+    if header and trusted_hops > 0:
+        value = Headers(scope=scope).get(header)
+        hops = [_.strip() for _ in value.split(",")] if value else []
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class RateLimitMiddleware:
+    """Reject requests from clients that exceed their rate limit.
+
+    The limiter is the `RateLimiter` in the `extra` dict of the application
+    under the "ratelimit" key; requests pass through unchecked without it.
+    The `Config` of the application specifies which header, if any,
+    identifies the clients, see `client_key`.
+
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extra = scope["app"].extra if "app" in scope else {}
+        limiter: Optional[RateLimiter] = extra.get("ratelimit")
+        if scope["type"] != "http" or limiter is None or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        cfg = extra["config"]
+        key = client_key(scope, cfg.rate_limit_header, cfg.rate_limit_trusted_hops)
+        delay = limiter.acquire(key)
+        if delay <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        src.metrics.PROM_RATE_LIMITED.inc()
+        response = JSONResponse(
+            status_code=429,
+            content={"message": "Too many requests"},
+            headers={"retry-after": str(math.ceil(delay))},
+        )
+        await response(scope, receive, send)
+
+
+class Bulkhead:
+    """Run at most `limit` calls concurrently and let at most `max_queue` wait.
+
+    Calls beyond that raise `Overloaded` right away. A `limit` of zero
+    disables the bulkhead.
+
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(max(limit, 1))
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot for the duration of the context.
+
+        Raise `Overloaded` if there is no free slot and the queue is full.
+
+        """
+        if self.limit <= 0:
+            yield
+            return
+
+        metric = src.metrics.PROM_K8S_ADMISSION
+        if self._sem.locked():
+            if self.waiting >= self.max_queue:
+                metric.labels("shed").inc()
+                raise Overloaded(f"{self.waiting} K8s calls are queued already")
+
+            metric.labels("queued").inc()
+            self.waiting += 1
+            src.metrics.PROM_K8S_QUEUED.inc()
+            try:
+                await self._sem.acquire()
+            finally:
+                self.waiting -= 1
+                src.metrics.PROM_K8S_QUEUED.dec()
+        else:
+            metric.labels("admitted").inc()
+            await self._sem.acquire()
+
+        try:
+            yield
+        finally:
+            self._sem.release()
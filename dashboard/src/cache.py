@@ -0,0 +1,110 @@
+"""Response cache for K8s API calls."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Set, Tuple
+
+import src.metrics
+
+# Convenience.
+logit = logging.getLogger("app")
+
+# The coroutine function that produces a fresh `(value, err)` tuple.
+Fetch = Callable[[], Awaitable[Tuple[Any, bool]]]
+
+
+class Entry(NamedTuple):
+    value: Any
+    created: float
+
+
+class ResponseCache:
+    """Cache `(value, err)` results with a TTL and LRU eviction.
+
+    Entries younger than `ttl` seconds are fresh and returned as is. Entries
+    that are older, but still younger than `ttl + stale_ttl`, are returned as
+    well but trigger a refresh in the background (stale-while-revalidate).
+    Callers only ever wait for K8s if there is no usable entry at all.
+
+    Errors are never cached. A `max_entries` of zero disables the cache.
+
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.clock = time.monotonic
+
+        self._entries: OrderedDict[Hashable, Entry] = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+    def peek(self, key: Hashable) -> Any:
+        """Return the value for `key` no matter its age, or `None`."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry.value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert `value` and evict the least recently used entries if necessary."""
+        self._entries[key] = Entry(value, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            src.metrics.PROM_K8S_CACHE.labels("evict").inc()
+
+    async def get(self, key: Hashable, fetch: Fetch) -> Tuple[Any, bool]:
+        """Return the cached value for `key` or produce it with `fetch`."""
+        if self.max_entries <= 0:
+            return await fetch()
+
+        metric = src.metrics.PROM_K8S_CACHE
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry.created
+            if age < self.ttl:
+                metric.labels("hit").inc()
+                self._entries.move_to_end(key)
+                return entry.value, False
+
+            if age < self.ttl + self.stale_ttl:
+                metric.labels("stale").inc()
+                self._entries.move_to_end(key)
+                self._revalidate(key, fetch)
+                return entry.value, False
+
+        metric.labels("miss").inc()
+        value, err = await fetch()
+        if not err:
+            self.put(key, value)
+        return value, err
+
+    def _revalidate(self, key: Hashable, fetch: Fetch) -> None:
+        """Refresh the entry for `key` in the background unless that is underway."""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                value, err = await fetch()
+                if not err:
+                    self.put(key, value)
+            except Exception:
+                logit.exception(f"Could not refresh cache entry <{key}>")
+            finally:
+                self._refreshing.discard(key)
+
+        # Retain a reference to the task until it has finished, lest it gets
+        # garbage collected.
+        task = asyncio.create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
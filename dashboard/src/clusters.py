@@ -0,0 +1,147 @@
+"""Query several K8s clusters in parallel.
+
+The clusters are the contexts of a kubeconfig style file. Every cluster has
+its own K8s session with its own connection pool, response cache and client,
+ie its own retries, circuit breaker and bulkhead. A slow or broken cluster can
+thus neither starve nor trip the others.
+
+"""
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import src.cache
+import src.k8s
+from src.models import ClusterConfig, Config
+
+# Convenience.
+logit = logging.getLogger("app")
+
+
+class Cluster:
+    """K8s session, response cache and client of one cluster.
+
+    `cfg` is the application `Config` with the URL, session and credentials
+    of this cluster.
+
+    """
+
+    def __init__(self, name: str, cfg: Config):
+        self.name = name
+        self.cfg = cfg
+        self.cache: src.cache.ResponseCache = src.k8s.create_cache(cfg)
+        self.client: src.k8s.Client = src.k8s.create_client(
+            cfg, src.k8s.create_bulkhead(cfg))
+
+    def start(self) -> None:
+        """Pick up rotated credentials in the background."""
+        self.cfg.k8s_credentials.start()
+
+    async def stop(self) -> None:
+        """Stop the credential reload and close the session."""
+        await self.cfg.k8s_credentials.stop()
+        await self.cfg.k8s_session.close()
+
+
+def load_kubeconfig(fname: Path) -> Tuple[List[ClusterConfig], bool]:
+    """Return one `ClusterConfig` for every context in the kubeconfig `fname`.
+
+    The clusters must reference their CA certificate with
+    `certificate-authority` and the users their token with `tokenFile`.
+    Relative paths are relative to the directory of `fname`, just like
+    `kubectl` would interpret them.
+
+    Inline credentials are not supported because they cannot be rotated.
+
+    """
+    # Only deployments with additional clusters pay for the YAML parser.
+    import yaml
+
+    base = fname.parent
+    try:
+        conf = yaml.safe_load(fname.read_text())
+        clusters = {_["name"]: _["cluster"] for _ in conf.get("clusters") or []}
+        users = {_["name"]: _["user"] for _ in conf.get("users") or []}
+
+        ret = []
+        for context in conf.get("contexts") or []:
+            name, ctx = context["name"], context["context"]
+            cluster, user = clusters[ctx["cluster"]], users[ctx["user"]]
+            if "certificate-authority" not in cluster or "tokenFile" not in user:
+                raise ValueError(f"context <{name}> must specify "
+                                 "`certificate-authority` and `tokenFile`")
+            ret.append(ClusterConfig(
+                name=name,
+                url=cluster["server"].rstrip("/"),
+                fname_token=base / user["tokenFile"],
+                fname_cert=base / cluster["certificate-authority"],
+            ))
+    except (OSError, yaml.YAMLError, AttributeError, KeyError, TypeError,
+            ValueError) as e:
+        logit.error(f"Invalid cluster file <{fname}>: {e!r}")
+        return [], True
+    return ret, False
+
+
+def create_clusters(cfg: Config) -> Tuple[Dict[str, Cluster], bool]:
+    """Return the clusters in `cfg.clusters_file` keyed by name.
+
+    All clusters share the settings in `cfg`, eg the connection pool size,
+    timeouts and cache TTLs.
+
+    """
+    if cfg.clusters_file is None:
+        return {}, False
+
+    specs, err = load_kubeconfig(cfg.clusters_file)
+    if err:
+        return {}, True
+
+    ret = {}
+    for spec in specs:
+        update = {"k8s_url": spec.url, "k8s_session": None, "k8s_credentials": None}
+        ccfg, err = src.k8s.create_session(
+            cfg.copy(update=update), spec.fname_token, spec.fname_cert)
+        if err:
+            logit.error(f"Cannot create a K8s session for cluster <{spec.name}>")
+            return {}, True
+        ret[spec.name] = Cluster(spec.name, ccfg)
+    return ret, False
+
+
+async def query_all(clusters: Dict[str, Cluster],
+                    query: Callable[[Cluster], Awaitable[Tuple[Any, bool]]],
+                    timeout: float) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Run `query` against all `clusters` concurrently.
+
+    Return the results of all clusters whose `query` succeeded within
+    `timeout` seconds, and the error reason for all other clusters, including
+    those whose `query` raised. A `timeout` of zero means no timeout.
+
+    Any K8s call that timed out keeps running in the background for the
+    benefit of the response cache, see `src.k8s.SingleFlight`.
+
+    """
+    async def run(cluster: Cluster) -> Tuple[Any, Optional[str]]:
+        try:
+            ret, err = await asyncio.wait_for(query(cluster), timeout or None)
+        except asyncio.TimeoutError:
+            logit.warning(f"Cluster <{cluster.name}> did not respond in {timeout}s")
+            return None, "timeout"
+        except Exception:
+            # One broken cluster must not fail the query for all others.
+            logit.exception(f"Could not query cluster <{cluster.name}>")
+            return None, "error"
+        return ret, "error" if err else None
+
+    names = list(clusters)
+    results = await asyncio.gather(*[run(clusters[_]) for _ in names])
+
+    data, errors = {}, {}
+    for name, (ret, reason) in zip(names, results):
+        if reason is None:
+            data[name] = ret
+        else:
+            errors[name] = reason
+    return data, errors
@@ -0,0 +1,81 @@
+"""Compile the application configuration from environment variables."""
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from src.models import Config
+
+# Convenience.
+logit = logging.getLogger("app")
+
+
+def load_config() -> Tuple[Optional[Config], bool]:
+    """Return the `Config` specified by the environment variables.
+
+    Return an error if any of the mandatory environment variables is missing
+    or any value is invalid.
+
+    """
+    env = os.environ
+    try:
+        cfg = Config(
+            # Placeholder. Will be populated during server startup.
+            k8s_session=None,
+
+            # K8s will automatically inject this into the Pod.
+            k8s_url="https://" + env["KUBERNETES_SERVICE_HOST"],
+
+            # Manifest must specify this environment variable explicitly.
+            k8s_creds_path=Path(env["K8S_CREDENTIALS_PATH"]),
+
+            # Optional.
+            k8s_json_decoder=env.get("K8S_JSON_DECODER", "auto"),
+            k8s_protobuf=env.get("K8S_PROTOBUF", "false"),  # type: ignore
+            k8s_cache_ttl=float(env.get("K8S_CACHE_TTL", "2")),
+            k8s_cache_stale_ttl=float(env.get("K8S_CACHE_STALE_TTL", "30")),
+            k8s_cache_size=int(env.get("K8S_CACHE_SIZE", "256")),
+            k8s_pool_size=int(env.get("K8S_POOL_SIZE", "100")),
+            k8s_pool_size_per_host=int(env.get("K8S_POOL_SIZE_PER_HOST", "0")),
+            k8s_keepalive_timeout=float(env.get("K8S_KEEPALIVE_TIMEOUT", "15")),
+            k8s_dns_cache_ttl=int(env.get("K8S_DNS_CACHE_TTL", "10")),
+            k8s_request_timeout=float(env.get("K8S_REQUEST_TIMEOUT", "60")),
+            k8s_connect_timeout=float(env.get("K8S_CONNECT_TIMEOUT", "5")),
+            k8s_read_timeout=float(env.get("K8S_READ_TIMEOUT", "30")),
+            shared_cache_dir=env.get("SHARED_CACHE_DIR") or None,  # type: ignore
+            snapshot_dir=env.get("SNAPSHOT_DIR") or None,  # type: ignore
+            snapshot_interval=float(env.get("SNAPSHOT_INTERVAL", "60")),
+            response_gzip_level=int(env.get("RESPONSE_GZIP_LEVEL", "6")),
+            response_brotli_level=int(env.get("RESPONSE_BROTLI_LEVEL", "4")),
+            response_compress_min_size=int(env.get("RESPONSE_COMPRESS_MIN_SIZE", "1024")),
+            stream_buffer_size=int(env.get("STREAM_BUFFER_SIZE", "1000")),
+            stream_keepalive=float(env.get("STREAM_KEEPALIVE", "15")),
+            k8s_list_concurrency=int(env.get("K8S_LIST_CONCURRENCY", "4")),
+            k8s_max_concurrency=int(env.get("K8S_MAX_CONCURRENCY", "50")),
+            k8s_max_queue=int(env.get("K8S_MAX_QUEUE", "200")),
+            k8s_retries=int(env.get("K8S_RETRIES", "3")),
+            k8s_retry_backoff=float(env.get("K8S_RETRY_BACKOFF", "0.1")),
+            k8s_retry_max_backoff=float(env.get("K8S_RETRY_MAX_BACKOFF", "5")),
+            k8s_breaker_threshold=int(env.get("K8S_BREAKER_THRESHOLD", "5")),
+            k8s_breaker_reset=float(env.get("K8S_BREAKER_RESET", "30")),
+            k8s_hedge_delay=float(env.get("K8S_HEDGE_DELAY", "0")),
+            k8s_creds_reload_interval=float(env.get("K8S_CREDS_RELOAD_INTERVAL", "10")),
+            ready_max_watch_lag=float(env.get("READY_MAX_WATCH_LAG", "180")),
+            ready_max_loop_lag=float(env.get("READY_MAX_LOOP_LAG", "1")),
+            ready_interval=float(env.get("READY_INTERVAL", "1")),
+            loop_monitor_interval=float(env.get("LOOP_MONITOR_INTERVAL", "0")),
+            loop_monitor_threshold=float(env.get("LOOP_MONITOR_THRESHOLD", "0.1")),
+            clusters_file=env.get("CLUSTERS_FILE") or None,  # type: ignore
+            clusters_timeout=float(env.get("CLUSTERS_TIMEOUT", "5")),
+            rate_limit=float(env.get("RATE_LIMIT", "0")),
+            rate_limit_burst=int(env.get("RATE_LIMIT_BURST", "20")),
+            rate_limit_header=env.get("RATE_LIMIT_HEADER") or None,
+            rate_limit_trusted_hops=int(env.get("RATE_LIMIT_TRUSTED_HOPS", "1")),
+        )
+    except KeyError as e:
+        logit.critical(f"Environment variable <{e.args[0]}> is undefined")
+        return None, True
+    except ValueError as e:
+        logit.critical(f"Invalid configuration: {e}")
+        return None, True
+    return cfg, False
@@ -0,0 +1,139 @@
+"""Decode K8s JSON responses with the fastest available library.
+
+Three backends are supported: `msgspec`, `orjson` and the `json` module of
+the standard library.
+
+Most callers only need the metadata of each item. The `*_metadata` functions
+therefore project every item onto the `META_FIELDS` of its `metadata` and
+discard everything else. The `msgspec` backend decodes straight into slim
+structs and never materialises the other fields in the first place.
+
+`loads_list_metadata` also accepts K8s protobuf documents, see `src.protobuf`.
+
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import msgspec
+import orjson
+
+import src.protobuf
+
+# Convenience.
+logit = logging.getLogger("app")
+
+# The `metadata` fields that survive the projection.
+META_FIELDS = ("name", "namespace", "uid", "resourceVersion", "labels")
+LIST_META_FIELDS = ("resourceVersion", "continue", "remainingItemCount")
+
+
+# Slim structs for the `msgspec` backend that only decode the `META_FIELDS`.
+class _ObjectMeta(msgspec.Struct, omit_defaults=True):
+    name: Optional[str] = None
+    namespace: Optional[str] = None
+    uid: Optional[str] = None
+    resourceVersion: Optional[str] = None
+    labels: Optional[Dict[str, str]] = None
+
+
+class _ListMeta(msgspec.Struct, omit_defaults=True, rename={"cont": "continue"}):
+    resourceVersion: Optional[str] = None
+    cont: Optional[str] = None
+    remainingItemCount: Optional[int] = None
+
+
+class _Object(msgspec.Struct):
+    metadata: _ObjectMeta = msgspec.field(default_factory=_ObjectMeta)
+
+
+class _List(msgspec.Struct):
+    metadata: _ListMeta = msgspec.field(default_factory=_ListMeta)
+    items: List[_Object] = []
+
+
+def available() -> List[str]:
+    """Return the names of all backends, fastest first."""
+    return ["msgspec", "orjson", "stdlib"]
+
+
+# The active backend.
+BACKEND = available()[0]
+
+
+def select(name: str) -> bool:
+    """Activate the backend `name`.
+
+    Use "auto" to pick the fastest installed backend.
+
+    """
+    global BACKEND
+
+    if name == "auto":
+        name = available()[0]
+    if name not in available():
+        logit.error(f"JSON decoder <{name}> is not available")
+        return True
+
+    BACKEND = name
+    logit.info(f"Using <{name}> to decode K8s responses")
+    return False
+
+
+def loads(body: bytes) -> Any:
+    """Fully decode the JSON document `body`."""
+    if BACKEND == "msgspec":
+        return msgspec.json.decode(body)
+    if BACKEND == "orjson":
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def project(obj: dict) -> dict:
+    """Return a copy of K8s manifest `obj` that only retains `META_FIELDS`."""
+    meta = obj["metadata"]
+    return {"metadata": {_: meta[_] for _ in META_FIELDS if _ in meta}}
+
+
+def loads_list_metadata(body: bytes) -> dict:
+    """Decode a K8s LIST response and project its items onto their metadata."""
+    # K8s replies with JSON if the resource does not support protobuf.
+    if src.protobuf.is_protobuf(body):
+        return src.protobuf.loads_list_metadata(body)
+    if BACKEND == "msgspec":
+        return msgspec.to_builtins(msgspec.json.decode(body, type=_List))
+
+    data = loads(body)
+    meta = data["metadata"]
+    return {
+        "metadata": {_: meta[_] for _ in LIST_META_FIELDS if _ in meta},
+        "items": [project(_) for _ in data["items"]],
+    }
+
+
+def loads_table(body: bytes) -> dict:
+    """Decode a K8s `Table` response into a LIST with projected items.
+
+    Return the list metadata, the names of the `columns` and one item per
+    row with its `cells` and the `metadata` projected onto `META_FIELDS`.
+    The rows must include their object, ie K8s must have been asked for
+    `includeObject=Metadata`.
+
+    Plain LIST responses, which K8s sends for resources that cannot be
+    printed as a table, yield items without cells.
+
+    """
+    data = loads(body)
+    meta = data["metadata"]
+    ret: Dict[str, Any] = {
+        "metadata": {_: meta[_] for _ in LIST_META_FIELDS if _ in meta},
+    }
+    if data.get("kind") != "Table":
+        ret["columns"] = []
+        ret["items"] = [dict(project(_), cells=[]) for _ in data["items"]]
+    else:
+        ret["columns"] = [_["name"] for _ in data["columnDefinitions"]]
+        ret["items"] = [
+            dict(project(_["object"]), cells=_["cells"]) for _ in data["rows"]
+        ]
+    return ret
@@ -1,2 +1,5 @@
+import src.endpoints.clusters
 import src.endpoints.healthz
+import src.endpoints.k8s_namespace_events
 import src.endpoints.k8s_namespaces
+import src.endpoints.k8s_resources
@@ -0,0 +1,63 @@
+from typing import Optional
+
+from fastapi import Request
+
+import src.clusters
+import src.k8s
+import src.server
+from src.models import ClusterNamespaces, ClusterResources
+
+FASTAPI_APP = src.server.FASTAPI_APP
+
+
+@FASTAPI_APP.get("/clusters")
+async def get_clusters(request: Request):
+    """Return the names of all configured clusters."""
+    return {"clusters": sorted(request.app.extra.get("clusters", {}))}
+
+
+@FASTAPI_APP.get("/clusters/k8s-namespaces", response_model=ClusterNamespaces)
+async def get_cluster_namespaces(request: Request):
+    """Return the namespaces of all clusters.
+
+    Clusters that fail or do not respond within the configured timeout are
+    listed in `errors` instead.
+
+    """
+    cfg = request.app.extra["config"]
+
+    async def query(cluster: src.clusters.Cluster):
+        ccfg = cluster.cfg
+        ret, err = await src.k8s.get_namespaces(
+            ccfg.k8s_session, ccfg.k8s_url, cache=cluster.cache, client=cluster.client)
+        return ret.namespaces, err
+
+    data, errors = await src.clusters.query_all(
+        request.app.extra.get("clusters", {}), query, cfg.clusters_timeout)
+    return ClusterNamespaces(clusters=data, errors=errors)
+
+
+@FASTAPI_APP.get("/clusters/k8s-resources", response_model=ClusterResources)
+async def get_cluster_resources(request: Request,
+                                kinds: str = "namespaces,services,deployments",
+                                namespace: Optional[str] = None):
+    """Return several Kubernetes resource kinds from all clusters.
+
+    See `/k8s-resources` for `kinds` and `namespace`. Clusters that provided
+    none of the `kinds` or did not respond within the configured timeout are
+    listed in `errors` instead.
+
+    """
+    cfg = request.app.extra["config"]
+    names = [_.strip() for _ in kinds.split(",") if _.strip()]
+
+    async def query(cluster: src.clusters.Cluster):
+        ccfg = cluster.cfg
+        ret = await src.k8s.get_resources(
+            ccfg.k8s_session, ccfg.k8s_url, names, namespace,
+            cfg.k8s_list_concurrency, cache=cluster.cache, client=cluster.client)
+        return ret, bool(ret.errors and not ret.resources)
+
+    data, errors = await src.clusters.query_all(
+        request.app.extra.get("clusters", {}), query, cfg.clusters_timeout)
+    return ClusterResources(clusters=data, errors=errors)
@@ -1,9 +1,37 @@
+from fastapi import Request
+from fastapi.responses import Response
+
 import src.server
+from src.models import Readiness
 
 FASTAPI_APP = src.server.FASTAPI_APP
 
+# Readiness before the server has started the health monitor.
+NOT_STARTED = Readiness(
+    ready=False, synced=False, watch_lag=None, loop_lag=0, breaker_open=False,
+    reasons=["not started"],
+)
+
 
 @FASTAPI_APP.get("/healthz")
 async def get_healthz():
-    """Kubernetes health check endpoint."""
+    """Kubernetes liveness check endpoint."""
     return ""
+
+
+@FASTAPI_APP.get("/readyz", response_model=Readiness)
+async def get_readyz(request: Request, response: Response):
+    """Kubernetes readiness check endpoint.
+
+    Return the latest assessment of the `src.health.HealthMonitor`, ie only
+    report ready once the informer has loaded all namespaces, keeps hearing
+    from K8s and the event loop is responsive.
+
+    """
+    monitor = request.app.extra.get("health")
+    if monitor is None:
+        response.status_code = 503
+        return NOT_STARTED
+
+    response.status_code = 200 if monitor.status.ready else 503
+    return monitor.status
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import TYPE_CHECKING, AsyncGenerator, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+import src.server
+from src.informer import Informer, Subscription
+
+# Only imported on demand at runtime, see `src.server.startup_event`.
+if TYPE_CHECKING:  # codecov-skip
+    from src.shared import SharedInformer
+
+FASTAPI_APP = src.server.FASTAPI_APP
+
+
+def sse(event: str, data: dict) -> str:
+    """Return a single server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(informer: Union[Informer, "SharedInformer"], maxsize: int,
+                       keepalive: float) -> AsyncGenerator[str, None]:
+    """Yield server-sent events with the changes to the namespaces.
+
+    The stream starts with a snapshot of all namespaces, followed by "added"
+    and "deleted" events. It repeats the snapshot whenever the client was too
+    slow to keep up and its subscription, which buffers at most `maxsize`
+    events, overflowed.
+
+    The subscription only exists while the stream runs. A response that is
+    never sent, eg because the client disconnected first, must not leak it.
+
+    """
+    sub: Optional[Subscription] = None
+    try:
+        sub = informer.subscribe(maxsize)
+        yield sse("snapshot", {"namespaces": informer.names()})
+        while True:
+            # Send a comment if nothing happened to keep proxies from closing
+            # the idle connection.
+            try:
+                events = await asyncio.wait_for(sub.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if events is None:
+                yield sse("snapshot", {"namespaces": informer.names()})
+            else:
+                yield "".join(sse(_.lower(), {"name": name}) for _, name in events)
+    finally:
+        if sub is not None:
+            informer.unsubscribe(sub)
+
+
+@FASTAPI_APP.get("/k8s-namespaces/events")
+async def get_k8s_namespace_events(request: Request):
+    """Stream namespace changes as server-sent events.
+
+    Return "503 Service Unavailable" until the informer has synced, rather
+    than hold the connection for as long as K8s is unavailable.
+
+    """
+    cfg = request.app.extra["config"]
+    informer = request.app.extra.get("informer")
+    if informer is None or not informer.synced.is_set():
+        return Response(status_code=503, headers={"retry-after": "1"})
+
+    return StreamingResponse(
+        event_stream(informer, cfg.stream_buffer_size, cfg.stream_keepalive),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
@@ -1,18 +1,75 @@
-from fastapi import Request
+from typing import Any, Dict, List, Optional
+
+from fastapi import Query, Request
 from fastapi.responses import Response
 
+import src.informer
 import src.k8s
+import src.responses
 import src.server
-from src.models import K8sNamespaces
+from src.models import Config, K8sNamespaces
 
 FASTAPI_APP = src.server.FASTAPI_APP
 
+# Encoded response for the current informer data.
+ENCODED = src.responses.EncodedCache()
+
+
+def encode(cfg: Config, content: Any) -> src.responses.Encoded:
+    """Return the encoded `content` compressed as specified in `cfg`."""
+    return src.responses.encode(
+        content, cfg.response_gzip_level, cfg.response_brotli_level,
+        cfg.response_compress_min_size,
+    )
+
 
 @FASTAPI_APP.get("/k8s-namespaces", response_model=K8sNamespaces)
-async def get_k8s_namespaces(request: Request, response: Response):
-    """Return Kubernetes namespaces."""
+async def get_k8s_namespaces(
+    request: Request,
+    response: Response,
+    prefix: str = "",
+    limit: int = Query(0, ge=0),
+    cont: str = Query("", alias="continue"),
+    label_selector: Optional[str] = Query(None, alias="labelSelector"),
+    field_selector: Optional[str] = Query(None, alias="fieldSelector"),
+):
+    """Return Kubernetes namespaces.
+
+    K8s applies the `labelSelector` and `fieldSelector`. Afterwards, only
+    return the names that start with `prefix`. If `limit` is set then return
+    at most that many names together with a `continue` token for the next page.
+
+    """
     cfg = request.app.extra["config"]
+    paged = bool(prefix or limit or cont)
+
+    # Serve the namespaces from memory if the informer has synced already,
+    # unless K8s must filter them for us.
+    names: List[str]
+    informer = request.app.extra.get("informer")
+    selected = bool(label_selector or field_selector)
+    if not selected and informer is not None and informer.synced.is_set():
+        # The full response is only encoded once per informer version.
+        if not paged:
+            enc = ENCODED.get(
+                (id(informer), informer.version),
+                lambda: encode(cfg, {"namespaces": informer.names()}),
+            )
+            return src.responses.respond(request, enc)
+        names = informer.names()
+    else:
+        ret, err = await src.k8s.get_namespaces(
+            cfg.k8s_session, cfg.k8s_url, label_selector, field_selector)
+        if err or not paged:
+            response.status_code = 422 if err else 200
+            return ret
+        names = sorted(ret.namespaces)
+
+    page, token = src.informer.search(names, prefix, cont, limit)
+    content: Dict[str, Any] = {"namespaces": page}
+    if limit > 0:
+        content["continue"] = token
 
-    ret, err = await src.k8s.get_namespaces(cfg.k8s_session, cfg.k8s_url)
-    response.status_code = 422 if err else 200
-    return ret
+    # Pages are encoded afresh for every request, so only compress them with
+    # the coding the client accepts, see `src.responses.CompressMiddleware`.
+    return src.responses.respond(request, src.responses.encode(content))
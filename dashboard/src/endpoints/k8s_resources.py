@@ -0,0 +1,55 @@
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+import src.k8s
+import src.responses
+import src.server
+from src.models import K8sResources
+
+FASTAPI_APP = src.server.FASTAPI_APP
+
+# Encoded response for the latest resources of every combination of kinds and
+# namespace, but only for the most recent `MAX_ENCODED` combinations.
+MAX_ENCODED = 64
+ENCODED: Dict[Tuple[Tuple[str, ...], Optional[str]], src.responses.EncodedCache] = {}
+
+
+@FASTAPI_APP.get("/k8s-resources", response_model=K8sResources)
+async def get_k8s_resources(request: Request, response: Response,
+                            kinds: str = "namespaces,services,deployments",
+                            namespace: Optional[str] = None):
+    """Return several Kubernetes resource kinds in a single response.
+
+    `kinds` is a comma separated list of resource kinds and `namespace`
+    optionally restricts the namespaced kinds to that namespace.
+
+    """
+    cfg = request.app.extra["config"]
+    names = [_.strip() for _ in kinds.split(",") if _.strip()]
+    ret = await src.k8s.get_resources(
+        cfg.k8s_session, cfg.k8s_url, names, namespace, cfg.k8s_list_concurrency)
+
+    # Partial results are still useful, but fail if we have nothing at all.
+    if ret.errors and not ret.resources:
+        response.status_code = 422
+        return ret
+
+    # The object lists come straight from the response cache, ie they remain
+    # the same objects until they expire. Only encode them again after that.
+    # Compare the lists by identity because comparing their objects by value
+    # would cost about as much as encoding them again.
+    slot_key = (tuple(names), namespace)
+    slot = ENCODED.pop(slot_key, None) or src.responses.EncodedCache()
+    ENCODED[slot_key] = slot
+    if len(ENCODED) > MAX_ENCODED:
+        del ENCODED[next(iter(ENCODED))]
+
+    key = (tuple((kind, id(objs)) for kind, objs in ret.resources.items()),
+           tuple(ret.errors))
+    enc = slot.get(key, lambda: src.responses.encode(
+        ret.dict(), cfg.response_gzip_level, cfg.response_brotli_level,
+        cfg.response_compress_min_size,
+    ), refs=ret.resources)
+    return src.responses.respond(request, enc)
@@ -0,0 +1,85 @@
+"""Assess the readiness of this worker in the background."""
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+import src.k8s
+from src.models import Config, Readiness
+
+# Convenience.
+logit = logging.getLogger("app")
+
+
+class HealthMonitor:
+    """Periodically assess whether this worker should receive traffic.
+
+    The worker is ready once `informer` has synced, as long as it keeps hearing
+    from K8s and the event loop is responsive. The monitor measures the loop
+    lag as the delay of its own periodic wake up.
+
+    Readiness probes only return the latest `status`, ie they cost nothing
+    regardless of how often K8s sends them.
+
+    """
+
+    def __init__(self, informer: Any, cfg: Config):
+        self.informer = informer
+        self.interval = cfg.ready_interval
+        self.max_watch_lag = cfg.ready_max_watch_lag
+        self.max_loop_lag = cfg.ready_max_loop_lag
+        self.clock = time.monotonic
+
+        self.status = Readiness(
+            ready=False, synced=False, watch_lag=None, loop_lag=0,
+            breaker_open=False, reasons=["not started"],
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def check(self, loop_lag: float) -> Readiness:
+        """Update and return the `status` for the measured `loop_lag`."""
+        synced = self.informer.synced.is_set()
+        watch_lag = self.clock() - self.informer.heartbeat if synced else None
+
+        reasons = []
+        if watch_lag is None:
+            reasons.append("informer has not synced")
+        elif 0 < self.max_watch_lag < watch_lag:
+            reasons.append(f"no news from K8s for {watch_lag:.1f}s")
+        if 0 < self.max_loop_lag < loop_lag:
+            reasons.append(f"event loop lags by {loop_lag:.3f}s")
+
+        # Log the transitions only.
+        ready = not reasons
+        if ready != self.status.ready:
+            if ready:
+                logit.info("Worker is ready")
+            else:
+                logit.warning(f"Worker is not ready: {', '.join(reasons)}")
+
+        # The circuit breaker only guards the K8s calls that bypass the
+        # informer and is for information only.
+        self.status = Readiness(
+            ready=ready, synced=synced, watch_lag=watch_lag, loop_lag=loop_lag,
+            breaker_open=src.k8s.CLIENT.breaker.is_open, reasons=reasons,
+        )
+        return self.status
+
+    async def run(self) -> None:
+        """Periodically call `check` until cancelled."""
+        while True:
+            start = self.clock()
+            await asyncio.sleep(self.interval)
+            self.check(max(0.0, self.clock() - start - self.interval))
+
+    def start(self) -> None:
+        """Assess the readiness now and then periodically in the background."""
+        self.check(0.0)
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
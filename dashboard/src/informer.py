@@ -0,0 +1,353 @@
+"""Keep an in-memory copy of a K8s resource collection current."""
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from typing import (
+    AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple,
+)
+
+import aiohttp
+
+import src.admission
+import src.decoders
+import src.k8s
+import src.metrics
+import src.protobuf
+
+# Convenience.
+logit = logging.getLogger("app")
+
+# Minimum pause in seconds before we re-establish a WATCH stream.
+MIN_WATCH_DELAY = 0.1
+
+
+async def iter_lines(resp) -> AsyncIterator[bytes]:
+    """Yield the non-empty lines of a streaming `aiohttp` response.
+
+    Unlike `resp.content.readline` this imposes no limit on the line length,
+    which matters because each line of a K8s watch stream contains an entire
+    manifest.
+
+    """
+    buf = b""
+    async for chunk in resp.content.iter_any():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buf.strip():
+        yield buf
+
+
+def search(names: List[str], prefix: str = "", after: str = "",
+           limit: int = 0) -> Tuple[List[str], str]:
+    """Return a page of the sorted `names` that start with `prefix`.
+
+    The page starts with the first name that sorts after `after` and contains
+    at most `limit` names (zero means no limit). Also return the continue
+    token for the next page, ie the last name of this page, or an empty string
+    if there are no more names.
+
+    Both ends of the page are found with a binary search.
+
+    """
+    start = bisect.bisect_left(names, prefix)
+    if after:
+        start = max(start, bisect.bisect_right(names, after))
+
+    # All names with `prefix` sort before the prefix with its last character
+    # incremented.
+    if prefix:
+        stop = bisect.bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    else:
+        stop = len(names)
+
+    end = stop if limit <= 0 else min(stop, start + limit)
+    page = names[start:end]
+    return page, page[-1] if page and end < stop else ""
+
+
+class Subscription:
+    """Bounded buffer of `(type, name)` change events for a single consumer.
+
+    The buffer never holds more than `maxsize` events. If the consumer falls
+    that far behind then the subscription discards all buffered events and
+    flags an overflow instead, ie the consumer must fetch a full snapshot.
+
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.events: Deque[Tuple[str, str]] = deque()
+        self.overflow = False
+        self._ready = asyncio.Event()
+
+    def push(self, event: Tuple[str, str]) -> None:
+        """Buffer `event` unless the subscription has already overflowed."""
+        if self.overflow:
+            return
+        if len(self.events) >= self.maxsize:
+            self.overflow = True
+            self.events.clear()
+            src.metrics.PROM_STREAM_OVERFLOWS.inc()
+        else:
+            self.events.append(event)
+        self._ready.set()
+
+    async def get(self) -> Optional[List[Tuple[str, str]]]:
+        """Wait for and return all buffered events.
+
+        Return `None` if the subscription overflowed since the last call.
+
+        """
+        await self._ready.wait()
+        self._ready.clear()
+        if self.overflow:
+            self.overflow = False
+            return None
+
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+
+class Broadcaster:
+    """Fan out `(type, name)` change events to all subscribers."""
+
+    def __init__(self):
+        self.subscribers: Set[Subscription] = set()
+
+    def subscribe(self, maxsize: int) -> Subscription:
+        """Return a new subscription that buffers at most `maxsize` events."""
+        sub = Subscription(maxsize)
+        self.subscribers.add(sub)
+        src.metrics.PROM_STREAM_CLIENTS.inc()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        """Remove `sub`."""
+        if sub in self.subscribers:
+            self.subscribers.discard(sub)
+            src.metrics.PROM_STREAM_CLIENTS.dec()
+
+    def broadcast(self, etype: str, name: str) -> None:
+        """Send the event to all subscribers."""
+        for sub in self.subscribers:
+            sub.push((etype, name))
+
+    def broadcast_diff(self, old: Iterable[str], new: Iterable[str]) -> None:
+        """Send ADDED/DELETED events for the difference between `old` and `new`."""
+        if not self.subscribers:
+            return
+        old, new = set(old), set(new)
+        for name in sorted(new - old):
+            self.broadcast("ADDED", name)
+        for name in sorted(old - new):
+            self.broadcast("DELETED", name)
+
+
+class Informer(Broadcaster):
+    """Mirror a K8s resource collection in memory.
+
+    The informer LISTs the collection once and then follows a WATCH stream
+    from the `resourceVersion` of that LIST to apply all subsequent changes.
+    It will only LIST again if K8s reports that our resource version is too old
+    (410 Gone). An informer that was already populated before it started,
+    eg from a `src.snapshot`, skips the initial LIST as well.
+
+    If `metadata_only` is set then the informer only retains the fields listed
+    in `src.decoders.META_FIELDS` of each manifest. It then asks K8s to send
+    `PartialObjectMetadata` for the LIST and the WATCH alike, as protobuf if
+    `src.k8s.CLIENT` was configured to.
+
+    Subscribers receive an ADDED or DELETED event whenever a resource appears
+    or disappears.
+
+    """
+
+    def __init__(self, sess, k8s_url: str, path: str, metadata_only: bool = False,
+                 watch_timeout: int = 300, retry_delay: float = 1.0):
+        super().__init__()
+        self.sess = sess
+        self.url = k8s_url + path
+        self.metadata_only = metadata_only
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+
+        # All manifests keyed by name and the resource version they reflect.
+        self.items: Dict[str, dict] = {}
+        self.resource_version = ""
+
+        # Set once the initial LIST has completed.
+        self.synced = asyncio.Event()
+
+        # Incremented whenever `items` changes.
+        self.version = 0
+
+        # Monotonic time when K8s last sent us a LIST, a watch event or a
+        # bookmark, ie until when `items` was definitely up to date.
+        self.heartbeat = 0.0
+
+        self._names: Optional[List[str]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def names(self) -> List[str]:
+        """Return the sorted names of all resources."""
+        # The sorted list is cached until the next change.
+        if self._names is None:
+            self._names = sorted(self.items)
+        return self._names
+
+    def apply(self, etype: str, obj: dict) -> None:
+        """Update the local state with a single watch event."""
+        meta = obj["metadata"]
+        self.resource_version = meta["resourceVersion"]
+
+        # Bookmarks only advance the resource version.
+        if etype == "BOOKMARK":
+            return
+
+        name = meta["name"]
+        if etype == "DELETED":
+            if self.items.pop(name, None) is not None:
+                self.broadcast("DELETED", name)
+        else:
+            if name not in self.items:
+                self.broadcast("ADDED", name)
+            self.items[name] = obj
+        self._names = None
+        self.version += 1
+
+    async def relist(self) -> bool:
+        """Replace the local state with a fresh LIST from K8s."""
+        # Assemble the new state page by page and only replace the current one
+        # once the LIST has completed.
+        items, resource_version = {}, ""
+        try:
+            projection = "metadata" if self.metadata_only else None
+            pages = src.k8s.list_pages(self.sess, self.url, projection=projection)
+            async for page in pages:
+                resource_version = resource_version or page["metadata"]["resourceVersion"]
+                items.update({_["metadata"]["name"]: _ for _ in page["items"]})
+        except src.k8s.K8sError as e:
+            logit.error(str(e))
+            return True
+        except src.admission.Overloaded as e:
+            logit.warning(f"Cannot LIST <{self.url}>: {e}")
+            return True
+
+        self.broadcast_diff(self.items, items)
+        self.items = items
+        self.resource_version = resource_version
+        self._names = None
+        self.version += 1
+        self.heartbeat = time.monotonic()
+        self.synced.set()
+        return False
+
+    async def watch(self) -> bool:
+        """Apply all events from one WATCH stream.
+
+        Return `True` if our resource version has expired and the caller must
+        LIST again.
+
+        """
+        params = {
+            "watch": "1",
+            "resourceVersion": self.resource_version,
+            "allowWatchBookmarks": "true",
+            "timeoutSeconds": str(self.watch_timeout),
+        }
+
+        # K8s will close the stream after `timeoutSeconds`. The client side
+        # timeout only guards against a silently dead connection.
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.watch_timeout + 30)
+
+        # We can only decode the metadata of protobuf events. List the media
+        # types in order of preference, like `src.k8s.list_pages` does.
+        headers = None
+        if self.metadata_only:
+            projection = src.k8s.WATCH_PROJECTIONS["metadata"]
+            accept = ["application/json" + projection, "application/json"]
+            if src.k8s.CLIENT.protobuf:
+                accept.insert(0, src.protobuf.CONTENT_TYPE + projection)
+            headers = {"accept": ", ".join(accept)}
+
+        async with self.sess.get(self.url, params=params, headers=headers,
+                                 timeout=timeout) as resp:
+            relist, ok = await self.follow(resp)
+
+        # Back off only after the connection went back to the pool. Pause
+        # briefly even after a clean end, lest we spin if K8s keeps closing
+        # the stream right away.
+        await asyncio.sleep(max(0 if ok else self.retry_delay, MIN_WATCH_DELAY))
+        return relist
+
+    async def follow(self, resp) -> Tuple[bool, bool]:
+        """Apply all events of the WATCH response `resp`.
+
+        Return whether the caller must LIST again and whether the stream
+        ended without an error.
+
+        """
+        if resp.status == 410:
+            return True, True
+        if resp.status != 200:
+            logit.error(f"Kubernetes responded with {resp.status} from <{self.url}>")
+            return False, False
+        self.heartbeat = time.monotonic()
+
+        # K8s streams JSON if the resource does not support protobuf.
+        if resp.content_type == src.protobuf.CONTENT_TYPE:
+            events = (src.protobuf.loads_watch_event(_)
+                      async for _ in src.protobuf.iter_frames(resp))
+        else:
+            events = (src.decoders.loads(_) async for _ in iter_lines(resp))
+
+        async for event in events:
+            self.heartbeat = time.monotonic()
+            if event["type"] == "ERROR":
+                # K8s reports an expired resource version as an in-band
+                # `Status` object if the stream was already established.
+                status = event["object"]
+                if status.get("code") == 410:
+                    return True, True
+                logit.error(f"Watch error from <{self.url}>: {status.get('message')}")
+                return False, False
+            obj = event["object"]
+            if self.metadata_only:
+                obj = src.decoders.project(obj)
+            self.apply(event["type"], obj)
+        return False, True
+
+    async def run(self) -> None:
+        """LIST and WATCH the collection until cancelled."""
+        relist = not self.synced.is_set()
+        while True:
+            try:
+                if relist:
+                    relist = await self.relist()
+                    if relist:
+                        await asyncio.sleep(self.retry_delay)
+                        continue
+                relist = await self.watch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logit.exception(f"Informer for <{self.url}> failed")
+                await asyncio.sleep(self.retry_delay)
+
+    def start(self) -> None:
+        """Run the informer in a background task."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.wait([self._task])
+        self._task = None
@@ -1,57 +1,782 @@
+import asyncio
 import logging
 import os
+import random
 import ssl
+import time
+import urllib.parse
 from pathlib import Path
-from typing import Tuple
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, NamedTuple,
+    Optional, Tuple,
+)
 
 import aiohttp
 
-from src.models import Config, K8sNamespaces
+import src.admission
+import src.cache
+import src.decoders
+import src.metrics
+import src.protobuf
+from src.models import Config, K8sNamespaces, K8sObject, K8sResources
 
 # Convenience.
 logit = logging.getLogger("app")
 
+# Default number of items per LIST chunk.
+LIST_LIMIT = 500
 
-def create_session(cfg: Config) -> Tuple[Config, bool]:
-    """Add a K8s session to the `cfg` model."""
-    # Construct the path to the certificate and token.
-    fname_cert = cfg.k8s_creds_path / "ca.crt"
-    fname_token = cfg.k8s_creds_path / "token"
-    if not (fname_cert.exists() and fname_token.exists()):
-        logit.error(f"Cannot read K8s token and secret from <{cfg.k8s_creds_path}>")
+# Media type parameters that make K8s project a LIST response before it sends
+# it, see `list_pages`.
+PROJECTIONS = {
+    "metadata": ";as=PartialObjectMetadataList;g=meta.k8s.io;v=v1",
+    "table": ";as=Table;g=meta.k8s.io;v=v1",
+}
+
+# Same for the objects of WATCH events, see `src.informer.Informer`.
+WATCH_PROJECTIONS = {
+    "metadata": ";as=PartialObjectMetadata;g=meta.k8s.io;v=v1",
+}
+
+# API prefix of the supported resource kinds and whether they are namespaced.
+RESOURCES = {
+    "namespaces": ("/api/v1", False),
+    "services": ("/api/v1", True),
+    "deployments": ("/apis/apps/v1", True),
+}
+
+
+class K8sError(Exception):
+    """K8s API responded with an unexpected HTTP status."""
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f"Kubernetes responded with {status} from <{url}>")
+        self.url = url
+        self.status = status
+
+
+class CircuitOpenError(K8sError):
+    """The circuit breaker rejected a K8s call without issuing it."""
+
+    def __init__(self, url: str):
+        super().__init__(url, 503)
+        self.args = (f"Circuit breaker is open, not calling <{url}>",)
+
+
+class CircuitBreaker:
+    """Stop calling K8s after `threshold` consecutive failures.
+
+    The breaker then stays open for `reset_timeout` seconds and rejects all
+    calls. Afterwards it lets a single trial call through (half open) and
+    closes again if that succeeds. A `threshold` of zero disables it.
+
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = time.monotonic
+
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        """Return `True` unless the breaker is closed."""
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Return `True` if the caller may issue its K8s call."""
+        if self.opened_at is None:
+            return True
+        if self._trial or self.clock() - self.opened_at < self.reset_timeout:
+            src.metrics.PROM_K8S_BREAKER.labels("reject").inc()
+            return False
+        self._trial = True
+        return True
+
+    def abort(self) -> None:
+        """Let the next call probe again if the current probe never finished."""
+        self._trial = False
+
+    def record(self, ok: bool) -> None:
+        """Update the breaker with the outcome of a call it allowed."""
+        metric = src.metrics.PROM_K8S_BREAKER
+        if ok:
+            if self.opened_at is not None:
+                logit.info("Circuit breaker closed")
+                metric.labels("close").inc()
+            self.failures, self.opened_at, self._trial = 0, None, False
+            return
+
+        self.failures += 1
+        tripped = 0 < self.threshold <= self.failures
+        if self._trial or (self.opened_at is None and tripped):
+            logit.warning(f"Circuit breaker open after {self.failures} failures")
+            metric.labels("open").inc()
+            self.opened_at, self._trial = self.clock(), False
+
+
+class Reply(NamedTuple):
+    """Status, body and `Retry-After` delay of a K8s response."""
+    status: int
+    body: bytes
+    retry_after: Optional[float]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the delay in seconds of a `Retry-After` header, if any.
+
+    Only the delay-seconds form is supported, not HTTP dates.
+
+    """
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Client:
+    """Issue K8s GET requests with retries, a circuit breaker and hedging.
+
+    Retry connection errors, timeouts and the statuses in `RETRY_STATUS` up to
+    `retries` times with full jitter exponential backoff, but wait at least as
+    long as a `Retry-After` header demands. Give up immediately if it demands
+    more than `max_backoff`.
+
+    Calls that still fail count towards the circuit breaker.
+
+    Every attempt occupies a slot of `bulkhead`, or of the module wide
+    `BULKHEAD` if there is none, until it returns. The backoff between
+    attempts does not.
+
+    If `hedge_delay` is positive then issue a second, identical request if
+    the first one has not completed after that many seconds and use whichever
+    completes first.
+
+    If `protobuf` is set then callers that only need the metadata of the
+    items ask K8s for protobuf instead of JSON, see `src.protobuf`.
+
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, retries: int = 0, backoff: float = 0.1, max_backoff: float = 5,
+                 breaker_threshold: int = 0, breaker_reset: float = 30,
+                 hedge_delay: float = 0, protobuf: bool = False,
+                 bulkhead: Optional[src.admission.Bulkhead] = None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_delay = hedge_delay
+        self.protobuf = protobuf
+        self.bulkhead = bulkhead
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
+    async def get(self, sess, url: str, params: Optional[Dict[str, str]] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        """Return status and body of the GET request for `url`.
+
+        Raise `CircuitOpenError` if the circuit breaker is open,
+        `src.admission.Overloaded` if too many calls are queued already, or
+        the last connection error if all attempts failed with one.
+
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(url)
+
+        # A probe that neither succeeds nor fails, eg because it was
+        # cancelled or shed, must not leave the breaker half open forever.
+        probe = self.breaker.is_open
+        try:
+            return await self._get(sess, url, params, headers)
+        finally:
+            if probe:
+                self.breaker.abort()
+
+    async def _get(self, sess, url: str, params: Optional[Dict[str, str]],
+                   headers: Optional[Dict[str, str]]) -> Tuple[int, bytes]:
+        """Return status and body of the GET request for `url`, see `get`."""
+        bulkhead = BULKHEAD if self.bulkhead is None else self.bulkhead
+        attempt = 0
+        while True:
+            error: Optional[Exception] = None
+            try:
+                async with bulkhead.slot():
+                    reply = await self._hedged(sess, url, params, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error, reply = e, Reply(0, b"", None)
+            else:
+                if reply.status not in self.RETRY_STATUS:
+                    self.breaker.record(True)
+                    return reply.status, reply.body
+
+            # Full jitter backoff, but never retry earlier than K8s asked us to.
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if reply.retry_after is not None:
+                if reply.retry_after > self.max_backoff:
+                    break
+                delay = max(delay, reply.retry_after)
+            if attempt == self.retries:
+                break
+
+            reason = "error" if error else str(reply.status)
+            logit.warning(f"Retrying <{url}> in {delay:.2f}s after {reason}")
+            src.metrics.PROM_K8S_RETRIES.labels(reason).inc()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        self.breaker.record(False)
+        if error is not None:
+            raise error
+        return reply.status, reply.body
+
+    async def _attempt(self, sess, url: str, params: Optional[Dict[str, str]],
+                       headers: Optional[Dict[str, str]]) -> Reply:
+        """Return the response of a single GET request."""
+        # Time the K8s round trip separately from our own processing.
+        start = time.perf_counter()
+        async with sess.get(url, params=params, headers=headers) as resp:
+            body = await resp.read()
+        src.metrics.PROM_K8S_REQUEST_TIME.labels(resp.status).observe(
+            time.perf_counter() - start)
+        src.metrics.PROM_K8S_RESPONSE_SIZE.observe(len(body))
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        return Reply(resp.status, body, retry_after)
+
+    async def _hedged(self, sess, url: str, params: Optional[Dict[str, str]],
+                      headers: Optional[Dict[str, str]]) -> Reply:
+        """Return the first response of up to two identical GET requests."""
+        first = asyncio.ensure_future(self._attempt(sess, url, params, headers))
+        tasks = [first]
+        try:
+            if self.hedge_delay <= 0:
+                return await first
+
+            done, pending = await asyncio.wait([first], timeout=self.hedge_delay)
+            if done:
+                return first.result()
+
+            metric = src.metrics.PROM_K8S_HEDGES
+            metric.labels("issued").inc()
+            second = asyncio.ensure_future(self._attempt(sess, url, params, headers))
+            tasks.append(second)
+
+            # Use the first request that succeeds, or raise the error of the
+            # one that failed last.
+            pending = {first, second}
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            metric.labels("won").inc()
+                        return task.result()
+                if not pending:
+                    return task.result()
+        finally:
+            # Never leave a request behind, not even if our caller was
+            # cancelled, or its connection would not return to the pool.
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into a single one.
+
+    All callers that ask for the same `key` while a call for it is in flight
+    will await and share the result of that call instead of issuing their own.
+
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of `func()` or of the in-flight call for `key`."""
+        metric = src.metrics.PROM_K8S_CALLS
+        fut = self._inflight.get(key)
+        if fut is None:
+            metric.labels("issued").inc()
+            fut = asyncio.ensure_future(func())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metric.labels("coalesced").inc()
+
+        # Shield the call so that a cancelled caller does not cancel the call
+        # for everyone else.
+        return await asyncio.shield(fut)
+
+
+# Coalesce identical K8s calls across the entire application.
+SINGLE_FLIGHT = SingleFlight()
+
+# Cache for K8s responses keyed by URL. It is disabled until `configure` sets
+# it up according to the `Config`.
+RESPONSE_CACHE = src.cache.ResponseCache(ttl=0, stale_ttl=0, max_entries=0)
+
+# Issue all K8s LIST requests. It neither retries nor hedges until `configure`
+# sets it up according to the `Config`.
+CLIENT = Client()
+
+# Limit the concurrent K8s calls to the cluster the app runs in. It admits all
+# calls until `configure` sets it up according to the `Config`.
+BULKHEAD = src.admission.Bulkhead(limit=0, max_queue=0)
+
+
+def create_cache(cfg: Config) -> src.cache.ResponseCache:
+    """Return a K8s response cache as specified in `cfg`."""
+    return src.cache.ResponseCache(
+        ttl=cfg.k8s_cache_ttl,
+        stale_ttl=cfg.k8s_cache_stale_ttl,
+        max_entries=cfg.k8s_cache_size,
+    )
+
+
+def create_bulkhead(cfg: Config) -> src.admission.Bulkhead:
+    """Return a K8s bulkhead as specified in `cfg`."""
+    return src.admission.Bulkhead(cfg.k8s_max_concurrency, cfg.k8s_max_queue)
+
+
+def create_client(cfg: Config,
+                  bulkhead: Optional[src.admission.Bulkhead] = None) -> Client:
+    """Return a K8s client as specified in `cfg` that uses `bulkhead`.
+
+    The client uses the module wide `BULKHEAD` if `bulkhead` is None.
+
+    """
+    return Client(
+        retries=cfg.k8s_retries,
+        backoff=cfg.k8s_retry_backoff,
+        max_backoff=cfg.k8s_retry_max_backoff,
+        breaker_threshold=cfg.k8s_breaker_threshold,
+        breaker_reset=cfg.k8s_breaker_reset,
+        hedge_delay=cfg.k8s_hedge_delay,
+        protobuf=cfg.k8s_protobuf,
+        bulkhead=bulkhead,
+    )
+
+
+def configure(cfg: Config) -> None:
+    """Setup the module wide K8s response cache, client and bulkhead from `cfg`."""
+    global BULKHEAD, CLIENT, RESPONSE_CACHE
+    RESPONSE_CACHE = create_cache(cfg)
+    CLIENT = create_client(cfg)
+    BULKHEAD = create_bulkhead(cfg)
+
+
+async def _on_connection_queued_start(session, ctx, params) -> None:
+    ctx.queued_start = asyncio.get_running_loop().time()
+    src.metrics.PROM_K8S_POOL_WAITING.inc()
+
+
+async def _on_connection_queued_end(session, ctx, params) -> None:
+    src.metrics.PROM_K8S_POOL_WAITING.dec()
+    wait = asyncio.get_running_loop().time() - ctx.queued_start
+    src.metrics.PROM_K8S_POOL_WAIT.observe(wait)
+
+
+async def _on_connection_create_end(session, ctx, params) -> None:
+    src.metrics.PROM_K8S_CONNECTIONS.labels("new").inc()
+
+
+async def _on_connection_reuseconn(session, ctx, params) -> None:
+    src.metrics.PROM_K8S_CONNECTIONS.labels("reused").inc()
+
+
+def pool_trace_config() -> aiohttp.TraceConfig:
+    """Return an `aiohttp` trace config that reports connection pool metrics.
+
+    Requests only queue if the pool has reached its connection limit, ie the
+    wait time and number of waiting requests show whether the pool is too
+    small.
+
+    """
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_queued_start.append(_on_connection_queued_start)  # type: ignore
+    trace.on_connection_queued_end.append(_on_connection_queued_end)  # type: ignore
+    trace.on_connection_create_end.append(_on_connection_create_end)  # type: ignore
+    trace.on_connection_reuseconn.append(_on_connection_reuseconn)  # type: ignore
+    return trace
+
+
+class Credentials:
+    """Keep the token and CA certificate of a K8s session up to date.
+
+    K8s rotates projected service account tokens (and occasionally the CA)
+    by replacing the `fname_token` and `fname_cert` files. Every `interval`
+    seconds this compares the inode, modification time and size of both files
+    with the last ones and only re-reads a file if its stamp has changed.
+
+    A new token replaces the authorization header of `session` in place. A new
+    CA certificate is added to `ssl_context`, which the connection pool uses
+    for every new connection. Neither the session nor its connections or any
+    caches need to be recreated.
+
+    """
+
+    def __init__(self, ssl_context: ssl.SSLContext, fname_token: Path, fname_cert: Path,
+                 interval: float = 10):
+        # The `aiohttp.ClientSession` that uses the credentials. Will be
+        # populated by `create_session`.
+        self.session: Any = None
+        self.ssl_context = ssl_context
+        self.fname_token = fname_token
+        self.fname_cert = fname_cert
+        self.interval = interval
+        self._stamps: Dict[Path, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def stamp(fname: Path) -> tuple:
+        """Return the inode, modification time and size of `fname`."""
+        # Follow symlinks because K8s swaps the `..data` symlink of projected
+        # volumes instead of the files.
+        st = fname.stat()
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> Tuple[str, bool]:
+        """Read the token and CA certificate files and return the token.
+
+        Return an error and keep the current credentials if either of the
+        files is missing or invalid, eg because K8s is rotating them right now.
+
+        """
+        stamps = {}
+        try:
+            stamps = {_: self.stamp(_) for _ in (self.fname_token, self.fname_cert)}
+            token = self.fname_token.read_text().strip()
+            if stamps[self.fname_cert] != self._stamps.get(self.fname_cert):
+                # NOTE: this adds the new CA but also retains the old one. This
+                # is what we want during a CA rotation anyway.
+                self.ssl_context.load_verify_locations(cafile=self.fname_cert)
+        except (OSError, ssl.SSLError) as e:
+            logit.error(f"Cannot read K8s token <{self.fname_token}> and "
+                        f"CA <{self.fname_cert}>: {e}")
+            return "", True
+        if not token:
+            logit.error(f"K8s token in <{self.fname_token}> is empty")
+            return "", True
+
+        self._stamps = stamps
+        return token, False
+
+    def reload(self) -> bool:
+        """Update the session credentials if either file has changed.
+
+        Return `True` if the credentials have changed.
+
+        """
+        try:
+            stamps = {_: self.stamp(_) for _ in (self.fname_token, self.fname_cert)}
+        except OSError:
+            stamps = {}
+        if stamps == self._stamps:
+            return False
+
+        changed = [_.name for _ in stamps if stamps[_] != self._stamps.get(_)]
+        token, err = self.load()
+        outcome = "error" if err else "ok"
+        for name in changed or ["token", "ca.crt"]:
+            src.metrics.PROM_K8S_CREDS_RELOADS.labels(name, outcome).inc()
+        if err:
+            return False
+
+        self.session.headers["authorization"] = f"Bearer {token}"
+        logit.info(f"Reloaded the K8s credentials: {', '.join(changed)}")
+        return True
+
+    async def run(self) -> None:
+        """Periodically call `reload` until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            self.reload()
+
+    def start(self) -> None:
+        """Check the credential files in a background task unless disabled."""
+        if self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+
+def create_session(cfg: Config, fname_token: Optional[Path] = None,
+                   fname_cert: Optional[Path] = None) -> Tuple[Config, bool]:
+    """Add a K8s session and its `Credentials` to the `cfg` model.
+
+    The token and CA certificate default to the "token" and "ca.crt" files in
+    `cfg.k8s_creds_path`. The caller must `start` the credentials to pick up
+    rotated tokens.
+
+    """
+    # Load the K8s token and CA certificate. Start from an empty trust store,
+    # ie only trust the cluster CA, not the system CAs.
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    creds = Credentials(
+        ssl_context,
+        fname_token or cfg.k8s_creds_path / "token",
+        fname_cert or cfg.k8s_creds_path / "ca.crt",
+        cfg.k8s_creds_reload_interval,
+    )
+    token, err = creds.load()
+    if err:
         return cfg, True
 
-    # The K8s token is plain text but may have superfluous characters.
-    token = fname_token.read_text().strip()
+    # Configure the connection pool. A limit of zero means "unlimited" and
+    # disables the respective timeout.
+    connector = aiohttp.TCPConnector(
+        ssl=ssl_context,
+        limit=cfg.k8s_pool_size,
+        limit_per_host=cfg.k8s_pool_size_per_host,
+        keepalive_timeout=cfg.k8s_keepalive_timeout,
+        ttl_dns_cache=cfg.k8s_dns_cache_ttl,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=cfg.k8s_request_timeout or None,
+        connect=cfg.k8s_connect_timeout or None,
+        sock_read=cfg.k8s_read_timeout or None,
+    )
 
     # Configure the AioHTTP session with the correct K8s service account token
     # and server certificate.
-    ssl_context = ssl.create_default_context(cafile=fname_cert)
     session = aiohttp.ClientSession(
-        connector=aiohttp.TCPConnector(ssl=ssl_context),
+        connector=connector,
         headers={'authorization': f'Bearer {token}'},
+        timeout=timeout,
+        trace_configs=[pool_trace_config()],
     )
+    creds.session = session
 
     # Duplicate the input `Config` and add the K8s session.
-    cfg = Config(
-        k8s_session=session,
-        k8s_url=cfg.k8s_url,
-        k8s_creds_path=cfg.k8s_creds_path,
-    )
+    cfg = cfg.copy(update={"k8s_session": session, "k8s_credentials": creds})
     return cfg, False
 
 
-async def get_namespaces(sess, k8s_url: str) -> Tuple[K8sNamespaces, bool]:
-    """Return all available K8s namespaces."""
-    # Interrogate the K8s API about the namespaces.
-    url = k8s_url + "/api/v1/namespaces"
-    resp = await sess.get(url)
-    if resp.status != 200:
-        logit.error(f"Kubernetes responded with {resp.status} from <{url}>")
-        return K8sNamespaces(namespaces=[]), True
-
-    # Extract the list of namespace names from the response.
-    data = await resp.json()
-    namespaces = [_["metadata"]["name"] for _ in data["items"]]
-    data = K8sNamespaces(namespaces=namespaces)
-    return data, False
+async def list_pages(sess, url: str, limit: int = LIST_LIMIT,
+                     metadata_only: bool = False,
+                     selectors: Optional[Dict[str, str]] = None,
+                     client: Optional[Client] = None,
+                     projection: Optional[str] = None) -> AsyncIterator[dict]:
+    """Yield the LIST response for `url` in chunks of at most `limit` items.
+
+    The chunks are consecutive pages of the same consistent snapshot, ie the
+    `resourceVersion` in the metadata of the first page applies to all of
+    them. Raise `K8sError` if K8s rejected any of the requests.
+
+    If `metadata_only` is set then the items will only contain the fields
+    listed in `src.decoders.META_FIELDS`. The `client` will then ask for
+    protobuf if it was configured to, and K8s replies with JSON for resources
+    that do not support it.
+
+    The optional `projection` makes K8s strip the items before it sends them,
+    which saves bandwidth and decoding time:
+
+    * "metadata": only the `metadata` of each item, implies `metadata_only`.
+    * "table": the `columns` that `kubectl get` would print and the `cells`
+      plus the projected `metadata` of each item, see `src.decoders.loads_table`.
+
+    K8s falls back to full JSON manifests for resources that do not support
+    the projection, and we then project them ourselves.
+
+    The optional `selectors`, ie `labelSelector` and `fieldSelector`, are
+    passed on to K8s verbatim. Issue the requests with `client`, which
+    defaults to the module wide `CLIENT`.
+
+    """
+    client = client or CLIENT
+    metadata_only = metadata_only or projection == "metadata"
+    if projection == "table":
+        decode = src.decoders.loads_table
+    elif metadata_only:
+        decode = src.decoders.loads_list_metadata
+    else:
+        decode = src.decoders.loads
+
+    # We can only decode the metadata of protobuf responses. List the media
+    # types in order of preference.
+    accept = []
+    if projection is not None:
+        if projection == "metadata" and client.protobuf:
+            accept.append(src.protobuf.CONTENT_TYPE + PROJECTIONS[projection])
+        accept.append("application/json" + PROJECTIONS[projection])
+    elif metadata_only and client.protobuf:
+        accept.append(src.protobuf.CONTENT_TYPE)
+    headers = {"accept": ", ".join(accept + ["application/json"])} if accept else None
+
+    cont: Optional[str] = None
+    while True:
+        params = dict(selectors or {}, limit=str(limit))
+        if projection == "table":
+            params["includeObject"] = "Metadata"
+        if cont:
+            params["continue"] = cont
+
+        status, body = await client.get(sess, url, params, headers)
+        if status != 200:
+            raise K8sError(url, status)
+        page = decode(body)
+        yield page
+
+        # K8s omits the continue token (or leaves it empty) on the last page.
+        cont = page["metadata"].get("continue")
+        if not cont:
+            return
+
+
+async def list_items(sess, url: str, limit: int = LIST_LIMIT,
+                     metadata_only: bool = False,
+                     selectors: Optional[Dict[str, str]] = None,
+                     client: Optional[Client] = None,
+                     projection: Optional[str] = None) -> AsyncIterator[dict]:
+    """Yield all items of the LIST response for `url` one by one.
+
+    Only one chunk of at most `limit` items is held in memory at any time.
+
+    """
+    pages = list_pages(sess, url, limit, metadata_only, selectors, client, projection)
+    async for page in pages:
+        for item in page["items"]:
+            yield item
+
+
+def resource_url(k8s_url: str, kind: str, namespace: Optional[str] = None) -> str:
+    """Return the LIST URL for all resources of `kind`.
+
+    Restrict namespaced resources to `namespace` unless it is `None`. Raise
+    `KeyError` if `kind` is not in `RESOURCES`.
+
+    """
+    prefix, namespaced = RESOURCES[kind]
+    if namespaced and namespace:
+        return f"{k8s_url}{prefix}/namespaces/{namespace}/{kind}"
+    return f"{k8s_url}{prefix}/{kind}"
+
+
+async def get_objects(sess, k8s_url: str, kind: str, namespace: Optional[str] = None,
+                      selectors: Optional[Dict[str, str]] = None,
+                      cache: Optional[src.cache.ResponseCache] = None,
+                      client: Optional[Client] = None,
+                      ) -> Tuple[List[K8sObject], bool]:
+    """Return the name and namespace of all resources of `kind`.
+
+    K8s applies the optional `selectors`, ie `labelSelector` and
+    `fieldSelector`.
+
+    The response is cached, and concurrent calls for the same K8s API share a
+    single request. While the circuit breaker is open, or if the bulkhead of
+    the client shed the call, return the cached response no matter how old it is. Raise
+    `src.admission.Overloaded` if the call was shed and there is none.
+
+    The `cache` and `client` default to the module wide `RESPONSE_CACHE` and
+    `CLIENT`, ie those of the cluster the app runs in.
+
+    """
+    cache, client = cache or RESPONSE_CACHE, client or CLIENT
+    url = resource_url(k8s_url, kind, namespace)
+    key = url
+    if selectors:
+        key += "?" + urllib.parse.urlencode(sorted(selectors.items()))
+
+    # Different clusters may share a URL but not their credentials, so only
+    # coalesce calls that would go out through the same session.
+    try:
+        ret, err = await cache.get(key, lambda: SINGLE_FLIGHT.do(
+            (id(sess), key), lambda: _get_objects(sess, url, kind, selectors, client)))
+    except src.admission.Overloaded:
+        last = cache.peek(key)
+        if last is None:
+            raise
+        src.metrics.PROM_K8S_ADMISSION.labels("fallback").inc()
+        return last, False
+
+    # Serve the last known good data while K8s is unavailable.
+    if err and client.breaker.is_open:
+        last = cache.peek(key)
+        if last is not None:
+            src.metrics.PROM_K8S_BREAKER.labels("fallback").inc()
+            return last, False
+    return ret, err
+
+
+async def _get_objects(sess, url: str, kind: str,
+                       selectors: Optional[Dict[str, str]] = None,
+                       client: Optional[Client] = None,
+                       ) -> Tuple[List[K8sObject], bool]:
+    """Query all resources from `url`."""
+    start = time.perf_counter()
+    try:
+        # K8s only needs to send the metadata we are interested in.
+        ret = [K8sObject(**_["metadata"]) async for _ in list_items(
+            sess, url, selectors=selectors, client=client, projection="metadata")]
+    except K8sError as e:
+        logit.error(str(e))
+        return [], True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # `Client.get` re-raises the last transport error once it gave up.
+        logit.error(f"Cannot reach Kubernetes at <{url}>: {e!r}")
+        return [], True
+    finally:
+        src.metrics.PROM_K8S_LIST_TIME.labels(kind).observe(time.perf_counter() - start)
+    return ret, False
+
+
+async def get_resources(sess, k8s_url: str, kinds: List[str],
+                        namespace: Optional[str] = None,
+                        concurrency: int = 4,
+                        cache: Optional[src.cache.ResponseCache] = None,
+                        client: Optional[Client] = None) -> K8sResources:
+    """Return the resources of all `kinds` from K8s.
+
+    Query the kinds in parallel but with at most `concurrency` requests in
+    flight. The `errors` of the returned model list all kinds that are unknown
+    or that K8s did not provide. See `get_objects` for `cache` and `client`.
+
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch(kind: str) -> Tuple[List[K8sObject], bool]:
+        if kind not in RESOURCES:
+            logit.error(f"Unknown resource kind <{kind}>")
+            return [], True
+        async with sem:
+            return await get_objects(
+                sess, k8s_url, kind, namespace, cache=cache, client=client)
+
+    kinds = list(dict.fromkeys(kinds))
+    results = await asyncio.gather(*[fetch(_) for _ in kinds])
+
+    ret = K8sResources(resources={}, errors=[])
+    for kind, (objs, err) in zip(kinds, results):
+        if err:
+            ret.errors.append(kind)
+        else:
+            ret.resources[kind] = objs
+    return ret
+
+
+async def get_namespaces(sess, k8s_url: str, label_selector: Optional[str] = None,
+                         field_selector: Optional[str] = None,
+                         cache: Optional[src.cache.ResponseCache] = None,
+                         client: Optional[Client] = None,
+                         ) -> Tuple[K8sNamespaces, bool]:
+    """Return all available K8s namespaces that match the optional selectors.
+
+    See `get_objects` for `cache` and `client`.
+
+    """
+    selectors = {"labelSelector": label_selector, "fieldSelector": field_selector}
+    objs, err = await get_objects(
+        sess, k8s_url, "namespaces",
+        selectors={k: v for k, v in selectors.items() if v},
+        cache=cache, client=client,
+    )
+    return K8sNamespaces(namespaces=[_.name for _ in objs]), err
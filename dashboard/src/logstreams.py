@@ -1,6 +1,38 @@
-"""Configure streams to emit JSON strings."""
+"""Configure streams to emit JSON strings.
+
+The loggers encode the records to JSON and put the lines into a bounded
+queue. A background thread writes them to stderr, so that a slow stdout pipe
+cannot stall the event loop.
+
+"""
+import atexit
 import json
 import logging
+import logging.handlers
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+import orjson
+
+import src.metrics
+
+# Default number of log records to buffer before we drop new ones.
+QUEUE_SIZE = 10_000
+
+
+def _dumps_stdlib(msg: dict) -> str:
+    return json.dumps(msg, default=str)
+
+
+def _dumps_orjson(msg: dict) -> str:
+    # The standard library stringifies non-str dict keys, eg HTTP status codes.
+    return orjson.dumps(msg, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# Fastest JSON encoder for log lines. The stdlib one only serves as a baseline
+# for `benchmarks.bench_logging`.
+dumps: Callable[[dict], str] = _dumps_orjson
 
 
 class JsonFormatter(logging.Formatter):
@@ -25,25 +57,81 @@ class JsonFormatter(logging.Formatter):
         if record.exc_info:
             msg['exception'] = self.formatException(record.exc_info)
 
-        return json.dumps(msg)
+        return dumps(msg)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Put log records into a bounded queue and drop them if it is full.
+
+    Like the base class this handler formats the record in the calling
+    thread, because the caller may still mutate the `record.args` afterwards.
+    The `Listener` thread then only writes the finished JSON lines.
+
+    """
 
+    def __init__(self, queue: "queue.Queue[Any]") -> None:
+        super().__init__(queue)
+        self.setFormatter(JsonFormatter())
 
-def setup(level: str) -> bool:
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            src.metrics.PROM_LOG_DROPPED.inc()
+
+
+class Listener(logging.handlers.QueueListener):
+    """Queue listener that can always enqueue its stop sentinel."""
+
+    # The writer thread while it runs. The base class sets it, but its type
+    # stubs do not declare it.
+    _thread: Optional[threading.Thread]
+
+    def enqueue_sentinel(self) -> None:
+        # Block until the queue has room, lest a full queue prevents `stop`.
+        self.queue.put(self._sentinel)  # type: ignore
+
+
+# The background thread that writes the queued log records, if running.
+LISTENER: Optional[Listener] = None
+
+
+def stop() -> None:
+    """Write all queued log records and stop the background thread."""
+    global LISTENER
+    if LISTENER is not None:
+        LISTENER.stop()
+        LISTENER = None
+
+
+def setup(level: str, queue_size: int = QUEUE_SIZE) -> bool:
     """Configure all log streams with `level`.
 
     Valid levels: "debug", "info", "warning", "error".
 
     The level names are not case-sensitive.
 
+    Buffer at most `queue_size` records and drop any new ones if the writer
+    thread cannot keep up.
+
     """
+    global LISTENER
+
     # Sanity check.
     level = level.upper()
     if level not in {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}:
         return True
 
-    # Create a StreamHandler instance with our JSON formatter.
-    handler = logging.StreamHandler()
-    handler.setFormatter(JsonFormatter())
+    # Flush and replace the writer thread from any previous call.
+    stop()
+
+    # The writer thread uses a plain StreamHandler since the queue handler
+    # already formatted the records.
+    stream = logging.StreamHandler()
+    records: "queue.Queue[Any]" = queue.Queue(queue_size)
+    LISTENER = Listener(records, stream)
+    LISTENER.start()
+    handler = DroppingQueueHandler(records)
 
     # Configure the typical log streams of any FastAPI application.
     logger_names = ["app", "fastapi", "uvicorn", "uvicorn.asgi", "asyncio"]
@@ -65,3 +153,7 @@ def setup(level: str) -> bool:
 
     # Setup successful.
     return False
+
+
+# Do not lose the queued records when the process exits.
+atexit.register(stop)
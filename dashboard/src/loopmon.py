@@ -0,0 +1,108 @@
+"""Measure the event loop lag and find the callbacks that block the loop.
+
+A task on the event loop periodically sleeps and records by how much it woke
+up late in the `PROM_LOOP_LAG` histogram. A watchdog thread notices if that
+task is overdue by more than the threshold, ie while the loop is still
+blocked, and logs the stack of the event loop thread and the current task.
+
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import src.metrics
+
+# Convenience.
+logit = logging.getLogger("app")
+
+
+class LoopMonitor:
+    """Sample the lag of the running event loop every `interval` seconds.
+
+    Log the culprit whenever the loop is blocked for more than `threshold`
+    seconds. An `interval` of zero disables the monitor.
+
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.clock = time.monotonic
+
+        # Monotonic time when the sampling task last went to sleep.
+        self.beat = 0.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._reported = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def check(self) -> bool:
+        """Log the stack of the event loop thread if the loop is blocked.
+
+        Only report every stall once. Return `True` if this call reported it.
+
+        """
+        beat = self.beat
+        stalled = self.clock() - beat - self.interval
+        if stalled <= self.threshold or beat == self._reported:
+            return False
+        self._reported = beat
+        src.metrics.PROM_LOOP_STALLS.inc()
+
+        # Capture what the event loop thread is doing right now.
+        frame = sys._current_frames().get(self._thread_id)  # type: ignore
+        stack = traceback.format_stack(frame) if frame is not None else []
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        logit.warning(
+            f"Event loop blocked for more than {stalled:.3f}s",
+            {"task": task.get_name() if task is not None else None,
+             "stack": "".join(stack)},
+        )
+        return True
+
+    async def run(self) -> None:
+        """Record the loop lag every `interval` seconds until cancelled."""
+        while True:
+            self.beat = start = self.clock()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.clock() - start - self.interval)
+            src.metrics.PROM_LOOP_LAG.observe(lag)
+
+    def watchdog(self) -> None:
+        """Call `check` until `stop` is called."""
+        while not self._stopped.wait(self.threshold / 2):
+            self.check()
+
+    def start(self) -> None:
+        """Monitor the running event loop unless disabled."""
+        if self.interval <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self.beat = self.clock()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self.run())
+        self._watchdog = threading.Thread(
+            target=self.watchdog, name="loopmon", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Cancel the sampling task and stop the watchdog thread."""
+        self._stopped.set()
+        if self._watchdog is not None:
+            # The watchdog may be in the middle of a check. Wait for it in an
+            # executor thread lest we block the loop it monitors.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._watchdog.join)
+            self._watchdog = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
@@ -1,19 +1,38 @@
 import logging
 import os
 import sys
-from pathlib import Path
 
-import uvicorn
-from prometheus_client import start_http_server
+from prometheus_client import (
+    CollectorRegistry, multiprocess, start_http_server,
+)
 
+import src.config
 import src.endpoints
 import src.logstreams
 import src.server
-from src.models import Config
 
 # Convenience.
 logit = logging.getLogger("app")
 
+# Worker processes import the application from here because this module also
+# registers all endpoints.
+FASTAPI_APP = src.server.FASTAPI_APP
+
+
+def start_metrics_server(port: int = 8081) -> None:
+    """Serve the Prometheus metrics on `port`.
+
+    Aggregate the metrics of all worker processes if
+    `PROMETHEUS_MULTIPROC_DIR` is set.
+
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port=port, addr="0.0.0.0", registry=registry)
+    else:
+        start_http_server(port=port, addr="0.0.0.0")
+
 
 def main() -> int:
     """Validate the configuration and start the server process.
@@ -26,34 +45,49 @@ def main() -> int:
     src.logstreams.setup(log_level)
     logit.info("Bootstrapping server")
 
-    # Convenience.
-    app = src.server.FASTAPI_APP
+    # Compile the configuration from the environment variables. Abort
+    # immediately if any of the mandatory ones is missing.
+    cfg, err = src.config.load_config()
+    if err:
+        return 1
 
-    # Populate a Config structure and add it to the global FastAPI application
-    # variable . Abort immediately if any of the mandatory environment
-    # variables is missing.
+    # Server options.
     try:
-        app.extra["config"] = Config(
-            # Placeholder. Will be populated during server startup.
-            k8s_session=None,
-
-            # K8s will automatically inject this into the Pod.
-            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
-
-            # Manifest must specify this environment variable explicitly.
-            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
-        )
-    except KeyError as e:
-        logit.critical(f"Environment variable <{e.args[0]}> is undefined")
+        workers = int(os.environ.get("WORKERS", "1"))
+    except ValueError:
+        logit.critical("Environment variable <WORKERS> must be an integer")
+        return 1
+    loop = os.environ.get("UVICORN_LOOP", "auto")
+    http = os.environ.get("UVICORN_HTTP", "auto")
+
+    # Worker processes must aggregate their Prometheus metrics through a
+    # shared directory.
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        logit.critical("Multiple workers require <PROMETHEUS_MULTIPROC_DIR>")
         return 1
 
-    # Start the web server.
+    # Add the `Config` to the global FastAPI application. Worker processes
+    # import the application afresh and must load the configuration themselves
+    # during startup.
+    app = src.server.FASTAPI_APP
+    app.extra["config"] = cfg
+
+    # Start the web server. Import `uvicorn` only now because worker
+    # processes import this module as well, but do not need it.
+    import uvicorn
     uvicorn.run(
-        # Specify the FastAPI application to run.
-        app=app,
+        # Specify the FastAPI application to run. Multiple workers require an
+        # import string instead of the application object.
+        app="src.main:FASTAPI_APP" if workers > 1 else app,
         host="0.0.0.0",
         port=8080,
         log_level=log_level,
+        workers=workers,
+
+        # Event loop ("auto", "asyncio", "uvloop") and HTTP protocol
+        # implementation ("auto", "h11", "httptools").
+        loop=loop,              # type: ignore
+        http=http,              # type: ignore
 
         # Disable access logs.
         access_log=False,
@@ -70,5 +104,5 @@ def main() -> int:
 
 
 if __name__ == '__main__':      # codecov-skip
-    start_http_server(port=8081, addr="0.0.0.0")
+    start_metrics_server()
     sys.exit(main())
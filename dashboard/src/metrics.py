@@ -1,8 +1,135 @@
 """Collection of all Prometheus counters."""
-from prometheus_client import Counter
+from prometheus_client import Counter, Gauge, Histogram
 
 PROM_REQ_CNT = Counter(
     name="requests",
     documentation="Count web requests",
     labelnames=["method", "path", "code"],
 )
+
+PROM_REQ_TIME = Histogram(
+    name="request_seconds",
+    documentation="Time until the response headers of web requests were ready",
+    labelnames=["method", "path"],
+)
+
+PROM_REQ_INFLIGHT = Gauge(
+    name="requests_inflight",
+    documentation="Number of web requests currently in progress",
+    multiprocess_mode="livesum",
+)
+
+PROM_K8S_CALLS = Counter(
+    name="k8s_calls",
+    documentation="Count K8s calls that were issued or joined an in-flight call",
+    labelnames=["outcome"],
+)
+
+PROM_K8S_CACHE = Counter(
+    name="k8s_cache",
+    documentation="Count hits, stale hits, misses and evictions of the K8s cache",
+    labelnames=["event"],
+)
+
+PROM_K8S_CONNECTIONS = Counter(
+    name="k8s_connections",
+    documentation="Count K8s connections that were newly created or reused from the pool",
+    labelnames=["source"],
+)
+
+PROM_K8S_POOL_WAITING = Gauge(
+    name="k8s_pool_waiting",
+    documentation="Number of K8s requests waiting for a free pooled connection",
+    multiprocess_mode="livesum",
+)
+
+PROM_K8S_POOL_WAIT = Histogram(
+    name="k8s_pool_wait_seconds",
+    documentation="Time K8s requests waited for a free pooled connection",
+)
+
+PROM_STREAM_CLIENTS = Gauge(
+    name="stream_clients",
+    documentation="Number of clients subscribed to namespace change events",
+    multiprocess_mode="livesum",
+)
+
+PROM_STREAM_OVERFLOWS = Counter(
+    name="stream_overflows",
+    documentation="Count slow stream clients whose event buffer overflowed",
+)
+
+PROM_K8S_LIST_TIME = Histogram(
+    name="k8s_list_seconds",
+    documentation="Time to LIST all resources of a kind from K8s",
+    labelnames=["kind"],
+)
+
+PROM_K8S_REQUEST_TIME = Histogram(
+    name="k8s_request_seconds",
+    documentation="Time to receive the complete response of a K8s LIST call",
+    labelnames=["code"],
+)
+
+PROM_K8S_RESPONSE_SIZE = Histogram(
+    name="k8s_response_bytes",
+    documentation="Size of K8s LIST responses",
+    buckets=[2 ** _ for _ in range(10, 28, 2)],
+)
+
+PROM_LOG_DROPPED = Counter(
+    name="log_dropped",
+    documentation="Count log records dropped because the log queue was full",
+)
+
+PROM_K8S_RETRIES = Counter(
+    name="k8s_retries",
+    documentation="Count retried K8s requests by the status (or error) that caused it",
+    labelnames=["reason"],
+)
+
+PROM_K8S_BREAKER = Counter(
+    name="k8s_breaker",
+    documentation="Count K8s circuit breaker transitions, rejections and fallbacks",
+    labelnames=["event"],
+)
+
+PROM_K8S_HEDGES = Counter(
+    name="k8s_hedges",
+    documentation="Count hedged K8s requests that were issued and that won",
+    labelnames=["outcome"],
+)
+
+PROM_K8S_CREDS_RELOADS = Counter(
+    name="k8s_creds_reloads",
+    documentation="Count reloads of the K8s token and CA certificate files",
+    labelnames=["file", "outcome"],
+)
+
+PROM_LOOP_LAG = Histogram(
+    name="loop_lag_seconds",
+    documentation="Delay of periodic event loop callbacks beyond their due time",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+
+PROM_LOOP_STALLS = Counter(
+    name="loop_stalls",
+    documentation="Count event loop stalls above the threshold of the loop monitor",
+)
+
+PROM_RATE_LIMITED = Counter(
+    name="rate_limited",
+    documentation="Count web requests rejected by the per-client rate limit",
+)
+
+PROM_K8S_ADMISSION = Counter(
+    name="k8s_admission",
+    documentation="Count K8s calls that were admitted, queued, shed or served stale",
+    labelnames=["outcome"],
+)
+
+PROM_K8S_QUEUED = Gauge(
+    name="k8s_queued",
+    documentation="Number of K8s calls waiting for a free slot",
+    multiprocess_mode="livesum",
+)
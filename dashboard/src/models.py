@@ -1,8 +1,8 @@
 """Pydantic models"""
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveFloat
 
 
 class Config(BaseModel):
@@ -11,7 +11,162 @@ class Config(BaseModel):
     k8s_url: str
     k8s_creds_path: Path
 
+    # JSON decoder for K8s responses: "auto", "msgspec", "orjson" or "stdlib".
+    k8s_json_decoder: str = "auto"
+
+    # Ask K8s for protobuf instead of JSON where we only need the metadata.
+    k8s_protobuf: bool = False
+
+    # Response cache for K8s calls: TTL and stale-while-revalidate period in
+    # seconds and maximum number of entries (0 disables the cache).
+    k8s_cache_ttl: float = 2
+    k8s_cache_stale_ttl: float = 30
+    k8s_cache_size: int = 256
+
+    # Connection pool for the K8s session: total and per-host connection
+    # limits (0 means unlimited), seconds to keep idle connections alive and
+    # to cache DNS lookups.
+    k8s_pool_size: int = 100
+    k8s_pool_size_per_host: int = 0
+    k8s_keepalive_timeout: float = 15
+    k8s_dns_cache_ttl: int = 10
+
+    # Timeouts in seconds for K8s requests (0 disables the respective timeout).
+    k8s_request_timeout: float = 60
+    k8s_connect_timeout: float = 5
+    k8s_read_timeout: float = 30
+
+    # Directory through which worker processes share the K8s data. Every
+    # worker queries K8s independently if this is unset.
+    shared_cache_dir: Optional[Path] = None
+
+    # Directory for the snapshot of the namespaces that lets a restarted
+    # worker resume watching K8s instead of listing everything again (optional)
+    # and seconds between snapshots.
+    snapshot_dir: Optional[Path] = None
+    snapshot_interval: float = 60
+
+    # Compression level of gzip (1-9) and brotli (1-11) responses (0 disables
+    # the respective coding). Bodies smaller than the minimum size (bytes) are
+    # never compressed.
+    response_gzip_level: int = 6
+    response_brotli_level: int = 4
+    response_compress_min_size: int = 1024
+
+    # Maximum number of buffered events per streaming client before it must
+    # resynchronise, and seconds between keep-alive messages on idle streams.
+    stream_buffer_size: int = 1000
+    stream_keepalive: float = 15
+
+    # Maximum number of concurrent K8s requests per multi-resource query.
+    k8s_list_concurrency: int = 4
+
+    # Maximum number of concurrent K8s calls per cluster (zero means
+    # unlimited) and of calls that may wait for a free slot. Further calls
+    # fail immediately.
+    k8s_max_concurrency: int = 50
+    k8s_max_queue: int = 200
+
+    # Retry failed K8s requests this often with exponential backoff (seconds).
+    k8s_retries: int = 3
+    k8s_retry_backoff: float = 0.1
+    k8s_retry_max_backoff: float = 5
+
+    # Open the circuit breaker after this many consecutive failures (zero
+    # disables it) and probe K8s again after `k8s_breaker_reset` seconds.
+    k8s_breaker_threshold: int = 5
+    k8s_breaker_reset: float = 30
+
+    # Issue a second request if K8s has not responded after this many seconds
+    # (zero disables it).
+    k8s_hedge_delay: float = 0
+
+    # Seconds between checks whether the K8s token or CA certificate in
+    # `k8s_creds_path` has changed (zero disables the reload).
+    k8s_creds_reload_interval: float = 10
+
+    # Placeholder for the `src.k8s.Credentials` of `k8s_session`. Will be
+    # populated together with the session.
+    k8s_credentials: Any = None
+
+    # Report the worker as not ready if the informer has not heard from K8s
+    # for longer than `ready_max_watch_lag` or callbacks on the event loop are
+    # delayed by more than `ready_max_loop_lag` seconds (zero disables the
+    # respective check). Reassess the readiness every `ready_interval` seconds.
+    ready_max_watch_lag: float = 180
+    ready_max_loop_lag: float = 1
+    ready_interval: float = 1
+
+    # Sample the event loop lag every `loop_monitor_interval` seconds (zero
+    # disables the monitor) and log the stack of callbacks that block the
+    # loop for more than `loop_monitor_threshold` seconds, which must be
+    # positive.
+    loop_monitor_interval: float = 0
+    loop_monitor_threshold: PositiveFloat = 0.1
+
+    # Kubeconfig style file with additional clusters to query (optional) and
+    # seconds to wait for each of them before an aggregate response omits it
+    # (zero means no timeout).
+    clusters_file: Optional[Path] = None
+    clusters_timeout: float = 5
+
+    # Allow every client `rate_limit` requests per second on average and
+    # bursts of up to `rate_limit_burst` requests (a zero rate disables the
+    # limit). Clients are identified by their own address or, if set, by the
+    # `rate_limit_header`, eg "X-Forwarded-For". Only the entries that our
+    # `rate_limit_trusted_hops` proxies appended to that header count.
+    rate_limit: float = 0
+    rate_limit_burst: int = 20
+    rate_limit_header: Optional[str] = None
+    rate_limit_trusted_hops: int = 1
+
+
+class ClusterConfig(BaseModel):
+    """API server and credential files of one K8s cluster."""
+    name: str
+    url: str
+    fname_token: Path
+    fname_cert: Path
+
 
 class K8sNamespaces(BaseModel):
     """Application configuration."""
     namespaces: List[str]
+
+
+class K8sObject(BaseModel):
+    """Name and namespace of a K8s resource."""
+    name: str
+    namespace: Optional[str] = None
+
+
+class K8sResources(BaseModel):
+    """K8s resources by kind and the kinds that could not be queried."""
+    resources: Dict[str, List[K8sObject]]
+    errors: List[str]
+
+
+class Readiness(BaseModel):
+    """Readiness of this worker and the reasons if it is not ready.
+
+    The lags are in seconds. `watch_lag` is `None` until the informer synced.
+
+    """
+    ready: bool
+    synced: bool
+    watch_lag: Optional[float]
+    loop_lag: float
+    breaker_open: bool
+    reasons: List[str]
+
+
+class ClusterNamespaces(BaseModel):
+    """Namespaces by cluster and the error reason of all clusters without them."""
+    clusters: Dict[str, List[str]]
+    errors: Dict[str, str]
+
+
+class ClusterResources(BaseModel):
+    """Resources by cluster and the error reason of all clusters without them."""
+    clusters: Dict[str, K8sResources]
+    errors: Dict[str, str]
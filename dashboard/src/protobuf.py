@@ -0,0 +1,229 @@
+"""Decode the metadata of K8s protobuf responses.
+
+K8s serves its built-in resources as `application/vnd.kubernetes.protobuf`
+if the client asks for it. Every document starts with the `MAGIC` prefix,
+followed by a `runtime.Unknown` message that wraps the encoded object:
+
+    Unknown:    typeMeta=1 (TypeMeta: apiVersion=1, kind=2), raw=2,
+                contentEncoding=3, contentType=4
+    <Kind>List: metadata=1 (ListMeta), items=2 (repeated <Kind>)
+    <Kind>:     metadata=1 (ObjectMeta), spec=2, status=3
+    ListMeta:   resourceVersion=2, continue=3, remainingItemCount=4
+    ObjectMeta: name=1, namespace=3, uid=5, resourceVersion=6,
+                labels=11 (map entries: key=1, value=2)
+    Status:     message=3, reason=4, code=6
+
+Watch streams consist of frames with a 4 byte big-endian length prefix. Each
+frame holds a `WatchEvent` (type=1, object=2) whose object is a
+`RawExtension` (raw=1) with another such document.
+
+Without the generated K8s message classes we can only decode the fields
+above, ie the same ones `src.decoders` projects JSON responses onto. All
+other fields, eg `spec`, `status` and `managedFields`, are skipped wholesale
+without looking inside them.
+
+"""
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple, Union
+
+# Prefix of every K8s protobuf document.
+MAGIC = b"k8s\x00"
+
+# Media type of K8s protobuf responses. Clients should accept JSON as well
+# because K8s cannot serve custom resources as protobuf.
+CONTENT_TYPE = "application/vnd.kubernetes.protobuf"
+ACCEPT = f"{CONTENT_TYPE}, application/json"
+
+# Field numbers of the K8s messages we decode.
+_UNKNOWN_TYPE_META, _UNKNOWN_RAW = 1, 2
+_TYPE_META_KIND = 2
+_LIST_META, _LIST_ITEMS = 1, 2
+_OBJECT_META = 1
+_LIST_META_FIELDS = {2: "resourceVersion", 3: "continue", 4: "remainingItemCount"}
+_OBJECT_META_FIELDS = {1: "name", 3: "namespace", 5: "uid", 6: "resourceVersion"}
+_OBJECT_META_LABELS = 11
+_STATUS_FIELDS = {3: "message", 4: "reason", 6: "code"}
+_WATCH_TYPE, _WATCH_OBJECT = 1, 2
+_RAW_EXTENSION_RAW = 1
+
+Buffer = Union[bytes, memoryview]
+
+
+class DecodeError(ValueError):
+    """The data is not a valid K8s protobuf document."""
+
+
+def _varint(buf: Buffer, pos: int) -> Tuple[int, int]:
+    """Return the varint at `pos` in `buf` and the position after it."""
+    ret, shift = 0, 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            raise DecodeError("Truncated varint") from None
+        ret |= (byte & 0x7F) << shift
+        pos += 1
+        if byte < 0x80:
+            return ret, pos
+        shift += 7
+
+
+def fields(buf: Buffer) -> Iterator[Tuple[int, Any]]:
+    """Yield the field number and value of every field in the message `buf`.
+
+    Varints are decoded as unsigned integers and length delimited values are
+    zero copy `memoryview`s. Fixed size values are returned as raw bytes.
+
+    """
+    view = memoryview(buf)
+    pos, end = 0, len(view)
+    while pos < end:
+        # Field numbers below 16 and short values have single byte varints.
+        key = view[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = _varint(view, pos)
+        num, wire_type = key >> 3, key & 7
+        value: Union[int, memoryview, bytes]
+        if wire_type == 0:
+            value, pos = _varint(view, pos)
+        elif wire_type == 2:
+            size = view[pos] if pos < end else 0x80
+            if size < 0x80:
+                pos += 1
+            else:
+                size, pos = _varint(view, pos)
+            value = view[pos:pos + size]
+            pos += size
+        elif wire_type in (1, 5):
+            size = 8 if wire_type == 1 else 4
+            value = bytes(view[pos:pos + size])
+            pos += size
+        else:
+            raise DecodeError(f"Unsupported wire type {wire_type}")
+        if pos > end:
+            raise DecodeError("Truncated field")
+        yield num, value
+
+
+def is_protobuf(doc: Buffer) -> bool:
+    """Return `True` if `doc` is a K8s protobuf rather than a JSON document."""
+    return bytes(doc[:len(MAGIC)]) == MAGIC
+
+
+def unwrap(doc: Buffer) -> Tuple[str, memoryview]:
+    """Return the kind and the encoded object of the K8s protobuf `doc`."""
+    if not is_protobuf(doc):
+        raise DecodeError("Missing K8s protobuf prefix")
+
+    kind, raw = "", memoryview(b"")
+    for num, value in fields(memoryview(doc)[len(MAGIC):]):
+        if num == _UNKNOWN_TYPE_META:
+            for tnum, tvalue in fields(value):
+                if tnum == _TYPE_META_KIND:
+                    kind = str(tvalue, "utf8")
+        elif num == _UNKNOWN_RAW:
+            raw = value
+    return kind, raw
+
+
+def _scalars(buf: Buffer, names: Dict[int, str]) -> Dict[str, Any]:
+    """Return the string and integer fields of `buf` listed in `names`."""
+    ret: Dict[str, Any] = {}
+    for num, value in fields(buf):
+        name = names.get(num)
+        if name is not None:
+            ret[name] = value if isinstance(value, int) else str(value, "utf8")
+    return ret
+
+
+def object_meta(buf: Buffer) -> Dict[str, Any]:
+    """Return the `src.decoders.META_FIELDS` of the `ObjectMeta` in `buf`."""
+    ret: Dict[str, Any] = {}
+    labels: Dict[str, str] = {}
+    for num, value in fields(buf):
+        name = _OBJECT_META_FIELDS.get(num)
+        if name is not None:
+            ret[name] = str(value, "utf8")
+        elif num == _OBJECT_META_LABELS:
+            key, val = "", ""
+            for enum, evalue in fields(value):
+                if enum == 1:
+                    key = str(evalue, "utf8")
+                elif enum == 2:
+                    val = str(evalue, "utf8")
+            labels[key] = val
+    if labels:
+        ret["labels"] = labels
+    return ret
+
+
+def project(buf: Buffer) -> dict:
+    """Return the encoded K8s object `buf` projected onto its metadata.
+
+    This is the equivalent of `src.decoders.project` for JSON manifests.
+
+    """
+    for num, value in fields(buf):
+        if num == _OBJECT_META:
+            return {"metadata": object_meta(value)}
+    return {"metadata": {}}
+
+
+def loads_list_metadata(body: Buffer) -> dict:
+    """Decode a K8s LIST response and project its items onto their metadata.
+
+    Return the same structure as `src.decoders.loads_list_metadata`.
+
+    """
+    _, raw = unwrap(body)
+    meta: Dict[str, Any] = {}
+    items: List[dict] = []
+    for num, value in fields(raw):
+        if num == _LIST_META:
+            meta = _scalars(value, _LIST_META_FIELDS)
+        elif num == _LIST_ITEMS:
+            items.append(project(value))
+    return {"metadata": meta, "items": items}
+
+
+def loads_watch_event(frame: Buffer) -> dict:
+    """Decode a single frame of a K8s watch stream.
+
+    The object of the returned event is projected onto its metadata, unless
+    it is the `Status` of an ERROR event, in which case it contains the
+    "code", "message" and "reason" of that status.
+
+    """
+    etype, raw = "", memoryview(b"")
+    for num, value in fields(frame):
+        if num == _WATCH_TYPE:
+            etype = str(value, "utf8")
+        elif num == _WATCH_OBJECT:
+            for rnum, rvalue in fields(value):
+                if rnum == _RAW_EXTENSION_RAW:
+                    raw = rvalue
+
+    kind, obj = unwrap(raw)
+    if kind == "Status":
+        return {"type": etype, "object": _scalars(obj, _STATUS_FIELDS)}
+    return {"type": etype, "object": project(obj)}
+
+
+async def iter_frames(resp) -> AsyncIterator[bytes]:
+    """Yield the length prefixed frames of a streaming `aiohttp` response.
+
+    Raise `DecodeError` if the stream ends in the middle of a frame.
+
+    """
+    buf = bytearray()
+    async for chunk in resp.content.iter_any():
+        buf += chunk
+        while len(buf) >= 4:
+            size = int.from_bytes(buf[:4], "big")
+            if len(buf) < 4 + size:
+                break
+            yield bytes(buf[4:4 + size])
+            del buf[:4 + size]
+    if buf:
+        raise DecodeError("Truncated watch frame")
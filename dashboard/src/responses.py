@@ -0,0 +1,226 @@
+"""Serve pre-encoded and compressed JSON responses with strong ETags."""
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+import brotli
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Supported content codings in order of preference.
+CODINGS = ("br", "gzip")
+
+
+class Encoded(NamedTuple):
+    """JSON encoded response body, its compressed versions and its ETag.
+
+    `compressed` maps the content codings, eg "gzip", to the compressed body.
+
+    """
+    body: bytes
+    compressed: Dict[str, bytes]
+    etag: str
+
+
+def compress(body: bytes, gzip_level: int = 0, brotli_level: int = 0,
+             min_size: int = 0) -> Dict[str, bytes]:
+    """Return `body` compressed with every enabled content coding.
+
+    A level of zero disables the respective coding. Do not compress bodies
+    smaller than `min_size` at all.
+
+    """
+    ret: Dict[str, bytes] = {}
+    if not body or len(body) < min_size:
+        return ret
+    if brotli_level > 0:
+        ret["br"] = brotli.compress(body, quality=brotli_level)
+    if gzip_level > 0:
+        # Use a fixed modification time to make the compressed bytes depend
+        # on the content only.
+        ret["gzip"] = gzip.compress(body, gzip_level, mtime=0)
+    return ret
+
+
+def encode(content: Any, gzip_level: int = 0, brotli_level: int = 0,
+           min_size: int = 0) -> Encoded:
+    """Return the JSON encoded `content` and its compressed versions.
+
+    See `compress` for the meaning of the compression arguments.
+
+    """
+    # Encode the content exactly like Starlette's `JSONResponse` would.
+    body = json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return Encoded(body, compress(body, gzip_level, brotli_level, min_size), etag)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Return `True` if the `If-None-Match` header of `request` matches `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison, ie we ignore the `W/` prefix.
+    tags = {_.strip().removeprefix("W/") for _ in header.split(",")}
+    return etag in tags
+
+
+def coding_etag(etag: str, coding: Optional[str]) -> str:
+    """Return the ETag of the `coding` version of the response with `etag`.
+
+    Strong ETags must differ between the content codings of a resource, lest
+    a cache serves the gzip body to a client that asked for the brotli one.
+
+    """
+    if coding is None or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def accepted_codings(headers: Headers) -> List[str]:
+    """Return the content codings the client accepts according to `headers`."""
+    ret = []
+    for coding in headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+
+        # A quality value of zero means "not acceptable".
+        key, _, value = params.partition("=")
+        if key.strip() == "q":
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        ret.append(name.strip().lower())
+    return ret
+
+
+def choose_coding(headers: Headers, available: Any) -> Optional[str]:
+    """Return our preferred coding among the `available` ones the client accepts."""
+    accepted = accepted_codings(headers)
+    for coding in CODINGS:
+        if coding in accepted and coding in available:
+            return coding
+    return None
+
+
+def respond(request: Request, enc: Encoded) -> Response:
+    """Return the response for `request` with the pre-encoded `enc`.
+
+    Return "304 Not Modified" if the client already has the current version.
+
+    """
+    # Clients must revalidate their copy, which costs us next to nothing.
+    coding = choose_coding(request.headers, enc.compressed)
+    etag = coding_etag(enc.etag, coding)
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if enc.compressed:
+        headers["vary"] = "Accept-Encoding"
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = enc.body
+    if coding is not None:
+        body = enc.compressed[coding]
+        headers["content-encoding"] = coding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class CompressMiddleware:
+    """Compress the responses that the endpoints did not compress themselves.
+
+    The compression settings are those of the `Config` in the `extra` dict of
+    the application. Only complete bodies are compressed, ie streaming
+    responses pass through unchanged.
+
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        cfg = scope["app"].extra.get("config") if "app" in scope else None
+        if scope["type"] != "http" or cfg is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Only compress the body with the coding we would actually send.
+        levels = {"br": cfg.response_brotli_level, "gzip": cfg.response_gzip_level}
+        chosen = choose_coding(Headers(scope=scope), [k for k, v in levels.items() if v])
+        if chosen is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Bind the narrowed type for the closure below.
+        coding: str = chosen
+        levels = {k: v if k == coding else 0 for k, v in levels.items()}
+        start: Optional[Message] = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+
+            # Hold back the headers until we know the body.
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            if not (message.get("more_body") or "content-encoding" in headers):
+                compressed = compress(
+                    message.get("body", b""), levels["gzip"], levels["br"],
+                    cfg.response_compress_min_size,
+                )
+                if compressed:
+                    body = compressed[coding]
+                    headers.add_vary_header("Accept-Encoding")
+                    headers["content-encoding"] = coding
+                    headers["content-length"] = str(len(body))
+                    if "etag" in headers:
+                        headers["etag"] = coding_etag(headers["etag"], coding)
+                    message = dict(message, body=body)
+
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+class EncodedCache:
+    """Retain the `Encoded` response for the latest key only.
+
+    Use this for responses that only ever exist in a single current version,
+    eg the data of an informer.
+
+    """
+
+    def __init__(self):
+        self.key: Hashable = None
+        self.value: Optional[Encoded] = None
+        self.refs: Any = None
+
+    def get(self, key: Hashable, build: Callable[[], Encoded],
+            refs: Any = None) -> Encoded:
+        """Return the cached value for `key` or replace it with `build()`.
+
+        Keep a reference to `refs` for as long as `key` is current. This
+        ensures that the `id` of those objects remains valid if `key`
+        contains them.
+
+        """
+        if self.value is None or key != self.key:
+            self.key, self.value, self.refs = key, build(), refs
+        return self.value
@@ -1,14 +1,26 @@
 import logging
 import os
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING, Union
 
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
 import src
+import src.admission
+import src.config
+import src.decoders
+import src.health
+import src.informer
 import src.k8s
-import src.main
+import src.logstreams
 import src.metrics
+import src.responses
+
+# Only imported on demand at runtime, see `startup_event`.
+if TYPE_CHECKING:  # codecov-skip
+    from src.shared import SharedInformer
 
 # Convenience.
 logit = logging.getLogger("app")
@@ -33,12 +45,78 @@ FASTAPI_APP = FastAPI(
 @FASTAPI_APP.on_event("startup")
 async def startup_event():
     """Server startup."""
+    # Worker processes import the application afresh and must setup logging
+    # and load the configuration themselves.
+    if "config" not in FASTAPI_APP.extra:
+        src.logstreams.setup(os.environ.get("log_level", "info"))
+        cfg, err = src.config.load_config()
+        assert not err
+        FASTAPI_APP.extra["config"] = cfg
+
     # Create the K8s session. Use a hard abort if that fails.
     cfg, err = src.k8s.create_session(FASTAPI_APP.extra["config"])
     assert not err
 
+    # Select the JSON decoder for K8s responses and setup the response cache.
+    assert not src.decoders.select(cfg.k8s_json_decoder)
+    src.k8s.configure(cfg)
+
     FASTAPI_APP.extra["config"] = cfg
 
+    # Reject clients that send more requests than their fair share.
+    if cfg.rate_limit > 0:
+        FASTAPI_APP.extra["ratelimit"] = src.admission.RateLimiter(
+            cfg.rate_limit, cfg.rate_limit_burst)
+
+    # Optionally find the callbacks that block the event loop. The optional
+    # subsystems are only imported if enabled to keep the cold start short.
+    if cfg.loop_monitor_interval > 0:
+        from src.loopmon import LoopMonitor
+        loopmon = LoopMonitor(
+            cfg.loop_monitor_interval, cfg.loop_monitor_threshold)
+        loopmon.start()
+        FASTAPI_APP.extra["loopmon"] = loopmon
+
+    # Pick up rotated K8s tokens and CA certificates.
+    if cfg.k8s_credentials is not None:
+        cfg.k8s_credentials.start()
+
+    # Create a K8s session for every additional cluster. Use a hard abort if
+    # that fails, just like for our own cluster.
+    if cfg.clusters_file is not None:
+        from src.clusters import create_clusters
+        clusters, err = create_clusters(cfg)
+        assert not err
+        for cluster in clusters.values():
+            cluster.start()
+        FASTAPI_APP.extra["clusters"] = clusters
+
+    # Mirror the K8s namespaces in memory so that requests need not hit the
+    # K8s API.
+    informer: Union[src.informer.Informer, "SharedInformer"]
+    informer = src.informer.Informer(
+        cfg.k8s_session, cfg.k8s_url, "/api/v1/namespaces", metadata_only=True)
+
+    # Resume from the last snapshot instead of listing all namespaces again.
+    if cfg.snapshot_dir is not None:
+        from src.snapshot import Snapshotter
+        snapshot = Snapshotter(informer, cfg.snapshot_dir, cfg.snapshot_interval)
+        snapshot.restore()
+        snapshot.start()
+        FASTAPI_APP.extra["snapshot"] = snapshot
+
+    # Only one worker process needs to watch K8s if they can share the data.
+    if cfg.shared_cache_dir is not None:
+        from src.shared import SharedInformer
+        informer = SharedInformer(informer, cfg.shared_cache_dir)
+    informer.start()
+    FASTAPI_APP.extra["informer"] = informer
+
+    # Assess the readiness in the background instead of once per probe.
+    health = src.health.HealthMonitor(informer, cfg)
+    health.start()
+    FASTAPI_APP.extra["health"] = health
+
     logit.info("Bootstrapping complete")
 
 
@@ -47,25 +125,77 @@ async def shutdown_event():
     """Server shutdown."""
     logit.info("shutting down")
 
-    # Close the K8s session.
-    session = FASTAPI_APP.extra["config"].k8s_session
-    await session.close()
+    # Stop the namespace informer before we pull the session from under it.
+    await FASTAPI_APP.extra["health"].stop()
+    if "loopmon" in FASTAPI_APP.extra:
+        await FASTAPI_APP.extra["loopmon"].stop()
+    await FASTAPI_APP.extra["informer"].stop()
+    if "snapshot" in FASTAPI_APP.extra:
+        await FASTAPI_APP.extra["snapshot"].stop()
+
+    # Close the K8s sessions.
+    for cluster in FASTAPI_APP.extra.get("clusters", {}).values():
+        await cluster.stop()
+    cfg = FASTAPI_APP.extra["config"]
+    if cfg.k8s_credentials is not None:
+        await cfg.k8s_credentials.stop()
+    await cfg.k8s_session.close()
+
+    # Discard the live gauges of this worker process.
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
     logit.info("shutdown complete")
 
 
+# Compress the responses the endpoints did not compress themselves.
+FASTAPI_APP.add_middleware(src.responses.CompressMiddleware)
+
+# Reject excess requests before they do any work. The metrics middleware below
+# still counts them.
+FASTAPI_APP.add_middleware(src.admission.RateLimitMiddleware)
+
+
+@FASTAPI_APP.exception_handler(src.admission.Overloaded)
+async def overloaded_handler(request: Request, exc: src.admission.Overloaded):
+    """Tell the client to come back later if we shed its K8s call."""
+    return JSONResponse(
+        status_code=503,
+        content={"message": "Too many concurrent Kubernetes calls"},
+        headers={"retry-after": "1"},
+    )
+
+
+def route_template(request: Request) -> str:
+    """Return the path template of the route that served `request`.
+
+    Use this instead of the raw path as a metric label, lest every namespace
+    name in a URL creates a new time series.
+
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", "<unmatched>")
+
+
 @FASTAPI_APP.middleware("http")
 async def middleware(request: Request, call_next):
-    """Track access requests with Prometheus counter."""
+    """Track access requests with Prometheus metrics."""
+    start = time.perf_counter()
+    src.metrics.PROM_REQ_INFLIGHT.inc()
     try:
         response = await call_next(request)
     except Exception:
         logit.exception("An exception occurred")
-        return JSONResponse(
+        response = JSONResponse(
             status_code=418,
             content={"message": f"Oops! There goes a rainbow..."},
         )
+    finally:
+        src.metrics.PROM_REQ_INFLIGHT.dec()
 
-    # Count the request by path.
-    metric = src.metrics.PROM_REQ_CNT
-    metric.labels(request.method, request.url.path, response.status_code).inc(1)
+    # Streaming responses only count until their headers are ready.
+    path = route_template(request)
+    src.metrics.PROM_REQ_TIME.labels(request.method, path).observe(
+        time.perf_counter() - start)
+    src.metrics.PROM_REQ_CNT.labels(request.method, path, response.status_code).inc(1)
     return response
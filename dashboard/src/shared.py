@@ -0,0 +1,189 @@
+"""Share the data of one informer between all worker processes."""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from src.informer import Broadcaster, Informer
+
+# Convenience.
+logit = logging.getLogger("app")
+
+
+def write_atomic(fname: Path, data: bytes) -> None:
+    """Replace the content of `fname` with `data` in a single step.
+
+    Readers will either see the old or the new file, but never a partially
+    written one.
+
+    """
+    tmp = fname.with_name(f".{fname.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, fname)
+
+
+class SharedInformer(Broadcaster):
+    """Run `informer` in one worker and share its data with all others.
+
+    All workers compete for an exclusive lock on a file in `path`. The worker
+    that holds it becomes the leader, runs the actual informer and publishes
+    the namespace names to a file in `path` whenever they change. All other
+    workers merely load that file whenever its modification time changes.
+
+    The file also contains the wall clock time when the leader's informer
+    last heard from K8s. The leader republishes it at least every
+    `heartbeat_interval` seconds so that followers can report a stalled watch.
+
+    If the leader dies then the kernel releases its lock and another worker
+    will take over.
+
+    Subscribers receive ADDED and DELETED events for the difference between
+    consecutive versions.
+
+    """
+
+    def __init__(self, informer: Informer, path: Path, interval: float = 0.5,
+                 heartbeat_interval: float = 5):
+        super().__init__()
+        self.informer = informer
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.fname_lock = path / "informer.lock"
+        self.fname_data = path / "namespaces.json"
+        self.leader = False
+
+        # Set once we have data from either our own informer or the leader.
+        self.synced = asyncio.Event()
+
+        # Incremented whenever `names` changes.
+        self.version = 0
+
+        # The heartbeat of the leader's informer on our own monotonic clock.
+        self.heartbeat = 0.0
+
+        self._lock_fd: Optional[int] = None
+        self._published = -1
+        self._published_beat = 0.0
+        self._stamp: tuple = ()
+        self._names: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def names(self) -> List[str]:
+        """Return the sorted names of all resources.
+
+        This is the data that was last published (leader) or loaded (follower).
+
+        """
+        return self._names
+
+    def try_lock(self) -> bool:
+        """Return `True` if this worker holds the leader lock."""
+        if self._lock_fd is None:
+            self.fname_lock.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_fd = os.open(self.fname_lock, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def publish(self) -> None:
+        """Write the informer data to the shared file if it has changed.
+
+        Also rewrite it if the informer's heartbeat has advanced by at least
+        `heartbeat_interval` since the last time.
+
+        """
+        if not self.informer.synced.is_set():
+            return
+
+        # Convert the monotonic heartbeat into a wall clock time that other
+        # processes can interpret.
+        beat = time.time() - (time.monotonic() - self.informer.heartbeat)
+        changed = self._published != self.informer.version
+        if not changed and beat - self._published_beat < self.heartbeat_interval:
+            return
+
+        names = self.informer.names() if changed else self._names
+        data = {
+            "resourceVersion": self.informer.resource_version,
+            "heartbeat": beat,
+            "names": names,
+        }
+        write_atomic(self.fname_data, json.dumps(data).encode())
+        self._published = self.informer.version
+        self._published_beat = beat
+        if changed:
+            self.broadcast_diff(self._names, names)
+            self._names = names
+            self.version += 1
+        self.synced.set()
+
+    def load(self) -> None:
+        """Load the shared file if the leader has replaced it."""
+        # The leader replaces the file, ie a new inode or modification time
+        # means new data.
+        try:
+            st = self.fname_data.stat()
+        except FileNotFoundError:
+            return
+        stamp = (st.st_ino, st.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+
+        data = json.loads(self.fname_data.read_bytes())
+        self._stamp = stamp
+
+        # Map the leader's wall clock heartbeat onto our monotonic clock.
+        self.heartbeat = time.monotonic() - (time.time() - data["heartbeat"])
+
+        # The leader may have merely refreshed its heartbeat.
+        names = data["names"]
+        if names != self._names or not self.synced.is_set():
+            self.broadcast_diff(self._names, names)
+            self._names = names
+            self.version += 1
+        self.synced.set()
+
+    def step(self) -> None:
+        """Publish or load the shared data and take over as leader if possible."""
+        if not self.leader and self.try_lock():
+            logit.info(f"Worker {os.getpid()} now runs the shared informer")
+            self.leader = True
+            self.informer.start()
+
+        if self.leader:
+            self.publish()
+            self.heartbeat = self.informer.heartbeat
+        else:
+            self.load()
+
+    async def run(self) -> None:
+        """Periodically call `step` until cancelled."""
+        while True:
+            try:
+                self.step()
+            except Exception:
+                logit.exception("Could not synchronise the shared informer")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Run the synchronisation in a background task."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task, stop the informer and release the lock."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+        await self.informer.stop()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.leader = False
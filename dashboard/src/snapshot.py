@@ -0,0 +1,168 @@
+"""Persist the data of an informer across restarts.
+
+A snapshot holds the items of an informer and the resource version they
+reflect. An informer restored from a snapshot resumes its WATCH from that
+version instead of issuing a full LIST, which spares K8s a thundering herd
+when many replicas restart at once.
+
+The file layout is
+
+    header   magic, item count, length of the resource version, CRC32 of
+             everything after the header
+    version  the resource version, zero padded to a multiple of 4 bytes
+    offsets  `count + 1` unsigned 32 bit offsets into `records`
+    records  the compact JSON encoding of every item, sorted by name
+
+All integers use the native byte order because the snapshot is local to the
+node. The offsets let `load` slice the records straight out of a memory map.
+
+"""
+import asyncio
+import json
+import logging
+import mmap
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import src.decoders
+from src.informer import Informer
+from src.shared import write_atomic
+
+# Convenience.
+logit = logging.getLogger("app")
+
+# The last byte is the version of the format.
+MAGIC = b"K8SSNAP\x01"
+HEADER = struct.Struct("=8sIII")
+
+
+def dump(fname: Path, resource_version: str, items: Dict[str, dict]) -> None:
+    """Atomically write a snapshot of `items` at `resource_version` to `fname`."""
+    version = resource_version.encode()
+    version += b"\x00" * (-len(version) % 4)
+
+    records = [json.dumps(items[_], separators=(",", ":")).encode()
+               for _ in sorted(items)]
+    offsets = array("I", [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    body = version + offsets.tobytes() + b"".join(records)
+    header = HEADER.pack(
+        MAGIC, len(records), len(resource_version.encode()), zlib.crc32(body))
+    write_atomic(fname, header + body)
+
+
+def load(fname: Path) -> Tuple[Tuple[str, Dict[str, dict]], bool]:
+    """Return the resource version and the items of the snapshot in `fname`."""
+    try:
+        with fname.open("rb") as fd, \
+                mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _parse(mm), False
+    except FileNotFoundError:
+        return ("", {}), True
+    except (OSError, ValueError, KeyError) as e:
+        logit.error(f"Cannot load snapshot <{fname}>: {e!r}")
+        return ("", {}), True
+
+
+def _parse(mm: mmap.mmap) -> Tuple[str, Dict[str, dict]]:
+    """Return the resource version and the items of the snapshot in `mm`.
+
+    Raise `ValueError` if `mm` does not contain a valid snapshot.
+
+    """
+    if len(mm) < HEADER.size:
+        raise ValueError("truncated header")
+    magic, count, rv_len, crc = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError("unknown format")
+    with memoryview(mm) as view, view[HEADER.size:] as body:
+        if zlib.crc32(body) != crc:
+            raise ValueError("checksum mismatch")
+
+    pos = HEADER.size
+    resource_version = str(mm[pos:pos + rv_len], "utf8")
+    pos += rv_len + -rv_len % 4
+    offsets = array("I", mm[pos:pos + 4 * (count + 1)])
+    pos += 4 * (count + 1)
+
+    items = {}
+    for start, stop in zip(offsets, offsets[1:]):
+        obj = src.decoders.loads(mm[pos + start:pos + stop])
+        items[obj["metadata"]["name"]] = obj
+    return resource_version, items
+
+
+class Snapshotter:
+    """Restore `informer` from a snapshot and periodically save it again.
+
+    The snapshot lives in `path` and is rewritten every `interval` seconds
+    if the informer has changed, as well as once more when it stops.
+
+    """
+
+    def __init__(self, informer: Informer, path: Path, interval: float = 60):
+        self.informer = informer
+        self.fname = path / "namespaces.snap"
+        self.interval = interval
+
+        # The informer version we last restored or saved.
+        self._saved = -1
+        self._task: Optional[asyncio.Task] = None
+
+    def restore(self) -> bool:
+        """Populate the informer with the snapshot data, if there is any.
+
+        Must be called before the informer starts. It then resumes the WATCH
+        from the resource version of the snapshot.
+
+        """
+        (resource_version, items), err = load(self.fname)
+        if err or not resource_version:
+            return True
+
+        informer = self.informer
+        informer.items = items
+        informer.resource_version = resource_version
+        informer.version += 1
+        informer.synced.set()
+        self._saved = informer.version
+        logit.info(f"Restored {len(items)} items at resource version "
+                   f"{resource_version} from <{self.fname}>")
+        return False
+
+    def save(self) -> None:
+        """Write a snapshot if the informer has changed since the last one."""
+        informer = self.informer
+        if not informer.synced.is_set() or informer.version == self._saved:
+            return
+        dump(self.fname, informer.resource_version, informer.items)
+        self._saved = informer.version
+
+    async def run(self) -> None:
+        """Periodically call `save` until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.save()
+            except Exception:
+                logit.exception(f"Cannot write snapshot <{self.fname}>")
+
+    def start(self) -> None:
+        """Save the snapshot periodically in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task and save a final snapshot."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+        try:
+            self.save()
+        except OSError as e:
+            logit.error(f"Cannot write snapshot <{self.fname}>: {e}")
@@ -6,6 +6,9 @@ import pytest
 from starlette.testclient import TestClient
 
 import src
+import src.admission
+import src.cache
+import src.k8s
 import src.logstreams
 import src.main
 import src.metrics
@@ -30,6 +33,15 @@ async def get_exception():
     raise ValueError("Test exception")
 
 
+@pytest.fixture(autouse=True)
+def reset_k8s_cache():
+    """Disable the module wide K8s response cache, retries and bulkhead for every test."""
+    src.k8s.RESPONSE_CACHE = src.cache.ResponseCache(ttl=0, stale_ttl=0, max_entries=0)
+    src.k8s.CLIENT = src.k8s.Client()
+    src.k8s.BULKHEAD = src.admission.Bulkhead(limit=0, max_queue=0)
+    yield
+
+
 @pytest.fixture
 def client():
     """Return a fully configured FastAPI client.
@@ -0,0 +1,114 @@
+"""Encode K8s protobuf documents to emulate K8s in tests and benchmarks.
+
+The field numbers are those of the K8s `.proto` files and deliberately not
+taken from `src.protobuf`, so that the tests also verify them.
+
+"""
+import json
+import struct
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+MAGIC = b"k8s\x00"
+CONTENT_TYPE = "application/vnd.kubernetes.protobuf"
+
+Value = Union[int, str, bytes]
+
+
+def encode_varint(value: int) -> bytes:
+    """Return the varint encoding of the non-negative `value`."""
+    ret = bytearray()
+    while value >= 0x80:
+        ret.append(value & 0x7F | 0x80)
+        value >>= 7
+    ret.append(value)
+    return bytes(ret)
+
+
+def encode_message(items: Iterable[Tuple[int, Value]]) -> bytes:
+    """Return the message with the `(field number, value)` pairs in `items`.
+
+    Integers become varints, strings and bytes length delimited fields.
+
+    """
+    ret = bytearray()
+    for num, value in items:
+        if isinstance(value, int):
+            ret += encode_varint(num << 3) + encode_varint(value)
+        else:
+            data = value.encode() if isinstance(value, str) else value
+            ret += encode_varint(num << 3 | 2) + encode_varint(len(data)) + data
+    return bytes(ret)
+
+
+def encode_map(num: int, data: Dict[str, str]) -> List[Tuple[int, Value]]:
+    """Return the map field `num` with all entries in `data`."""
+    return [(num, encode_message([(1, k), (2, v)])) for k, v in data.items()]
+
+
+def encode_object_meta(meta: Dict[str, Any]) -> bytes:
+    """Return the `ObjectMeta` message for the JSON `metadata` dict `meta`.
+
+    Supports the fields of `src.decoders.META_FIELDS`, annotations and
+    managed fields.
+
+    """
+    names = {1: "name", 3: "namespace", 5: "uid", 6: "resourceVersion"}
+    items: List[Tuple[int, Value]] = [
+        (num, meta[name]) for num, name in names.items() if name in meta
+    ]
+    items += encode_map(11, meta.get("labels", {}))
+    items += encode_map(12, meta.get("annotations", {}))
+    for entry in meta.get("managedFields", []):
+        fields_v1 = encode_message([(1, json.dumps(entry.get("fieldsV1", {})))])
+        items.append((17, encode_message([
+            (1, entry.get("manager", "")),
+            (2, entry.get("operation", "")),
+            (3, entry.get("apiVersion", "")),
+            (6, entry.get("fieldsType", "")),
+            (7, fields_v1),
+        ])))
+    return encode_message(items)
+
+
+def encode_namespace(manifest: Dict[str, Any]) -> bytes:
+    """Return the `Namespace` message for the JSON `manifest`."""
+    spec = encode_message(
+        [(1, _) for _ in manifest.get("spec", {}).get("finalizers", [])])
+    status = encode_message(
+        [(1, manifest.get("status", {}).get("phase", ""))])
+    return encode_message([
+        (1, encode_object_meta(manifest["metadata"])), (2, spec), (3, status),
+    ])
+
+
+def encode_document(kind: str, raw: bytes) -> bytes:
+    """Return the K8s protobuf document for the encoded object `raw`."""
+    type_meta = encode_message([(1, "v1"), (2, kind)])
+    return MAGIC + encode_message([(1, type_meta), (2, raw), (4, CONTENT_TYPE)])
+
+
+def encode_list(kind: str, items: Iterable[bytes], meta: Dict[str, Any]) -> bytes:
+    """Return the K8s protobuf LIST document with the encoded `items`."""
+    names = {2: "resourceVersion", 3: "continue", 4: "remainingItemCount"}
+    list_meta = encode_message(
+        [(num, meta[name]) for num, name in names.items() if name in meta])
+    raw = encode_message([(1, list_meta)] + [(2, _) for _ in items])
+    return encode_document(kind, raw)
+
+
+def encode_status(code: int, message: str, reason: str) -> bytes:
+    """Return the K8s protobuf document of a `Status`."""
+    return encode_document("Status", encode_message(
+        [(2, "Failure"), (3, message), (4, reason), (6, code)]))
+
+
+def encode_watch_frame(etype: str, doc: bytes) -> bytes:
+    """Return the length prefixed watch frame for the K8s protobuf `doc`."""
+    raw_ext = encode_message([(1, doc)])
+    event = encode_message([(1, etype), (2, raw_ext)])
+    return struct.pack(">I", len(event)) + event
+
+
+def namespace_list(manifests: List[dict], meta: Dict[str, Any]) -> bytes:
+    """Return the K8s protobuf `NamespaceList` for the JSON `manifests`."""
+    return encode_list("NamespaceList", [encode_namespace(_) for _ in manifests], meta)
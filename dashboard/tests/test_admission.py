@@ -0,0 +1,199 @@
+import asyncio
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import src.admission
+import src.cache
+import src.k8s
+import src.metrics
+import src.server
+from src.admission import Bulkhead, Overloaded, RateLimiter
+from src.models import Config, K8sObject
+
+# Convenience.
+K8S_URL = os.environ["KUBERNETES_SERVICE_HOST"]
+
+
+def admission_events(outcome: str) -> float:
+    return src.metrics.PROM_K8S_ADMISSION.labels(outcome)._value.get()
+
+
+class TestRateLimiter:
+    def test_acquire(self):
+        """Must admit bursts and then refill the bucket at the configured rate."""
+        limiter = RateLimiter(rate=2, burst=3)
+        limiter.now = 0                                    # type: ignore
+        limiter.clock = lambda: limiter.now                # type: ignore
+
+        assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire("a") == 0.5
+
+        # Other clients have their own bucket.
+        assert limiter.acquire("b") == 0
+
+        # Must refill the bucket over time, but never beyond the burst size.
+        limiter.now = 0.5                                  # type: ignore
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("a") == 0.5
+        limiter.now = 100                                  # type: ignore
+        assert [limiter.acquire("a") for _ in range(4)] == [0, 0, 0, 0.5]
+
+    def test_max_clients(self):
+        """Must forget the clients it has not seen for the longest time."""
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+        limiter.clock = lambda: 0                          # type: ignore
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("b") == 0
+        assert limiter.acquire("c") == 0
+        assert len(limiter) == 2
+
+        # "a" starts with a full bucket again whereas "c" does not.
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("c") == 1
+
+    def test_client_key(self):
+        """Must identify clients by their address or the configured header."""
+        key = src.admission.client_key
+        scope = {
+            "type": "http",
+            "client": ("10.0.0.1", 1234),
+            "headers": [(b"x-forwarded-for", b"6.6.6.6, 5.6.7.8, 10.0.0.2")],
+        }
+        assert key(scope) == "10.0.0.1"
+        assert key(scope, "X-Real-IP") == "10.0.0.1"
+        assert key({"type": "http", "headers": []}) == ""
+
+        # Must only trust the entries our own proxies appended, not the ones
+        # the client made up.
+        assert key(scope, "X-Forwarded-For") == "10.0.0.2"
+        assert key(scope, "X-Forwarded-For", trusted_hops=2) == "5.6.7.8"
+        assert key(scope, "X-Forwarded-For", trusted_hops=4) == "10.0.0.1"
+        assert key(scope, "X-Forwarded-For", trusted_hops=0) == "10.0.0.1"
+
+
+class TestRateLimitMiddleware:
+    def test_reject(self, client):
+        """Must reject excess requests with 429 but never the probes."""
+        app = src.server.FASTAPI_APP
+        limiter = RateLimiter(rate=0.5, burst=1)
+        limiter.clock = lambda: 0                          # type: ignore
+        cfg = app.extra["config"].copy(update={"rate_limit_header": "X-Forwarded-For"})
+        rejected = src.metrics.PROM_RATE_LIMITED._value.get()
+
+        headers = {"x-forwarded-for": "1.2.3.4"}
+        with mock.patch.dict(app.extra, {"config": cfg, "ratelimit": limiter}):
+            assert client.get("/does/not/exist", headers=headers).status_code == 404
+            resp = client.get("/does/not/exist", headers=headers)
+            assert resp.status_code == 429
+            assert resp.headers["retry-after"] == "2"
+            assert src.metrics.PROM_RATE_LIMITED._value.get() == rejected + 1
+
+            # Other clients and the probes must be unaffected.
+            resp = client.get("/does/not/exist", headers={"x-forwarded-for": "5.6.7.8"})
+            assert resp.status_code == 404
+            assert client.get("/healthz", headers=headers).status_code == 200
+
+    def test_disabled(self, client):
+        """Must admit all requests without a rate limiter."""
+        assert "ratelimit" not in src.server.FASTAPI_APP.extra
+        for _ in range(50):
+            assert client.get("/healthz").status_code == 200
+
+
+@pytest.mark.asyncio
+class TestBulkhead:
+    async def test_slot(self):
+        """Must queue calls beyond the limit and shed them once the queue is full."""
+        bulkhead = Bulkhead(limit=1, max_queue=1)
+        shed = admission_events("shed")
+        release = asyncio.Event()
+
+        async def call():
+            async with bulkhead.slot():
+                await release.wait()
+
+        first = asyncio.create_task(call())
+        second = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        assert bulkhead.waiting == 1
+        assert src.metrics.PROM_K8S_QUEUED._value.get() == 1
+
+        # Must reject further calls right away.
+        with pytest.raises(Overloaded):
+            async with bulkhead.slot():
+                pass
+        assert admission_events("shed") == shed + 1
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert bulkhead.waiting == 0
+        assert src.metrics.PROM_K8S_QUEUED._value.get() == 0
+
+        # Must release the slot if the caller is cancelled while it waits.
+        release.clear()
+        first = asyncio.create_task(call())
+        second = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        second.cancel()
+        await asyncio.wait([second])
+        assert bulkhead.waiting == 0
+        release.set()
+        await first
+        async with bulkhead.slot():
+            pass
+
+    async def test_disabled(self):
+        """Must admit any number of calls if the limit is zero."""
+        bulkhead = Bulkhead(limit=0, max_queue=0)
+        release = asyncio.Event()
+
+        async def call():
+            async with bulkhead.slot():
+                await release.wait()
+
+        tasks = [asyncio.create_task(call()) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+
+    async def test_get_objects(self):
+        """Must serve stale data for shed calls and raise without any."""
+        src.k8s.RESPONSE_CACHE = src.cache.ResponseCache(
+            ttl=0, stale_ttl=0, max_entries=10)
+        src.k8s.BULKHEAD = Bulkhead(limit=1, max_queue=0)
+        fallback = admission_events("fallback")
+
+        # Occupy the only slot.
+        async with src.k8s.BULKHEAD.slot():
+            with pytest.raises(Overloaded):
+                await src.k8s.get_objects(None, K8S_URL, "namespaces")
+
+            objs = [K8sObject(name="foo")]
+            src.k8s.RESPONSE_CACHE.put(K8S_URL + "/api/v1/namespaces", objs)
+            ret = await src.k8s.get_objects(None, K8S_URL, "namespaces")
+            assert ret == (objs, False)
+            assert admission_events("fallback") == fallback + 1
+
+    async def test_configure(self):
+        """`configure` must setup the module wide bulkhead from the `Config`."""
+        cfg = Config(
+            k8s_session=None,
+            k8s_url="https://" + K8S_URL,
+            k8s_creds_path=Path("tests/support"),
+            k8s_max_concurrency=3,
+            k8s_max_queue=7,
+        )
+        src.k8s.configure(cfg)
+        assert (src.k8s.BULKHEAD.limit, src.k8s.BULKHEAD.max_queue) == (3, 7)
+
+
+class TestOverloaded:
+    def test_handler(self, client):
+        """Endpoints must respond with 503 if we shed their K8s call."""
+        with mock.patch.object(src.k8s, "get_resources", side_effect=Overloaded("busy")):
+            resp = client.get("/k8s-resources")
+        assert resp.status_code == 503
+        assert resp.headers["retry-after"] == "1"
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+import src.cache
+import src.metrics
+from src.cache import ResponseCache
+
+
+def cache_events(event: str) -> float:
+    """Return the current value of the cache counter for `event`."""
+    return src.metrics.PROM_K8S_CACHE.labels(event)._value.get()
+
+
+class Fetcher:
+    """Return `(value, err)` tuples from a script and count the calls."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        ret = self.results.pop(0)
+        if isinstance(ret, Exception):
+            raise ret
+        return ret
+
+
+@pytest.fixture
+def cache():
+    """Return a cache whose clock we control."""
+    cache = ResponseCache(ttl=10, stale_ttl=20, max_entries=2)
+    cache.now = 0                                      # type: ignore
+    cache.clock = lambda: cache.now                    # type: ignore
+    yield cache
+
+
+@pytest.mark.asyncio
+class TestResponseCache:
+    async def test_disabled(self):
+        """Must always call through if the cache holds no entries."""
+        cache = ResponseCache(ttl=10, stale_ttl=10, max_entries=0)
+        fetch = Fetcher(("a", False), ("b", False))
+
+        assert await cache.get("key", fetch) == ("a", False)
+        assert await cache.get("key", fetch) == ("b", False)
+        assert len(cache) == 0
+
+    async def test_fresh(self, cache):
+        """Must serve fresh entries from the cache."""
+        fetch = Fetcher(("a", False))
+        hit, miss = cache_events("hit"), cache_events("miss")
+
+        assert await cache.get("key", fetch) == ("a", False)
+        cache.now = 9
+        assert await cache.get("key", fetch) == ("a", False)
+
+        assert fetch.calls == 1
+        assert cache_events("hit") == hit + 1
+        assert cache_events("miss") == miss + 1
+
+    async def test_errors_not_cached(self, cache):
+        """Must not cache errors."""
+        fetch = Fetcher(("err", True), ("a", False))
+
+        assert await cache.get("key", fetch) == ("err", True)
+        assert await cache.get("key", fetch) == ("a", False)
+        assert fetch.calls == 2
+
+    async def test_stale_while_revalidate(self, cache):
+        """Must serve stale entries and refresh them in the background."""
+        fetch = Fetcher(("a", False), ("b", False))
+        stale = cache_events("stale")
+
+        assert await cache.get("key", fetch) == ("a", False)
+
+        # Must return the stale value immediately and only start a single
+        # refresh, no matter how many callers see the stale entry.
+        cache.now = 15
+        assert await cache.get("key", fetch) == ("a", False)
+        assert await cache.get("key", fetch) == ("a", False)
+        assert cache_events("stale") == stale + 2
+
+        # Wait for the background refresh.
+        await asyncio.gather(*cache._tasks)
+        assert fetch.calls == 2
+        assert cache._refreshing == set()
+
+        # The refreshed entry is fresh again.
+        assert await cache.get("key", fetch) == ("b", False)
+        assert fetch.calls == 2
+
+    async def test_stale_refresh_failure(self, cache):
+        """Must retain the stale entry if the refresh failed."""
+        fetch = Fetcher(("a", False), ("err", True), ValueError("boom"))
+
+        assert await cache.get("key", fetch) == ("a", False)
+        cache.now = 15
+        for _ in range(2):
+            assert await cache.get("key", fetch) == ("a", False)
+            await asyncio.gather(*cache._tasks)
+        assert fetch.calls == 3
+
+    async def test_expired(self, cache):
+        """Must fetch a new value once the entry is too stale to be useful."""
+        fetch = Fetcher(("a", False), ("b", False))
+
+        assert await cache.get("key", fetch) == ("a", False)
+        cache.now = 30
+        assert await cache.get("key", fetch) == ("b", False)
+        assert fetch.calls == 2
+
+    async def test_lru_eviction(self, cache):
+        """Must evict the least recently used entries."""
+        evict = cache_events("evict")
+
+        await cache.get("a", Fetcher((1, False)))
+        await cache.get("b", Fetcher((2, False)))
+        assert await cache.get("a", Fetcher()) == (1, False)
+
+        # Inserting "c" must evict "b" because we just used "a".
+        await cache.get("c", Fetcher((3, False)))
+        assert list(cache._entries) == ["a", "c"]
+        assert cache_events("evict") == evict + 1
+
+        cache.clear()
+        assert len(cache) == 0
+
+    async def test_peek(self, cache):
+        """Must return entries no matter their age."""
+        assert cache.peek("key") is None
+        await cache.get("key", Fetcher(("a", False)))
+        cache.now = 1000
+        assert cache.peek("key") == "a"
@@ -0,0 +1,162 @@
+import asyncio
+import os
+from pathlib import Path
+
+import aiohttp
+import pytest
+import yaml
+from aioresponses import aioresponses
+
+import src.clusters
+import src.k8s
+from src.models import Config
+
+SUPPORT = Path("tests/support").absolute()
+
+
+def write_kubeconfig(path: Path, names=("a", "b")) -> Path:
+    """Write a kubeconfig with one context per cluster name to `path`."""
+    (path / "creds").mkdir(exist_ok=True)
+    for name in ("ca.crt", "token"):
+        (path / "creds" / name).write_bytes((SUPPORT / name).read_bytes())
+
+    conf = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [
+            {"name": f"cluster-{_}", "cluster": {
+                "server": f"https://{_}.example.com/",
+                "certificate-authority": "creds/ca.crt",
+            }} for _ in names
+        ],
+        "users": [{"name": "user", "user": {"tokenFile": str(path / "creds/token")}}],
+        "contexts": [
+            {"name": _, "context": {"cluster": f"cluster-{_}", "user": "user"}}
+            for _ in names
+        ],
+    }
+    fname = path / "kubeconfig.yaml"
+    fname.write_text(yaml.safe_dump(conf))
+    return fname
+
+
+def make_config(**kwargs) -> Config:
+    return Config(
+        k8s_session=None,
+        k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+        k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+        **kwargs,
+    )
+
+
+class TestLoadKubeconfig:
+    def test_load_ok(self, tmp_path):
+        """Must return one cluster per context and resolve relative paths."""
+        specs, err = src.clusters.load_kubeconfig(write_kubeconfig(tmp_path))
+        assert not err
+        assert [_.name for _ in specs] == ["a", "b"]
+        assert specs[0].url == "https://a.example.com"
+        assert specs[0].fname_cert == tmp_path / "creds/ca.crt"
+        assert specs[0].fname_token == tmp_path / "creds/token"
+
+    def test_load_empty(self, tmp_path):
+        """A kubeconfig without contexts has no clusters."""
+        fname = tmp_path / "kubeconfig.yaml"
+        fname.write_text("apiVersion: v1\n")
+        assert src.clusters.load_kubeconfig(fname) == ([], False)
+
+    def test_load_err(self, tmp_path):
+        """Must reject missing, malformed and unsupported files."""
+        fname = tmp_path / "kubeconfig.yaml"
+        assert src.clusters.load_kubeconfig(fname) == ([], True)
+
+        for text in ("[", "[]", "contexts: [{name: a}]"):
+            fname.write_text(text)
+            assert src.clusters.load_kubeconfig(fname) == ([], True)
+
+        # Inline credentials.
+        conf = yaml.safe_load(write_kubeconfig(tmp_path).read_text())
+        conf["users"][0]["user"] = {"token": "secret"}
+        fname.write_text(yaml.safe_dump(conf))
+        assert src.clusters.load_kubeconfig(fname) == ([], True)
+
+
+@pytest.mark.asyncio
+class TestClusters:
+    async def test_create_clusters(self, tmp_path):
+        """Every cluster must have its own session, cache, client and bulkhead."""
+        cfg = make_config(clusters_file=write_kubeconfig(tmp_path), k8s_cache_size=10,
+                          k8s_max_concurrency=3)
+        clusters, err = src.clusters.create_clusters(cfg)
+        assert not err and list(clusters) == ["a", "b"]
+
+        a, b = clusters["a"], clusters["b"]
+        assert a.cfg.k8s_url == "https://a.example.com"
+        assert a.cfg.k8s_session is not b.cfg.k8s_session
+        assert a.cfg.k8s_credentials.fname_token == tmp_path / "creds/token"
+        assert (a.cache, a.client) != (b.cache, b.client)
+        assert a.cache.max_entries == 10
+        assert a.client.bulkhead is not None and b.client.bulkhead is not None
+        assert a.client.bulkhead is not b.client.bulkhead
+        assert a.client.bulkhead.limit == 3
+
+        for cluster in clusters.values():
+            cluster.start()
+            assert cluster.cfg.k8s_credentials._task is not None
+            await cluster.stop()
+            assert cluster.cfg.k8s_credentials._task is None
+            assert cluster.cfg.k8s_session.closed
+
+    async def test_create_clusters_none(self, tmp_path):
+        """No cluster file means no additional clusters."""
+        assert src.clusters.create_clusters(make_config()) == ({}, False)
+
+    async def test_create_clusters_err(self, tmp_path):
+        """Must fail if the file is invalid or any credentials are missing."""
+        cfg = make_config(clusters_file=tmp_path / "does-not-exist")
+        assert src.clusters.create_clusters(cfg) == ({}, True)
+
+        cfg = make_config(clusters_file=write_kubeconfig(tmp_path))
+        (tmp_path / "creds" / "token").unlink()
+        assert src.clusters.create_clusters(cfg) == ({}, True)
+
+    async def test_query_all(self):
+        """Must report failed and slow clusters without waiting for them."""
+        async def query(cluster):
+            if cluster.name == "slow":
+                await asyncio.sleep(10)
+            if cluster.name == "raises":
+                raise ValueError("bug")
+            return cluster.name.upper(), cluster.name == "broken"
+
+        clusters = {_: src.clusters.Cluster(_, make_config())
+                    for _ in ("ok", "broken", "raises", "slow")}
+        data, errors = await src.clusters.query_all(clusters, query, timeout=0.05)
+        assert data == {"ok": "OK"}
+        assert errors == {"broken": "error", "raises": "error", "slow": "timeout"}
+
+        # A timeout of zero waits indefinitely.
+        del clusters["slow"], clusters["raises"]
+        data, errors = await src.clusters.query_all(clusters, query, timeout=0)
+        assert (data, errors) == ({"ok": "OK"}, {"broken": "error"})
+
+    async def test_independent_breakers(self):
+        """A broken cluster must not open the circuit breaker of the others."""
+        cfg = make_config(k8s_retries=0, k8s_breaker_threshold=1)
+        clusters = {_: src.clusters.Cluster(_, cfg) for _ in ("a", "b")}
+        url = "https://{}.example.com/api/v1/namespaces?limit=500"
+
+        with aioresponses() as m:
+            m.get(url.format("a"), status=500)
+            m.get(url.format("b"), payload={"metadata": {}, "items": []}, repeat=True)
+
+            async with aiohttp.ClientSession() as sess:
+                for name, cluster in clusters.items():
+                    _, err = await src.k8s.get_namespaces(
+                        sess, f"https://{name}.example.com",
+                        cache=cluster.cache, client=cluster.client)
+                    assert err is (name == "a")
+
+        assert clusters["a"].client.breaker.is_open
+        assert not clusters["b"].client.breaker.is_open
+        assert not src.k8s.CLIENT.breaker.is_open
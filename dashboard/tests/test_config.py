@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+from unittest import mock
+
+import src.config
+
+
+class TestConfig:
+    def test_load_config_default(self):
+        """Must compile a `Config` with the default values."""
+        with mock.patch.dict("os.environ"):
+            os.environ.pop("SHARED_CACHE_DIR", None)
+            os.environ.pop("SNAPSHOT_DIR", None)
+            cfg, err = src.config.load_config()
+        assert not err and cfg is not None
+
+        assert cfg.k8s_session is None
+        assert cfg.k8s_url == "https://" + os.environ["KUBERNETES_SERVICE_HOST"]
+        assert cfg.k8s_creds_path == Path(os.environ["K8S_CREDENTIALS_PATH"])
+        assert cfg.k8s_cache_size == 256
+        assert cfg.shared_cache_dir is None
+        assert cfg.snapshot_dir is None
+        assert cfg.rate_limit == 0 and cfg.rate_limit_header is None
+
+    def test_load_config_custom(self):
+        """Must parse the optional environment variables."""
+        new_env = {
+            "K8S_JSON_DECODER": "stdlib",
+            "K8S_PROTOBUF": "true",
+            "K8S_CACHE_TTL": "1.5",
+            "K8S_POOL_SIZE": "7",
+            "SHARED_CACHE_DIR": "/tmp/shared",
+            "SNAPSHOT_DIR": "/tmp/snapshot",
+            "SNAPSHOT_INTERVAL": "5",
+            "K8S_MAX_CONCURRENCY": "10",
+            "RATE_LIMIT": "2.5",
+            "RATE_LIMIT_HEADER": "X-Forwarded-For",
+            "RATE_LIMIT_TRUSTED_HOPS": "2",
+        }
+        with mock.patch.dict("os.environ", values=new_env):
+            cfg, err = src.config.load_config()
+        assert not err and cfg is not None
+
+        assert cfg.k8s_json_decoder == "stdlib"
+        assert cfg.k8s_protobuf is True
+        assert cfg.k8s_cache_ttl == 1.5
+        assert cfg.k8s_pool_size == 7
+        assert cfg.shared_cache_dir == Path("/tmp/shared")
+        assert cfg.snapshot_dir == Path("/tmp/snapshot")
+        assert cfg.snapshot_interval == 5
+        assert cfg.k8s_max_concurrency == 10
+        assert cfg.rate_limit == 2.5
+        assert cfg.rate_limit_header == "X-Forwarded-For"
+        assert cfg.rate_limit_trusted_hops == 2
+
+    def test_load_config_err(self):
+        """Must return an error for missing or invalid environment variables."""
+        with mock.patch.dict("os.environ", values={}, clear=True):
+            assert src.config.load_config() == (None, True)
+
+        with mock.patch.dict("os.environ", values={"K8S_POOL_SIZE": "foo"}):
+            assert src.config.load_config() == (None, True)
+
+        # The loop monitor would check for stalls in a busy loop.
+        for value in ("0", "-1"):
+            env = {"LOOP_MONITOR_THRESHOLD": value}
+            with mock.patch.dict("os.environ", values=env):
+                assert src.config.load_config() == (None, True)
@@ -0,0 +1,118 @@
+import json
+from unittest import mock
+
+import pytest
+
+import src.decoders
+
+# A list response with two items that have more fields than we care about.
+LIST_RESPONSE: dict = {
+    "kind": "NamespaceList",
+    "apiVersion": "v1",
+    "metadata": {"resourceVersion": "123", "continue": "token"},
+    "items": [
+        {
+            "metadata": {
+                "name": "foo",
+                "uid": "uid-foo",
+                "resourceVersion": "12",
+                "labels": {"app": "foo"},
+                "annotations": {"note": "dropped"},
+                "managedFields": [{"manager": "kubectl"}],
+            },
+            "spec": {"finalizers": ["kubernetes"]},
+            "status": {"phase": "Active"},
+        },
+        {"metadata": {"name": "bar", "namespace": "ns"}},
+    ],
+}
+
+
+@pytest.fixture(params=src.decoders.available())
+def backend(request):
+    """Run the test once with every installed backend."""
+    with mock.patch.object(src.decoders, "BACKEND", request.param):
+        yield request.param
+
+
+class TestDecoders:
+    def test_available(self):
+        """Must list all backends, fastest first."""
+        assert src.decoders.available() == ["msgspec", "orjson", "stdlib"]
+
+    def test_select(self):
+        """Select backends by name."""
+        with mock.patch.object(src.decoders, "BACKEND", "stdlib"):
+            assert src.decoders.select("auto") is False
+            assert src.decoders.BACKEND == src.decoders.available()[0]
+
+            assert src.decoders.select("stdlib") is False
+            assert src.decoders.BACKEND == "stdlib"
+
+            # Must reject unknown backends.
+            assert src.decoders.select("invalid") is True
+            assert src.decoders.BACKEND == "stdlib"
+
+    def test_loads(self, backend):
+        """Every backend must fully decode the document."""
+        assert src.decoders.loads(json.dumps(LIST_RESPONSE).encode()) == LIST_RESPONSE
+
+    def test_project(self):
+        """Must only retain the supported metadata fields."""
+        assert src.decoders.project(LIST_RESPONSE["items"][0]) == {
+            "metadata": {
+                "name": "foo",
+                "uid": "uid-foo",
+                "resourceVersion": "12",
+                "labels": {"app": "foo"},
+            },
+        }
+
+    def test_loads_list_metadata(self, backend):
+        """Every backend must produce the same projection of a LIST response."""
+        body = json.dumps(LIST_RESPONSE).encode()
+        assert src.decoders.loads_list_metadata(body) == {
+            "metadata": {"resourceVersion": "123", "continue": "token"},
+            "items": [
+                {
+                    "metadata": {
+                        "name": "foo",
+                        "uid": "uid-foo",
+                        "resourceVersion": "12",
+                        "labels": {"app": "foo"},
+                    },
+                },
+                {"metadata": {"name": "bar", "namespace": "ns"}},
+            ],
+        }
+
+        # Empty list.
+        body = b'{"metadata": {"resourceVersion": "1", "remainingItemCount": 5}, '
+        body += b'"items": []}'
+        assert src.decoders.loads_list_metadata(body) == {
+            "metadata": {"resourceVersion": "1", "remainingItemCount": 5}, "items": [],
+        }
+
+    def test_loads_table(self, backend):
+        """Must decode tables and fall back to plain LIST responses."""
+        table = {
+            "kind": "Table",
+            "metadata": {"resourceVersion": "123", "continue": "token"},
+            "columnDefinitions": [{"name": "Name", "type": "string"}],
+            "rows": [{"cells": ["foo"], "object": LIST_RESPONSE["items"][0]}],
+        }
+        foo = src.decoders.project(LIST_RESPONSE["items"][0])
+        assert src.decoders.loads_table(json.dumps(table).encode()) == {
+            "metadata": {"resourceVersion": "123", "continue": "token"},
+            "columns": ["Name"],
+            "items": [dict(foo, cells=["foo"])],
+        }
+
+        assert src.decoders.loads_table(json.dumps(LIST_RESPONSE).encode()) == {
+            "metadata": {"resourceVersion": "123", "continue": "token"},
+            "columns": [],
+            "items": [
+                dict(foo, cells=[]),
+                {"metadata": {"name": "bar", "namespace": "ns"}, "cells": []},
+            ],
+        }
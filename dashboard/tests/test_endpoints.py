@@ -1,7 +1,13 @@
+import time
 from unittest import mock
 
+import src.clusters
+import src.endpoints.k8s_resources
 import src.k8s
-from src.models import K8sNamespaces
+import src.responses
+from src.health import HealthMonitor
+from src.informer import Informer
+from src.models import K8sNamespaces, K8sObject, K8sResources
 
 
 class TestBasic:
@@ -15,6 +21,30 @@ class TestBasic:
         response = client.get("/healthz")
         assert response.status_code == 200
 
+    def test_readyz(self, client):
+        """Must report the latest assessment of the health monitor."""
+        # Not ready before the server started the health monitor.
+        resp = client.get("/readyz")
+        assert resp.status_code == 503
+        assert resp.json()["reasons"] == ["not started"]
+
+        informer = Informer(None, "", "/api/v1/namespaces")
+        health = HealthMonitor(informer, client.app.extra["config"])
+        client.app.extra["health"] = health
+        health.check(0)
+        resp = client.get("/readyz")
+        assert resp.status_code == 503
+        assert resp.json()["reasons"] == ["informer has not synced"]
+
+        # Must not re-assess the readiness per probe.
+        informer.synced.set()
+        informer.heartbeat = time.monotonic()
+        assert client.get("/readyz").status_code == 503
+        health.check(0)
+        resp = client.get("/readyz")
+        assert resp.status_code == 200
+        assert resp.json()["ready"] is True
+
 
 class TestK8sNamespaces:
     @mock.patch.object(src.k8s, "get_namespaces")
@@ -40,3 +70,287 @@ class TestK8sNamespaces:
         assert response.status_code == 422
         assert m_getk8sres.called_once_with(client.app.extra["config"])
         assert response.json() == K8sNamespaces(namespaces=[])
+
+    @mock.patch.object(src.k8s, "get_namespaces")
+    def test_get_k8s_namespaces_informer(self, m_getk8sres, client):
+        """Must serve the namespaces from the informer once it has synced."""
+        informer = Informer(None, "", "/api/v1/namespaces")
+        informer.apply("ADDED", {"metadata": {"name": "foo", "resourceVersion": "1"}})
+        informer.apply("ADDED", {"metadata": {"name": "bar", "resourceVersion": "2"}})
+        client.app.extra["informer"] = informer
+
+        # Must query K8s directly until the informer has synced.
+        m_getk8sres.return_value = (K8sNamespaces(namespaces=["foo"]), False)
+        response = client.get("/k8s-namespaces")
+        assert response.status_code == 200
+        assert response.json() == {"namespaces": ["foo"]}
+        assert m_getk8sres.call_count == 1
+
+        # Must serve the data from memory once the informer has synced.
+        informer.synced.set()
+        response = client.get("/k8s-namespaces")
+        assert response.status_code == 200
+        assert response.json() == {"namespaces": ["bar", "foo"]}
+        assert m_getk8sres.call_count == 1
+
+    def test_get_k8s_namespaces_etag(self, client):
+        """Must serve pre-encoded bytes with an ETag and honour `If-None-Match`."""
+        informer = Informer(None, "", "/api/v1/namespaces")
+        informer.apply("ADDED", {"metadata": {"name": "foo", "resourceVersion": "1"}})
+        informer.synced.set()
+        client.app.extra["informer"] = informer
+
+        # Compress even the smallest response.
+        cfg = client.app.extra["config"]
+        client.app.extra["config"] = cfg.copy(update={"response_compress_min_size": 0})
+
+        # Must return the data with an ETag.
+        response = client.get("/k8s-namespaces", headers={"accept-encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.json() == {"namespaces": ["foo"]}
+        assert response.headers["content-encoding"] == "gzip"
+        etag = response.headers["etag"]
+        headers = {"If-None-Match": etag, "accept-encoding": "gzip"}
+
+        # Must not encode the response again if the data has not changed.
+        with mock.patch.object(src.responses, "encode") as m_encode:
+            response = client.get("/k8s-namespaces", headers=headers)
+            assert response.status_code == 304
+            assert not m_encode.called
+
+        # The ETag only matches the gzip version of the response.
+        response = client.get("/k8s-namespaces", headers={"If-None-Match": etag,
+                                                          "accept-encoding": "identity"})
+        assert response.status_code == 200
+
+        # Must return the new data once the informer has changed.
+        informer.apply("ADDED", {"metadata": {"name": "bar", "resourceVersion": "2"}})
+        response = client.get("/k8s-namespaces", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {"namespaces": ["bar", "foo"]}
+        assert response.headers["etag"] != etag
+
+
+class TestK8sResources:
+    @mock.patch.object(src.k8s, "get_resources")
+    def test_get_k8s_resources_ok(self, m_getres, client):
+        """Must parse the kinds and return partial results."""
+        cfg = client.app.extra["config"]
+        m_getres.return_value = K8sResources(
+            resources={"services": [K8sObject(name="foo", namespace="bar")]},
+            errors=["deployments"],
+        )
+
+        response = client.get("/k8s-resources?kinds=services, deployments,&namespace=bar")
+        assert response.status_code == 200
+        assert response.json() == {
+            "resources": {"services": [{"name": "foo", "namespace": "bar"}]},
+            "errors": ["deployments"],
+        }
+        m_getres.assert_called_once_with(
+            cfg.k8s_session, cfg.k8s_url, ["services", "deployments"], "bar",
+            cfg.k8s_list_concurrency,
+        )
+
+    @mock.patch.object(src.k8s, "get_resources")
+    def test_get_k8s_resources_cached(self, m_getres, client):
+        """Must only encode the response again once the resources changed."""
+        def get_resources(*args):
+            # Like `src.k8s.get_resources`, return the cached list itself and
+            # not a copy of it.
+            ret = K8sResources(resources={}, errors=[])
+            ret.resources["namespaces"] = objs
+            return ret
+
+        objs = [K8sObject(name="foo")]
+        m_getres.side_effect = get_resources
+
+        encode = src.responses.encode
+        with mock.patch.object(src.responses, "encode", wraps=encode) as m_enc:
+            first = client.get("/k8s-resources")
+            second = client.get("/k8s-resources")
+            assert m_enc.call_count == 1
+            assert first.content == second.content
+            assert first.headers["etag"] == second.headers["etag"]
+
+            # Clients that have the current version must get a 304.
+            etag = first.headers["etag"]
+            response = client.get("/k8s-resources", headers={"if-none-match": etag})
+            assert response.status_code == 304
+
+            # Must encode a new list even if it is equal to the old one.
+            objs = [K8sObject(name="foo")]
+            response = client.get("/k8s-resources")
+            assert m_enc.call_count == 2
+
+            objs = [K8sObject(name="bar")]
+            response = client.get("/k8s-resources")
+            assert m_enc.call_count == 3
+            assert response.json()["resources"]["namespaces"][0]["name"] == "bar"
+
+        # The OpenAPI docs must still describe the model.
+        schema = client.get("/openapi.json").json()
+        ref = schema["paths"]["/k8s-resources"]["get"]["responses"]["200"]
+        assert ref["content"]["application/json"]["schema"]["$ref"].endswith(
+            "/K8sResources")
+
+    @mock.patch.object(src.endpoints.k8s_resources, "MAX_ENCODED", 2)
+    @mock.patch.object(src.k8s, "get_resources")
+    def test_get_k8s_resources_cache_slots(self, m_getres, client):
+        """Must keep one encoded response per kinds and namespace."""
+        def get_resources(sess, url, kinds, namespace, concurrency):
+            ret = K8sResources(resources={}, errors=[])
+            for kind in kinds:
+                ret.resources[kind] = objs[namespace]
+            return ret
+
+        objs = {None: [K8sObject(name="foo")], "ns": [K8sObject(name="bar")]}
+        m_getres.side_effect = get_resources
+        cache = src.endpoints.k8s_resources.ENCODED
+        cache.clear()
+
+        encode = src.responses.encode
+        with mock.patch.object(src.responses, "encode", wraps=encode) as m_enc:
+            # Alternating between kinds and namespaces must not evict anything.
+            for _ in range(2):
+                client.get("/k8s-resources?kinds=namespaces")
+                client.get("/k8s-resources?kinds=namespaces&namespace=ns")
+            assert m_enc.call_count == 2
+            assert list(cache) == [(("namespaces",), None), (("namespaces",), "ns")]
+
+            # Must evict the least recently used combination.
+            client.get("/k8s-resources?kinds=namespaces")
+            client.get("/k8s-resources?kinds=services")
+            assert m_enc.call_count == 3
+            assert list(cache) == [(("namespaces",), None), (("services",), None)]
+
+        # Must keep the encoded lists alive, lest their `id` is reused.
+        assert cache[(("services",), None)].refs["services"] is objs[None]
+
+    @mock.patch.object(src.k8s, "get_resources")
+    def test_get_k8s_resources_err(self, m_getres, client):
+        """Must return an error if no kind could be queried."""
+        m_getres.return_value = K8sResources(resources={}, errors=["namespaces"])
+
+        response = client.get("/k8s-resources")
+        assert response.status_code == 422
+        kinds = ["namespaces", "services", "deployments"]
+        assert m_getres.call_args.args[2] == kinds
+
+
+class TestClusters:
+    def add_clusters(self, client, *names):
+        """Register clusters with the given `names` with the app."""
+        cfg = client.app.extra["config"]
+        clusters = {_: src.clusters.Cluster(_, cfg.copy(update={"k8s_url": _}))
+                    for _ in names}
+        client.app.extra["clusters"] = clusters
+        return clusters
+
+    def test_get_clusters(self, client):
+        """Must list the configured clusters, if any."""
+        assert client.get("/clusters").json() == {"clusters": []}
+        self.add_clusters(client, "b", "a")
+        assert client.get("/clusters").json() == {"clusters": ["a", "b"]}
+
+    @mock.patch.object(src.k8s, "get_namespaces")
+    def test_get_cluster_namespaces(self, m_getns, client):
+        """Must query every cluster with its own cache and client."""
+        clusters = self.add_clusters(client, "a", "b")
+
+        async def get_namespaces(sess, k8s_url, cache, client):
+            assert (cache, client) == (clusters[k8s_url].cache, clusters[k8s_url].client)
+            return K8sNamespaces(namespaces=[f"{k8s_url}-ns"]), k8s_url == "b"
+
+        m_getns.side_effect = get_namespaces
+        response = client.get("/clusters/k8s-namespaces")
+        assert response.status_code == 200
+        assert response.json() == {"clusters": {"a": ["a-ns"]}, "errors": {"b": "error"}}
+
+    @mock.patch.object(src.k8s, "get_resources")
+    def test_get_cluster_resources(self, m_getres, client):
+        """Must query every cluster and only report clusters without any data."""
+        cfg = client.app.extra["config"]
+        clusters = self.add_clusters(client, "a", "b")
+
+        async def get_resources(sess, k8s_url, kinds, namespace, concurrency,
+                                cache, client):
+            assert (kinds, namespace) == (["services", "deployments"], "bar")
+            assert concurrency == cfg.k8s_list_concurrency
+            assert client is clusters[k8s_url].client
+            if k8s_url == "b":
+                return K8sResources(resources={}, errors=kinds)
+            return K8sResources(resources={"services": []}, errors=["deployments"])
+
+        m_getres.side_effect = get_resources
+        response = client.get("/clusters/k8s-resources?kinds=services,deployments"
+                              "&namespace=bar")
+        assert response.status_code == 200
+        assert response.json() == {
+            "clusters": {"a": {"resources": {"services": []}, "errors": ["deployments"]}},
+            "errors": {"b": "error"},
+        }
+
+
+class TestK8sNamespacesSearch:
+    def informer(self, client, *names):
+        informer = Informer(None, "", "/api/v1/namespaces")
+        for name in names:
+            informer.apply("ADDED", {"metadata": {"name": name, "resourceVersion": "1"}})
+        informer.synced.set()
+        client.app.extra["informer"] = informer
+
+    def test_prefix_and_pages(self, client):
+        """Must filter and page the informer data."""
+        self.informer(client, "kube-public", "default", "kube-system", "kube-node")
+
+        response = client.get("/k8s-namespaces?prefix=kube-")
+        names = ["kube-node", "kube-public", "kube-system"]
+        assert response.json() == {"namespaces": names}
+
+        response = client.get("/k8s-namespaces?prefix=kube-&limit=2")
+        assert response.json() == {
+            "namespaces": ["kube-node", "kube-public"], "continue": "kube-public"}
+
+        response = client.get("/k8s-namespaces?prefix=kube-&limit=2&continue=kube-public")
+        assert response.status_code == 200 and "etag" in response.headers
+        assert response.json() == {"namespaces": ["kube-system"], "continue": ""}
+
+        assert client.get("/k8s-namespaces?limit=-1").status_code == 422
+
+    def test_pages_compressed(self, client):
+        """Must only compress pages with the coding the client accepts."""
+        self.informer(client, *[f"ns-{_:04d}" for _ in range(500)])
+
+        compress = src.responses.compress
+        with mock.patch.object(src.responses, "compress", wraps=compress) as m_comp:
+            response = client.get("/k8s-namespaces?prefix=ns-&limit=400",
+                                  headers={"accept-encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()["namespaces"]) == 400
+
+        # The endpoint must not compress the page itself, and the middleware
+        # only with gzip.
+        levels = [_.args[1:3] for _ in m_comp.call_args_list]
+        assert levels == [(0, 0), (6, 0)]
+
+    @mock.patch.object(src.k8s, "get_namespaces")
+    def test_selectors(self, m_getk8sres, client):
+        """Must ask K8s to apply the selectors, even if the informer has synced."""
+        self.informer(client, "foo")
+        cfg = client.app.extra["config"]
+        m_getk8sres.return_value = (K8sNamespaces(namespaces=["b", "a"]), False)
+
+        response = client.get("/k8s-namespaces?labelSelector=team%3Dx")
+        assert response.json() == {"namespaces": ["b", "a"]}
+        m_getk8sres.assert_called_once_with(cfg.k8s_session, cfg.k8s_url, "team=x", None)
+
+        # Must sort the K8s response before it pages it.
+        response = client.get("/k8s-namespaces?fieldSelector=x&limit=1")
+        assert response.json() == {"namespaces": ["a"], "continue": "a"}
+        assert m_getk8sres.call_args.args[3] == "x"
+
+        # Must not page errors.
+        m_getk8sres.return_value = (K8sNamespaces(namespaces=[]), True)
+        response = client.get("/k8s-namespaces?fieldSelector=x&limit=1")
+        assert response.status_code == 422
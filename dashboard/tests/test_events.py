@@ -0,0 +1,99 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+import src.endpoints.k8s_namespace_events as events
+from src.informer import Informer
+
+
+def make_informer(*names) -> Informer:
+    """Return a synced informer with namespaces `names`."""
+    informer = Informer(None, "", "/api/v1/namespaces")
+    for name in names:
+        informer.apply("ADDED", {"metadata": {"name": name, "resourceVersion": "1"}})
+    informer.synced.set()
+    return informer
+
+
+@pytest.mark.asyncio
+class TestNamespaceEvents:
+    async def test_sse(self):
+        """Must format server-sent events."""
+        assert events.sse("added", {"name": "foo"}) == (
+            'event: added\ndata: {"name": "foo"}\n\n'
+        )
+
+    async def test_event_stream(self):
+        """Must stream a snapshot followed by the changes."""
+        informer = make_informer("foo")
+        stream = events.event_stream(informer, maxsize=2, keepalive=0.01)
+
+        # Must only subscribe once the stream starts.
+        assert informer.subscribers == set()
+        assert await stream.__anext__() == events.sse("snapshot", {"namespaces": ["foo"]})
+        sub, = informer.subscribers
+        assert sub.maxsize == 2
+
+        # Idle stream.
+        assert await stream.__anext__() == ": keepalive\n\n"
+
+        # Changes.
+        informer.apply("ADDED", {"metadata": {"name": "bar", "resourceVersion": "2"}})
+        informer.apply("DELETED", {"metadata": {"name": "foo", "resourceVersion": "3"}})
+        assert await stream.__anext__() == (
+            events.sse("added", {"name": "bar"}) + events.sse("deleted", {"name": "foo"})
+        )
+
+        # Slow client: must receive a new snapshot after an overflow.
+        for name in ["a", "b", "c"]:
+            informer.apply("ADDED", {"metadata": {"name": name, "resourceVersion": "4"}})
+        assert await stream.__anext__() == events.sse(
+            "snapshot", {"namespaces": ["a", "b", "bar", "c"]})
+
+        # Closing the stream must remove the subscription.
+        await stream.aclose()
+        assert informer.subscribers == set()
+
+    async def test_event_stream_subscribe_error(self):
+        """Must not unsubscribe anything if the subscription failed."""
+        informer = mock.MagicMock()
+        informer.subscribe.side_effect = RuntimeError
+        stream = events.event_stream(informer, maxsize=2, keepalive=0.01)
+
+        with pytest.raises(RuntimeError):
+            await stream.__anext__()
+        informer.unsubscribe.assert_not_called()
+
+    async def test_endpoint(self):
+        """Must return a streaming response once the informer has synced."""
+        informer = make_informer("foo")
+        request = mock.MagicMock()
+        request.app.extra = {"config": mock.MagicMock(stream_buffer_size=5,
+                                                      stream_keepalive=10)}
+
+        # Service unavailable without an informer.
+        resp = await events.get_k8s_namespace_events(request)
+        assert resp.status_code == 503
+
+        # Service unavailable until the informer has synced.
+        request.app.extra["informer"] = informer
+        informer.synced.clear()
+        resp = await events.get_k8s_namespace_events(request)
+        assert resp.status_code == 503
+        assert informer.subscribers == set()
+
+        # Must not subscribe if the response is never sent.
+        informer.synced.set()
+        resp = await events.get_k8s_namespace_events(request)
+        assert resp.media_type == "text/event-stream"
+        del resp
+        assert informer.subscribers == set()
+
+        resp = await events.get_k8s_namespace_events(request)
+        chunk = await resp.body_iterator.__anext__()     # type: ignore
+        assert chunk == events.sse("snapshot", {"namespaces": ["foo"]})
+        sub, = informer.subscribers
+        assert sub.maxsize == 5
+        await resp.body_iterator.aclose()                # type: ignore
+        assert informer.subscribers == set()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+import src.k8s
+from src.health import HealthMonitor
+from src.informer import Informer
+from src.models import Config
+
+
+def make_monitor(**kwargs) -> HealthMonitor:
+    """Return a `HealthMonitor` with a fake clock and an informer that never ran."""
+    cfg = Config(
+        k8s_session=None,
+        k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+        k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+        **kwargs,
+    )
+    monitor = HealthMonitor(Informer(None, "", "/api/v1/namespaces"), cfg)
+    monitor.clock = lambda: 1000.0                 # type: ignore
+    return monitor
+
+
+class TestHealthMonitor:
+    def test_check(self):
+        """Must only be ready if synced, up to date and responsive."""
+        monitor = make_monitor(ready_max_watch_lag=60, ready_max_loop_lag=0.5)
+        informer = monitor.informer
+        assert not monitor.status.ready
+
+        status = monitor.check(0)
+        assert not status.ready and status.watch_lag is None
+        assert status.reasons == ["informer has not synced"]
+
+        informer.synced.set()
+        informer.heartbeat = 990
+        status = monitor.check(0.1)
+        assert status.ready and status.reasons == []
+        assert (status.synced, status.watch_lag, status.loop_lag) == (True, 10, 0.1)
+        assert monitor.status is status
+
+        # K8s has gone quiet and the event loop is slow.
+        informer.heartbeat = 900
+        status = monitor.check(2)
+        assert not status.ready
+        assert status.reasons == ["no news from K8s for 100.0s",
+                                  "event loop lags by 2.000s"]
+
+        # The circuit breaker must be reported but not affect the readiness.
+        informer.heartbeat = 990
+        src.k8s.CLIENT.breaker.opened_at = 1
+        status = monitor.check(0)
+        assert status.ready and status.breaker_open
+
+    def test_check_disabled(self):
+        """A zero limit must disable the respective check."""
+        monitor = make_monitor(ready_max_watch_lag=0, ready_max_loop_lag=0)
+        monitor.informer.synced.set()
+        assert monitor.check(100).ready
+
+    @pytest.mark.asyncio
+    async def test_start_stop(self):
+        """Must assess the readiness right away and then periodically."""
+        monitor = make_monitor(ready_interval=0.01)
+        monitor.clock = asyncio.get_running_loop().time   # type: ignore
+        await monitor.stop()
+
+        monitor.start()
+        assert monitor.status.reasons == ["informer has not synced"]
+        monitor.informer.synced.set()
+        monitor.informer.heartbeat = monitor.clock()
+        for _ in range(100):
+            if monitor.status.ready:
+                break
+            await asyncio.sleep(0.01)
+        assert monitor.status.ready and monitor.status.loop_lag >= 0
+
+        await monitor.stop()
+        assert monitor._task is None
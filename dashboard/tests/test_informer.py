@@ -0,0 +1,370 @@
+import asyncio
+import json
+import os
+import re
+import time
+from unittest import mock
+
+import aiohttp
+import pytest
+from aioresponses import aioresponses
+
+import src.admission
+import src.informer
+import src.k8s
+import src.metrics
+from src.informer import Broadcaster, Informer, Subscription
+
+# Convenience.
+K8S_URL = os.environ["KUBERNETES_SERVICE_HOST"]
+NS_URL = K8S_URL + "/api/v1/namespaces"
+LIST_URL = NS_URL + "?limit=500"
+WATCH_URL = re.compile(re.escape(NS_URL) + r"\?.*watch=1.*")
+
+
+def manifest(name: str, rv: str) -> dict:
+    """Return a minimal K8s namespace manifest."""
+    return {"metadata": {"name": name, "resourceVersion": rv}}
+
+
+def watch_body(*events) -> str:
+    """Return the body of a watch stream with all `events`."""
+    lines = [json.dumps({"type": etype, "object": obj}) for etype, obj in events]
+    return "\n".join(lines) + "\n"
+
+
+async def aiter_bytes(*chunks: bytes):
+    """Yield `chunks` like `aiohttp.StreamReader.iter_any`."""
+    for chunk in chunks:
+        yield chunk
+
+
+def list_payload(*names, rv="1") -> dict:
+    """Return the payload of a LIST call for all `names`."""
+    return {
+        "metadata": {"resourceVersion": rv},
+        "items": [manifest(_, rv) for _ in names],
+    }
+
+
+@pytest.mark.asyncio
+class TestInformer:
+    async def test_iter_lines(self):
+        """Must reassemble lines across chunk boundaries and skip empty ones."""
+        resp = mock.MagicMock()
+        resp.content.iter_any.return_value.__aiter__.return_value = [
+            b'{"a"', b': 1}\n\n{"b": 2}\n{"c"', b": 3}",
+        ]
+
+        lines = [_ async for _ in src.informer.iter_lines(resp)]
+        assert lines == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+
+    async def test_apply(self):
+        """Add, modify and delete resources with watch events."""
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces")
+        assert informer.names() == []
+
+        informer.apply("ADDED", manifest("foo", "1"))
+        informer.apply("ADDED", manifest("bar", "2"))
+        assert informer.names() == ["bar", "foo"]
+        assert informer.resource_version == "2"
+
+        informer.apply("MODIFIED", manifest("foo", "3"))
+        assert informer.items["foo"]["metadata"]["resourceVersion"] == "3"
+
+        # Bookmarks must only update the resource version.
+        informer.apply("BOOKMARK", {"metadata": {"resourceVersion": "4"}})
+        assert informer.names() == ["bar", "foo"]
+        assert informer.resource_version == "4"
+
+        informer.apply("DELETED", manifest("bar", "5"))
+        informer.apply("DELETED", manifest("does-not-exist", "6"))
+        assert informer.names() == ["foo"]
+        assert informer.resource_version == "6"
+
+    async def test_relist(self):
+        """LIST must replace the local state and mark the informer as synced."""
+        with aioresponses() as m:
+            # Two pages that must be combined.
+            page = list_payload("foo", rv="10")
+            page["metadata"]["continue"] = "token"
+            m.get(LIST_URL, payload=page)
+            m.get(LIST_URL + "&continue=token", payload=list_payload("bar", rv="11"))
+            m.get(LIST_URL, status=403)
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(sess, K8S_URL, "/api/v1/namespaces")
+                informer.items = {"old": manifest("old", "1")}
+                assert not informer.synced.is_set()
+                assert informer.heartbeat == 0
+
+                assert await informer.relist() is False
+                assert informer.names() == ["bar", "foo"]
+                assert informer.resource_version == "10"
+                assert informer.synced.is_set()
+                assert informer.heartbeat > 0
+
+                # Must retain the old state if the LIST failed.
+                assert await informer.relist() is True
+                assert informer.names() == ["bar", "foo"]
+
+                # Must also retain it if we shed the LIST.
+                src.k8s.BULKHEAD = src.admission.Bulkhead(limit=1, max_queue=0)
+                async with src.k8s.BULKHEAD.slot():
+                    assert await informer.relist() is True
+                assert informer.names() == ["bar", "foo"]
+
+    async def test_watch(self):
+        """Apply the events of a watch stream."""
+        body = watch_body(
+            ("ADDED", manifest("bar", "11")),
+            ("DELETED", manifest("foo", "12")),
+            ("BOOKMARK", {"metadata": {"resourceVersion": "13"}}),
+        )
+        with aioresponses() as m:
+            m.get(WATCH_URL, body=body)
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(sess, K8S_URL, "/api/v1/namespaces")
+                informer.apply("ADDED", manifest("foo", "10"))
+                start = time.monotonic()
+                assert await informer.watch() is False
+
+            assert informer.names() == ["bar"]
+            assert informer.resource_version == "13"
+
+            # Every event, including bookmarks, proves that K8s is alive.
+            assert informer.heartbeat >= start
+
+            # Must resume the watch from our resource version.
+            url, = [_ for _ in m.requests]
+            assert url[1].query["resourceVersion"] == "10"
+
+    async def test_watch_metadata_only(self):
+        """Must strip everything but the metadata from watched manifests."""
+        obj = manifest("foo", "11")
+        obj["metadata"]["annotations"] = {"large": "x" * 1000}
+        obj["spec"] = {"finalizers": ["kubernetes"]}
+
+        with aioresponses() as m:
+            m.get(WATCH_URL, body=watch_body(("ADDED", obj)))
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(
+                    sess, K8S_URL, "/api/v1/namespaces", metadata_only=True)
+                assert await informer.watch() is False
+            assert informer.items == {"foo": manifest("foo", "11")}
+
+            # Must ask K8s to strip the objects already.
+            call, = [_ for calls in m.requests.values() for _ in calls]
+            assert call.kwargs["headers"] == {"accept": ", ".join([
+                "application/json" + src.k8s.WATCH_PROJECTIONS["metadata"],
+                "application/json",
+            ])}
+
+    async def test_relist_metadata_only(self):
+        """Must LIST the metadata of each item only."""
+        obj = manifest("foo", "10")
+        obj["spec"] = {"finalizers": ["kubernetes"]}
+        payload = {"metadata": {"resourceVersion": "10"}, "items": [obj]}
+
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=payload)
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(
+                    sess, K8S_URL, "/api/v1/namespaces", metadata_only=True)
+                assert await informer.relist() is False
+            assert informer.items == {"foo": manifest("foo", "10")}
+
+            call, = [_ for calls in m.requests.values() for _ in calls]
+            accept = call.kwargs["headers"]["accept"]
+            assert accept.startswith("application/json" + src.k8s.PROJECTIONS["metadata"])
+
+    async def test_watch_gone(self):
+        """Must request a new LIST if the resource version has expired."""
+        gone = {"kind": "Status", "code": 410, "message": "too old"}
+        with aioresponses() as m:
+            m.get(WATCH_URL, status=410)
+            m.get(WATCH_URL, body=watch_body(("ERROR", gone)))
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(sess, K8S_URL, "/api/v1/namespaces")
+                assert await informer.watch() is True
+                assert await informer.watch() is True
+
+    async def test_watch_err(self):
+        """Other errors must not trigger a new LIST."""
+        err = {"kind": "Status", "code": 500, "message": "oops"}
+        with aioresponses() as m:
+            m.get(WATCH_URL, status=403)
+            m.get(WATCH_URL, body=watch_body(("ERROR", err)))
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(sess, K8S_URL, "/api/v1/namespaces", retry_delay=0)
+                assert await informer.watch() is False
+                assert await informer.watch() is False
+
+    async def test_watch_release(self):
+        """Must release the connection on every early return."""
+        gone = {"kind": "Status", "code": 410, "message": "too old"}
+        replies = [(410, b""), (403, b""), (200, watch_body(("ERROR", gone)).encode())]
+        released = []
+
+        class Response:
+            def __init__(self, status, body):
+                self.status = status
+                self.content_type = "application/json"
+                self.content = mock.MagicMock()
+                self.content.iter_any.return_value = aiter_bytes(body)
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                released.append(self.status)
+
+        sess = mock.MagicMock()
+        sess.get.side_effect = [Response(*_) for _ in replies]
+        informer = Informer(sess, K8S_URL, "/api/v1/namespaces", retry_delay=0)
+        assert await informer.watch() is True
+        assert await informer.watch() is False
+        assert await informer.watch() is True
+        assert released == [410, 403, 200]
+
+    async def test_run_start_stop(self):
+        """Background task must LIST, WATCH and survive errors."""
+        gone = {"kind": "Status", "code": 410, "message": "too old"}
+        with aioresponses() as m:
+            m.get(LIST_URL, status=500)
+            m.get(LIST_URL, payload=list_payload("foo", rv="1"))
+            m.get(WATCH_URL, exception=aiohttp.ClientConnectionError())
+            m.get(WATCH_URL, body=watch_body(("ERROR", gone)))
+            m.get(LIST_URL, payload=list_payload("foo", "bar", rv="2"))
+            m.get(WATCH_URL, body=watch_body(("ADDED", manifest("foobar", "3"))))
+
+            # The next watch blocks until we stop the informer.
+            async def block(url, **kwargs):
+                await asyncio.Event().wait()
+            m.get(WATCH_URL, callback=block)
+
+            async with aiohttp.ClientSession() as sess:
+                informer = Informer(
+                    sess, K8S_URL, "/api/v1/namespaces", retry_delay=0.01)
+
+                # Stopping an informer that never started is a no-op.
+                await informer.stop()
+
+                informer.start()
+                await asyncio.wait_for(informer.synced.wait(), timeout=1)
+                for _ in range(100):
+                    if "foobar" in informer.items:
+                        break
+                    await asyncio.sleep(0.01)
+                await informer.stop()
+
+            assert informer.names() == ["bar", "foo", "foobar"]
+            assert informer._task is None
+
+
+@pytest.mark.asyncio
+class TestBroadcast:
+    async def test_subscription(self):
+        """Must return the buffered events in batches."""
+        sub = Subscription(maxsize=3)
+        sub.push(("ADDED", "foo"))
+        sub.push(("DELETED", "bar"))
+        assert await sub.get() == [("ADDED", "foo"), ("DELETED", "bar")]
+
+        # Must block until the next event arrives.
+        task = asyncio.create_task(sub.get())
+        await asyncio.sleep(0)
+        assert not task.done()
+        sub.push(("ADDED", "x"))
+        assert await task == [("ADDED", "x")]
+
+    async def test_subscription_overflow(self):
+        """Must flag an overflow instead of buffering unbounded events."""
+        overflows = src.metrics.PROM_STREAM_OVERFLOWS._value.get()
+        sub = Subscription(maxsize=2)
+        for i in range(5):
+            sub.push(("ADDED", str(i)))
+        assert len(sub.events) == 0
+        assert src.metrics.PROM_STREAM_OVERFLOWS._value.get() == overflows + 1
+
+        # Consumer must learn about the overflow and then resume normally.
+        assert await sub.get() is None
+        sub.push(("ADDED", "foo"))
+        assert await sub.get() == [("ADDED", "foo")]
+
+    async def test_broadcaster(self):
+        """Must fan out events to all subscribers."""
+        clients = src.metrics.PROM_STREAM_CLIENTS._value.get()
+        bc = Broadcaster()
+
+        # Must not bother computing a difference without subscribers.
+        bc.broadcast_diff(["a"], ["b"])
+
+        sub1, sub2 = bc.subscribe(10), bc.subscribe(10)
+        assert src.metrics.PROM_STREAM_CLIENTS._value.get() == clients + 2
+
+        bc.broadcast("ADDED", "foo")
+        bc.broadcast_diff(["a", "b"], ["b", "d", "c"])
+        expected = [("ADDED", "foo"), ("ADDED", "c"), ("ADDED", "d"), ("DELETED", "a")]
+        assert await sub1.get() == expected
+        assert await sub2.get() == expected
+
+        bc.unsubscribe(sub1)
+        bc.unsubscribe(sub1)
+        bc.broadcast("DELETED", "foo")
+        assert list(sub1.events) == []
+        assert list(sub2.events) == [("DELETED", "foo")]
+        assert src.metrics.PROM_STREAM_CLIENTS._value.get() == clients + 1
+        bc.unsubscribe(sub2)
+
+    async def test_informer_events(self):
+        """Informer must report appearing and disappearing resources only."""
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces")
+        sub = informer.subscribe(10)
+
+        informer.apply("ADDED", manifest("foo", "1"))
+        informer.apply("MODIFIED", manifest("foo", "2"))
+        informer.apply("BOOKMARK", {"metadata": {"resourceVersion": "3"}})
+        informer.apply("DELETED", manifest("foo", "4"))
+        informer.apply("DELETED", manifest("foo", "5"))
+        assert await sub.get() == [("ADDED", "foo"), ("DELETED", "foo")]
+
+        # A relist must report the difference to the previous state.
+        informer.apply("ADDED", manifest("old", "6"))
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=list_payload("new", rv="7"))
+            async with aiohttp.ClientSession() as sess:
+                informer.sess = sess
+                assert await informer.relist() is False
+        assert await sub.get() == [("ADDED", "old"), ("ADDED", "new"), ("DELETED", "old")]
+
+
+class TestSearch:
+    def test_search(self):
+        """Must return pages of the names with the prefix."""
+        names = ["a", "ba", "bb", "bc", "bca", "c"]
+        search = src.informer.search
+
+        # Everything.
+        assert search(names) == (names, "")
+        assert search([]) == ([], "")
+
+        # Prefix only.
+        assert search(names, "b") == (["ba", "bb", "bc", "bca"], "")
+        assert search(names, "bc") == (["bc", "bca"], "")
+        assert search(names, "x") == ([], "")
+
+        # Pages of two names.
+        assert search(names, "b", limit=2) == (["ba", "bb"], "bb")
+        assert search(names, "b", "bb", limit=2) == (["bc", "bca"], "")
+        assert search(names, limit=4) == (["a", "ba", "bb", "bc"], "bc")
+        assert search(names, "", "bc", limit=4) == (["bca", "c"], "")
+
+        # The continue token need not exist in the list.
+        assert search(names, "", "b", limit=1) == (["ba"], "ba")
+        assert search(names, "b", "z", limit=1) == ([], "")
@@ -1,15 +1,26 @@
+import asyncio
+import contextlib
 import os
+import ssl
+import types
 from pathlib import Path
+from unittest import mock
 
 import aiohttp
 import pytest
 from aioresponses import aioresponses
+from yarl import URL
 
+import src.admission
+import src.cache
 import src.k8s
-from src.models import Config
+import src.metrics
+from src.models import Config, K8sNamespaces, K8sObject
 
 # Convenience.
 K8S_URL = os.environ["KUBERNETES_SERVICE_HOST"]
+NS_URL = K8S_URL + "/api/v1/namespaces"
+LIST_URL = NS_URL + "?limit=500"
 
 
 class TestConfiguration:
@@ -32,6 +43,44 @@ class TestConfiguration:
         cfg, err = src.k8s.create_session(cfg)
         assert not err and cfg.k8s_session is not None
 
+        # The session must use the connection pool and timeouts from `cfg`.
+        sess = cfg.k8s_session
+        assert sess.connector.limit == cfg.k8s_pool_size
+        assert sess.connector.limit_per_host == cfg.k8s_pool_size_per_host
+        assert sess.timeout == aiohttp.ClientTimeout(
+            total=cfg.k8s_request_timeout,
+            connect=cfg.k8s_connect_timeout,
+            sock_read=cfg.k8s_read_timeout,
+        )
+        assert len(sess.trace_configs) == 1
+
+        # The session must use the token and the credentials must watch it.
+        assert sess.headers["authorization"] == "Bearer sometoken"
+        assert cfg.k8s_credentials.session is sess
+        assert cfg.k8s_credentials.interval == cfg.k8s_creds_reload_interval
+
+        # Must verify the server against the cluster CA and nothing else.
+        ctx = cfg.k8s_credentials.ssl_context
+        assert ctx.verify_mode == ssl.CERT_REQUIRED and ctx.check_hostname
+        assert ctx.cert_store_stats()["x509_ca"] == 1
+        ca, = ctx.get_ca_certs()
+        assert dict(_[0] for _ in ca["subject"]) == {"commonName": "kubernetes"}
+
+    def test_create_session_no_timeouts(self):
+        """A timeout of zero must disable the respective timeout."""
+        cfg = Config(
+            k8s_session=None,
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path("tests/support"),
+            k8s_request_timeout=0,
+            k8s_connect_timeout=0,
+            k8s_read_timeout=0,
+        )
+        cfg, err = src.k8s.create_session(cfg)
+        assert not err
+        assert cfg.k8s_session.timeout == aiohttp.ClientTimeout(
+            total=None, connect=None, sock_read=None)
+
     def test_create_session_err(self):
         """Gracefully handle invalid or incomplete configuration."""
         # Input configuration with invalid credentials path.
@@ -46,6 +95,144 @@ class TestConfiguration:
         assert err and cfg.k8s_session is None
 
 
+@pytest.mark.asyncio
+class TestCredentials:
+    def make_creds(self, path: Path):
+        """Return `Credentials` for a copy of the test credentials in `path`."""
+        for name in ("ca.crt", "token"):
+            (path / name).write_bytes((Path("tests/support") / name).read_bytes())
+        cfg = Config(k8s_session=None, k8s_url="https://" + K8S_URL, k8s_creds_path=path)
+        cfg, err = src.k8s.create_session(cfg)
+        assert not err
+        return cfg.k8s_credentials
+
+    @staticmethod
+    def rotate(fname: Path, data: str):
+        """Replace `fname` like K8s does, ie with a new file."""
+        tmp = fname.with_name("tmp")
+        tmp.write_text(data)
+        os.replace(tmp, fname)
+
+    async def test_reload_token(self, tmp_path):
+        """Must swap the token of the existing session if the file changes."""
+        creds = self.make_creds(tmp_path)
+        sess, ctx = creds.session, creds.ssl_context
+        metric = src.metrics.PROM_K8S_CREDS_RELOADS.labels("token", "ok")
+        cnt = metric._value.get()
+
+        # Nothing must happen while the files are unchanged.
+        assert creds.reload() is False
+        assert metric._value.get() == cnt
+
+        self.rotate(tmp_path / "token", "newtoken\n")
+        assert creds.reload() is True
+        assert sess.headers["authorization"] == "Bearer newtoken"
+        assert metric._value.get() == cnt + 1
+
+        # Same session, same SSL context and the change was only applied once.
+        assert (creds.session, creds.ssl_context) == (sess, ctx)
+        assert creds.reload() is False
+        await sess.close()
+
+    async def test_reload_ca(self, tmp_path):
+        """Must load a new CA into the SSL context of the connection pool."""
+        creds = self.make_creds(tmp_path)
+        creds.ssl_context = mock.MagicMock()
+
+        # Only touching the token must not reload the CA.
+        self.rotate(tmp_path / "token", "sometoken")
+        assert creds.reload() is True
+        assert not creds.ssl_context.load_verify_locations.called
+
+        self.rotate(tmp_path / "ca.crt", (tmp_path / "ca.crt").read_text())
+        assert creds.reload() is True
+        creds.ssl_context.load_verify_locations.assert_called_once_with(
+            cafile=tmp_path / "ca.crt")
+        await creds.session.close()
+
+    async def test_reload_err(self, tmp_path):
+        """Must keep the current credentials while the new ones are unusable."""
+        creds = self.make_creds(tmp_path)
+        metric = src.metrics.PROM_K8S_CREDS_RELOADS.labels("token", "error")
+        cnt = metric._value.get()
+
+        # Token file is missing.
+        (tmp_path / "token").unlink()
+        assert creds.reload() is False
+        assert creds.session.headers["authorization"] == "Bearer sometoken"
+
+        # Token file is empty.
+        self.rotate(tmp_path / "token", "  \n")
+        assert creds.reload() is False
+        assert creds.session.headers["authorization"] == "Bearer sometoken"
+        assert metric._value.get() == cnt + 2
+
+        # Corrupt CA certificate.
+        self.rotate(tmp_path / "token", "newtoken")
+        self.rotate(tmp_path / "ca.crt", "not a certificate")
+        assert creds.reload() is False
+        assert creds.session.headers["authorization"] == "Bearer sometoken"
+
+        # Must pick up the credentials once they are valid again.
+        self.rotate(tmp_path / "ca.crt", Path("tests/support/ca.crt").read_text())
+        assert creds.reload() is True
+        assert creds.session.headers["authorization"] == "Bearer newtoken"
+        await creds.session.close()
+
+    async def test_start_stop(self, tmp_path):
+        """Must periodically reload the credentials in the background."""
+        creds = self.make_creds(tmp_path)
+        creds.interval = 0.01
+        creds.start()
+        self.rotate(tmp_path / "token", "newtoken")
+        for _ in range(100):
+            if creds.session.headers["authorization"] == "Bearer newtoken":
+                break
+            await asyncio.sleep(0.01)
+        assert creds.session.headers["authorization"] == "Bearer newtoken"
+
+        await creds.stop()
+        assert creds._task is None
+        await creds.stop()
+
+        # An interval of zero disables the reload.
+        creds.interval = 0
+        creds.start()
+        assert creds._task is None
+        await creds.session.close()
+
+
+@pytest.mark.asyncio
+class TestPoolMetrics:
+    async def test_trace_config(self):
+        """Trace callbacks must update the connection pool metrics."""
+        trace = src.k8s.pool_trace_config()
+        assert list(trace.on_connection_queued_start) == [
+            src.k8s._on_connection_queued_start]
+        ctx = types.SimpleNamespace()
+        metrics = src.metrics
+
+        waiting = metrics.PROM_K8S_POOL_WAITING._value.get()
+        waits = metrics.PROM_K8S_POOL_WAIT._sum.get()
+        new = metrics.PROM_K8S_CONNECTIONS.labels("new")._value.get()
+        reused = metrics.PROM_K8S_CONNECTIONS.labels("reused")._value.get()
+
+        # A request waits for a free connection.
+        await src.k8s._on_connection_queued_start(None, ctx, None)
+        assert metrics.PROM_K8S_POOL_WAITING._value.get() == waiting + 1
+        await asyncio.sleep(0.01)
+        await src.k8s._on_connection_queued_end(None, ctx, None)
+        assert metrics.PROM_K8S_POOL_WAITING._value.get() == waiting
+        assert metrics.PROM_K8S_POOL_WAIT._sum.get() > waits
+
+        # Connections are either created or reused.
+        await src.k8s._on_connection_create_end(None, ctx, None)
+        await src.k8s._on_connection_reuseconn(None, ctx, None)
+        await src.k8s._on_connection_reuseconn(None, ctx, None)
+        assert metrics.PROM_K8S_CONNECTIONS.labels("new")._value.get() == new + 1
+        assert metrics.PROM_K8S_CONNECTIONS.labels("reused")._value.get() == reused + 2
+
+
 @pytest.mark.asyncio
 class TestK8s:
     async def test_get_k8s_namespaces_simple_ok(self):
@@ -57,12 +244,15 @@ class TestK8s:
         """
         with aioresponses() as m:
             # Mock the K8s request to return our dummy manifests.
-            m.get(K8S_URL + "/api/v1/namespaces", payload={"items": []})
+            m.get(LIST_URL, payload={"metadata": {}, "items": []})
 
             # Function must return without error and an empty list of namespaces.
             async with aiohttp.ClientSession() as sess:
                 resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
-            m.assert_called_once_with(K8S_URL + "/api/v1/namespaces")
+            accept = ("application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+                      ", application/json")
+            m.assert_called_once_with(
+                NS_URL, params={"limit": "500"}, headers={"accept": accept})
             assert not err and resp.namespaces == []
 
     async def test_get_k8s_namespaces_items_ok(self):
@@ -73,27 +263,615 @@ class TestK8s:
 
         """
         # Mocked K8s response: two namespace manifests.
-        k8s_resp = {"items": [
+        k8s_resp = {"metadata": {}, "items": [
             {"metadata": {"name": "foo"}},
             {"metadata": {"name": "bar"}},
         ]}
 
         with aioresponses() as m:
             # Mock the K8s request to return our dummy manifests.
-            m.get(K8S_URL + "/api/v1/namespaces", payload=k8s_resp)
+            m.get(LIST_URL, payload=k8s_resp)
 
             # Function must return the names of the two namespaces.
             async with aiohttp.ClientSession() as sess:
                 resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
             assert not err and resp.namespaces == ["foo", "bar"]
 
+    async def test_get_k8s_namespaces_selectors(self):
+        """Must pass the selectors to K8s and cache the response per selector."""
+        src.k8s.RESPONSE_CACHE = src.cache.ResponseCache(
+            ttl=60, stale_ttl=0, max_entries=10)
+        url = NS_URL + "?labelSelector=team%3Dx&limit=500"
+        k8s_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+
+        with aioresponses() as m:
+            m.get(url, payload=k8s_resp)
+            m.get(LIST_URL, payload={"metadata": {}, "items": []})
+
+            async with aiohttp.ClientSession() as sess:
+                for _ in range(2):
+                    resp, err = await src.k8s.get_namespaces(
+                        sess, K8S_URL, label_selector="team=x")
+                    assert not err and resp.namespaces == ["foo"]
+                resp, err = await src.k8s.get_namespaces(sess, K8S_URL, field_selector="")
+                assert not err and resp.namespaces == []
+
+            # K8s must only have seen two requests, one with selector.
+            calls = {str(key[1]): len(reqs) for key, reqs in m.requests.items()}
+            assert sorted(calls.values()) == [1, 1]
+            assert any("labelSelector=team" in _ for _ in calls)
+
     async def test_get_k8s_namespaces_err(self):
         """Simulate a permission denied error with the K8s API."""
         with aioresponses() as m:
             # Mock the K8s request to return our dummy manifests.
-            m.get(K8S_URL + "/api/v1/namespaces", payload={"items": []}, status=403)
+            m.get(LIST_URL, payload={"items": []}, status=403)
 
             # Test function must gracefully handle an error from the K8s API.
             async with aiohttp.ClientSession() as sess:
                 resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
             assert err and resp.namespaces == []
+
+    async def test_list_pages(self):
+        """Must follow the `continue` tokens until the last page."""
+        pages = [
+            {"metadata": {"continue": "c1"}, "items": [{"id": 0}, {"id": 1}]},
+            {"metadata": {"continue": "c2"}, "items": [{"id": 2}, {"id": 3}]},
+            {"metadata": {"continue": ""}, "items": [{"id": 4}]},
+        ]
+        with aioresponses() as m:
+            m.get(NS_URL + "?limit=2", payload=pages[0])
+            m.get(NS_URL + "?limit=2&continue=c1", payload=pages[1])
+            m.get(NS_URL + "?limit=2&continue=c2", payload=pages[2])
+
+            size = src.metrics.PROM_K8S_RESPONSE_SIZE._sum.get()
+            async with aiohttp.ClientSession() as sess:
+                ret = [_ async for _ in src.k8s.list_pages(sess, NS_URL, limit=2)]
+            assert ret == pages
+
+            # Must have recorded the size of all three responses.
+            assert src.metrics.PROM_K8S_RESPONSE_SIZE._sum.get() > size + 3 * 40
+            assert src.metrics.PROM_K8S_REQUEST_TIME.labels(200)._sum.get() > 0
+
+    async def test_list_pages_projection(self):
+        """Must ask K8s for the projection and decode its response."""
+        foo = {"kind": "PartialObjectMetadata", "metadata": {"name": "foo"}}
+        partial = {
+            "kind": "PartialObjectMetadataList",
+            "metadata": {"resourceVersion": "1"},
+            "items": [foo],
+        }
+        table = {
+            "kind": "Table",
+            "metadata": {"resourceVersion": "1"},
+            "columnDefinitions": [{"name": "Name"}, {"name": "Status"}],
+            "rows": [{"cells": ["foo", "Active"], "object": foo}],
+        }
+        table_url = NS_URL + "?includeObject=Metadata&limit=500"
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=partial, repeat=True)
+            m.get(table_url, payload=table)
+
+            async with aiohttp.ClientSession() as sess:
+                for client in (src.k8s.Client(), src.k8s.Client(protobuf=True)):
+                    ret = [_ async for _ in src.k8s.list_pages(
+                        sess, NS_URL, client=client, projection="metadata")]
+                    assert ret == [{
+                        "metadata": {"resourceVersion": "1"},
+                        "items": [{"metadata": {"name": "foo"}}],
+                    }]
+                ret = [_ async for _ in src.k8s.list_pages(
+                    sess, NS_URL, projection="table")]
+                assert ret == [{
+                    "metadata": {"resourceVersion": "1"},
+                    "columns": ["Name", "Status"],
+                    "items": [{"metadata": {"name": "foo"}, "cells": ["foo", "Active"]}],
+                }]
+
+            calls = m.requests[("GET", URL(LIST_URL))]
+            assert [_.kwargs["headers"]["accept"] for _ in calls] == [
+                "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+                ", application/json",
+                "application/vnd.kubernetes.protobuf"
+                ";as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+                ", application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+                ", application/json",
+            ]
+            call = m.requests[("GET", URL(table_url))][0]
+            assert call.kwargs["headers"]["accept"] == (
+                "application/json;as=Table;g=meta.k8s.io;v=v1, application/json")
+
+    async def test_list_items(self):
+        """Must yield the items of all pages."""
+        pages = [
+            {"metadata": {"continue": "c1"}, "items": [{"id": 0}, {"id": 1}]},
+            {"metadata": {}, "items": [{"id": 2}]},
+        ]
+        with aioresponses() as m:
+            m.get(NS_URL + "?limit=2", payload=pages[0])
+            m.get(NS_URL + "?limit=2&continue=c1", payload=pages[1])
+
+            async with aiohttp.ClientSession() as sess:
+                ret = [_ async for _ in src.k8s.list_items(sess, NS_URL, limit=2)]
+            assert ret == [{"id": 0}, {"id": 1}, {"id": 2}]
+
+    async def test_list_items_err(self):
+        """Must raise `K8sError` if K8s rejects any page."""
+        page = {"metadata": {"continue": "c1"}, "items": [{"id": 0}]}
+        with aioresponses() as m:
+            m.get(NS_URL + "?limit=2", payload=page)
+            m.get(NS_URL + "?limit=2&continue=c1", status=410)
+
+            ret = []
+            async with aiohttp.ClientSession() as sess:
+                with pytest.raises(src.k8s.K8sError) as e:
+                    async for item in src.k8s.list_items(sess, NS_URL, limit=2):
+                        ret.append(item)
+            assert e.value.status == 410 and e.value.url == NS_URL
+            assert ret == [{"id": 0}]
+
+
+def k8s_calls(outcome: str) -> float:
+    """Return the current value of the single-flight counter for `outcome`."""
+    return src.metrics.PROM_K8S_CALLS.labels(outcome)._value.get()
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_coalesce(self):
+        """Concurrent calls for the same key must share a single call."""
+        sf = src.k8s.SingleFlight()
+        calls = []
+
+        async def func(ret):
+            calls.append(ret)
+            await asyncio.sleep(0.01)
+            return ret
+
+        issued, coalesced = k8s_calls("issued"), k8s_calls("coalesced")
+        ret = await asyncio.gather(
+            sf.do("a", lambda: func(1)),
+            sf.do("a", lambda: func(2)),
+            sf.do("b", lambda: func(3)),
+        )
+        assert list(ret) == [1, 1, 3]
+        assert calls == [1, 3]
+        assert k8s_calls("issued") == issued + 2
+        assert k8s_calls("coalesced") == coalesced + 1
+
+        # The call must not linger once it has completed.
+        assert sf._inflight == {}
+        assert await sf.do("a", lambda: func(4)) == 4
+
+    async def test_cancel_caller(self):
+        """Cancelling one caller must not cancel the call for the others."""
+        sf = src.k8s.SingleFlight()
+        event = asyncio.Event()
+
+        async def func():
+            await event.wait()
+            return "done"
+
+        t1 = asyncio.create_task(sf.do("a", func))
+        t2 = asyncio.create_task(sf.do("a", func))
+        await asyncio.sleep(0)
+
+        t1.cancel()
+        event.set()
+        assert await t2 == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await t1
+
+    async def test_get_namespaces_coalesce(self):
+        """Concurrent `get_namespaces` calls must issue a single K8s request."""
+        k8s_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=k8s_resp)
+
+            async with aiohttp.ClientSession() as sess:
+                ret = await asyncio.gather(*[
+                    src.k8s.get_namespaces(sess, K8S_URL) for _ in range(5)
+                ])
+            assert len(m.requests[("GET", URL(LIST_URL))]) == 1
+            for resp, err in ret:
+                assert not err and resp.namespaces == ["foo"]
+
+    async def test_get_namespaces_coalesce_per_session(self):
+        """Calls through different sessions must not share their results."""
+        k8s_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=k8s_resp, repeat=True)
+
+            # Same K8s API but different credentials, eg two kubeconfig contexts.
+            async with aiohttp.ClientSession(headers={"authorization": "a"}) as sess_a, \
+                       aiohttp.ClientSession(headers={"authorization": "b"}) as sess_b:
+                ret = await asyncio.gather(
+                    src.k8s.get_namespaces(sess_a, K8S_URL),
+                    src.k8s.get_namespaces(sess_b, K8S_URL),
+                )
+            assert len(m.requests[("GET", URL(LIST_URL))]) == 2
+            for resp, err in ret:
+                assert not err and resp.namespaces == ["foo"]
+
+    async def test_get_namespaces_cached(self):
+        """`get_namespaces` must serve repeated calls from the response cache."""
+        cfg = Config(
+            k8s_session=None,
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path("tests/support"),
+            k8s_cache_ttl=60,
+        )
+        src.k8s.configure(cfg)
+        assert src.k8s.RESPONSE_CACHE.ttl == 60
+
+        k8s_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=k8s_resp)
+
+            async with aiohttp.ClientSession() as sess:
+                for _ in range(3):
+                    resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
+                    assert not err and resp.namespaces == ["foo"]
+            assert len(m.requests[("GET", URL(LIST_URL))]) == 1
+
+
+@pytest.mark.asyncio
+class TestResources:
+    def test_resource_url(self):
+        """Must only restrict namespaced resources to the namespace."""
+        assert src.k8s.resource_url("k8s", "namespaces", "foo") == "k8s/api/v1/namespaces"
+        assert src.k8s.resource_url("k8s", "services") == "k8s/api/v1/services"
+        assert src.k8s.resource_url("k8s", "deployments", "foo") == \
+            "k8s/apis/apps/v1/namespaces/foo/deployments"
+
+    async def test_get_resources(self):
+        """Must query all kinds in parallel and report the failed ones."""
+        svc_url = K8S_URL + "/api/v1/namespaces/foo/services"
+        dep_url = K8S_URL + "/apis/apps/v1/namespaces/foo/deployments"
+        ns_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+        svc_resp = {"metadata": {}, "items": [
+            {"metadata": {"name": "svc", "namespace": "foo", "uid": "1"}},
+        ]}
+
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=ns_resp)
+            m.get(svc_url + "?limit=500", payload=svc_resp)
+            m.get(dep_url + "?limit=500", status=403)
+
+            async with aiohttp.ClientSession() as sess:
+                ret = await src.k8s.get_resources(
+                    sess, K8S_URL,
+                    ["namespaces", "services", "deployments", "pods", "services"],
+                    namespace="foo", concurrency=2,
+                )
+
+        assert ret.errors == ["deployments", "pods"]
+        assert ret.resources == {
+            "namespaces": [K8sObject(name="foo")],
+            "services": [K8sObject(name="svc", namespace="foo")],
+        }
+
+        # Must have recorded the time of each K8s query.
+        hist = src.metrics.PROM_K8S_LIST_TIME.labels("deployments")
+        assert hist._sum.get() > 0
+
+    async def test_get_resources_concurrency(self):
+        """Must never have more than `concurrency` queries in flight."""
+        running, peak = 0, 0
+
+        async def get_objects(sess, k8s_url, kind, namespace, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return [K8sObject(name=kind)], False
+
+        kinds = ["namespaces", "services", "deployments"]
+        with mock.patch.object(src.k8s, "get_objects", get_objects):
+            ret = await src.k8s.get_resources(None, K8S_URL, kinds, concurrency=2)
+        assert peak == 2
+        assert ret.errors == [] and list(ret.resources) == kinds
+
+
+class FakeSession:
+    """Stand-in for `aiohttp.ClientSession` whose responses we control.
+
+    Every call to `get` pops the next entry from `replies`. An entry is
+    either an exception to raise, or a `(status, body, headers, delay)` tuple
+    where `status` may also be an exception to raise after the delay.
+    `active` counts the requests that are still in flight or unreleased.
+
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.active = 0
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, params=None, headers=None):
+        self.calls += 1
+        self.active += 1
+        try:
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            status, body, headers, delay = reply
+            await asyncio.sleep(delay)
+            if isinstance(status, Exception):
+                raise status
+            resp = mock.MagicMock(status=status, headers=headers)
+            resp.read = mock.AsyncMock(return_value=body)
+            yield resp
+        finally:
+            self.active -= 1
+
+
+def ok(body=b"ok", delay=0.0):
+    return (200, body, {}, delay)
+
+
+def fail(status=503, headers=None):
+    return (status, b"", headers or {}, 0.0)
+
+
+def breaker_events(event: str) -> float:
+    return src.metrics.PROM_K8S_BREAKER.labels(event)._value.get()
+
+
+@pytest.mark.asyncio
+class TestClient:
+    def test_configure(self):
+        """`configure` must setup the client from the `Config`."""
+        cfg = Config(
+            k8s_session=None,
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path("tests/support"),
+            k8s_retries=2,
+            k8s_breaker_threshold=7,
+            k8s_hedge_delay=0.5,
+        )
+        src.k8s.configure(cfg)
+        client = src.k8s.CLIENT
+        assert (client.retries, client.hedge_delay) == (2, 0.5)
+        assert client.breaker.threshold == 7
+
+    def test_parse_retry_after(self):
+        parse = src.k8s.parse_retry_after
+        assert parse(None) is None
+        assert parse("2") == 2
+        assert parse("-1") == 0
+        assert parse("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+    async def test_retry(self):
+        """Must retry errors and retryable statuses."""
+        client = src.k8s.Client(retries=3, backoff=0.001)
+        sess = FakeSession(aiohttp.ClientConnectionError(), fail(502), ok())
+        retries = src.metrics.PROM_K8S_RETRIES.labels("502")._value.get()
+
+        assert await client.get(sess, "url") == (200, b"ok")
+        assert sess.calls == 3
+        assert src.metrics.PROM_K8S_RETRIES.labels("502")._value.get() == retries + 1
+
+    async def test_no_retry(self):
+        """Must neither retry nor count client errors against the breaker."""
+        client = src.k8s.Client(retries=3, breaker_threshold=1)
+        sess = FakeSession(fail(403))
+
+        assert await client.get(sess, "url") == (403, b"")
+        assert sess.calls == 1 and not client.breaker.is_open
+
+    async def test_retries_exhausted(self):
+        """Must return the last status or raise the last error."""
+        client = src.k8s.Client(retries=1, backoff=0.001)
+        sess = FakeSession(fail(500), fail(503))
+        assert await client.get(sess, "url") == (503, b"")
+
+        sess = FakeSession(fail(500), asyncio.TimeoutError())
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get(sess, "url")
+        assert sess.calls == 2 and client.breaker.failures == 2
+
+    async def test_retry_after(self):
+        """Must wait as long as `Retry-After` demands unless it is too long."""
+        client = src.k8s.Client(retries=3, backoff=0.001, max_backoff=5)
+        sess = FakeSession(fail(429, {"Retry-After": "3"}), ok())
+        with mock.patch.object(asyncio, "sleep", mock.AsyncMock()) as m_sleep:
+            assert await client.get(sess, "url") == (200, b"ok")
+        assert mock.call(3) in m_sleep.call_args_list
+
+        # Must give up immediately if K8s wants us to wait too long.
+        sess = FakeSession(fail(429, {"Retry-After": "60"}), ok())
+        assert await client.get(sess, "url") == (429, b"")
+        assert sess.calls == 1
+
+    async def test_bulkhead(self):
+        """Must only occupy a bulkhead slot during attempts, not during the backoff."""
+        bulkhead = src.admission.Bulkhead(limit=1, max_queue=0)
+        client = src.k8s.Client(retries=1, backoff=0.001, bulkhead=bulkhead)
+
+        # Other calls must get the slot while the first one backs off.
+        sess = FakeSession(fail(503, {"Retry-After": "0.1"}), ok())
+        task = asyncio.create_task(client.get(sess, "url"))
+        await asyncio.sleep(0.05)
+        assert sess.calls == 1
+        async with bulkhead.slot():
+            pass
+        assert await task == (200, b"ok")
+        assert sess.calls == 2
+
+        # Must shed the attempt if the bulkhead is full.
+        async with bulkhead.slot():
+            with pytest.raises(src.admission.Overloaded):
+                await client.get(FakeSession(ok()), "url")
+
+        # Must use the module wide bulkhead by default.
+        src.k8s.BULKHEAD = src.admission.Bulkhead(limit=1, max_queue=0)
+        async with src.k8s.BULKHEAD.slot():
+            assert await client.get(FakeSession(ok()), "url") == (200, b"ok")
+            with pytest.raises(src.admission.Overloaded):
+                await src.k8s.Client().get(FakeSession(ok()), "url")
+
+    async def test_breaker(self):
+        """Must open after consecutive failures and close after a good probe."""
+        client = src.k8s.Client(breaker_threshold=2, breaker_reset=10)
+        breaker = client.breaker
+        breaker.now = 0                                    # type: ignore
+        breaker.clock = lambda: breaker.now                # type: ignore
+        opened, rejected = breaker_events("open"), breaker_events("reject")
+
+        sess = FakeSession(fail(), fail(), fail(), ok())
+        for _ in range(2):
+            assert await client.get(sess, "url") == (503, b"")
+        assert breaker.is_open and breaker_events("open") == opened + 1
+
+        # Must reject calls without contacting K8s while open.
+        with pytest.raises(src.k8s.CircuitOpenError) as e:
+            await client.get(sess, "url")
+        assert e.value.status == 503 and "Circuit breaker is open" in str(e.value)
+        assert sess.calls == 2 and breaker_events("reject") == rejected + 1
+
+        # Must let a single probe through after the timeout and re-open if it fails.
+        breaker.now = 10                                   # type: ignore
+        assert (breaker.allow(), breaker.allow()) == (True, False)
+        breaker.record(False)
+        assert breaker.is_open and breaker.opened_at == 10
+        assert not breaker.allow()
+
+        # Must close again once a probe succeeds.
+        breaker.now = 20                                   # type: ignore
+        assert await client.get(sess, "url") == (503, b"")
+        breaker.now = 30                                   # type: ignore
+        assert await client.get(sess, "url") == (200, b"ok")
+        assert (breaker.is_open, breaker.failures) == (False, 0)
+
+    async def test_breaker_aborted_probe(self):
+        """A probe that neither succeeds nor fails must not block the next one."""
+        client = src.k8s.Client(breaker_threshold=1, breaker_reset=10)
+        breaker = client.breaker
+        breaker.now = 0                                    # type: ignore
+        breaker.clock = lambda: breaker.now                # type: ignore
+
+        assert await client.get(FakeSession(fail()), "url") == (503, b"")
+        assert breaker.is_open
+        breaker.now = 10                                   # type: ignore
+
+        # Cancelled probe.
+        task = asyncio.create_task(client.get(FakeSession(ok(delay=1)), "url"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.wait([task])
+        assert breaker.is_open and not breaker._trial
+
+        # Probe that raises an unexpected error.
+        with pytest.raises(ValueError):
+            await client.get(FakeSession(ValueError()), "url")
+        assert breaker.is_open and not breaker._trial
+
+        # The next probe must go through and close the breaker.
+        assert await client.get(FakeSession(ok()), "url") == (200, b"ok")
+        assert not breaker.is_open
+
+    async def test_fallback(self):
+        """Must serve last known good data while the breaker is open."""
+        src.k8s.RESPONSE_CACHE = src.cache.ResponseCache(
+            ttl=0, stale_ttl=0, max_entries=10)
+        src.k8s.CLIENT = src.k8s.Client(breaker_threshold=1)
+        k8s_resp = {"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}
+        fallback = breaker_events("fallback")
+
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=k8s_resp)
+            m.get(LIST_URL, status=500)
+
+            async with aiohttp.ClientSession() as sess:
+                assert await src.k8s.get_namespaces(sess, K8S_URL) == (
+                    K8sNamespaces(namespaces=["foo"]), False)
+
+                # The failed call opens the breaker and must thus already
+                # return the cached data.
+                resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
+                assert not err and resp.namespaces == ["foo"]
+                assert src.k8s.CLIENT.breaker.is_open
+                assert breaker_events("fallback") == fallback + 1
+
+                # Must return the error if there is no cached data.
+                src.k8s.RESPONSE_CACHE.clear()
+                resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
+                assert err and resp.namespaces == []
+            assert len(m.requests[("GET", URL(LIST_URL))]) == 2
+
+    async def test_transport_error(self):
+        """Connection errors must become errors, not exceptions, for callers."""
+        src.k8s.RESPONSE_CACHE = src.cache.ResponseCache(
+            ttl=0, stale_ttl=0, max_entries=10)
+        src.k8s.CLIENT = src.k8s.Client(breaker_threshold=1)
+        body = b'{"metadata": {}, "items": [{"metadata": {"name": "foo"}}]}'
+        down = aiohttp.ClientConnectionError("down")
+
+        # Partial results must list the kind that failed.
+        sess = FakeSession(ok(body), down)
+        ret = await src.k8s.get_resources(
+            sess, K8S_URL, ["namespaces", "services"], concurrency=1)
+        assert list(ret.resources) == ["namespaces"]
+        assert ret.errors == ["services"]
+        assert src.k8s.CLIENT.breaker.is_open
+
+        # The call that tripped the breaker must already fall back.
+        src.k8s.CLIENT = src.k8s.Client(breaker_threshold=1)
+        sess = FakeSession(asyncio.TimeoutError())
+        resp, err = await src.k8s.get_namespaces(sess, K8S_URL)
+        assert not err and resp.namespaces == ["foo"]
+
+        # No cached data.
+        src.k8s.RESPONSE_CACHE.clear()
+        src.k8s.CLIENT = src.k8s.Client()
+        sess = FakeSession(down)
+        assert await src.k8s.get_namespaces(sess, K8S_URL) == (
+            K8sNamespaces(namespaces=[]), True)
+
+    async def test_hedge(self):
+        """Must issue a second request if the first is slow and use the faster one."""
+        hedges = src.metrics.PROM_K8S_HEDGES
+        issued = hedges.labels("issued")._value.get()
+        won = hedges.labels("won")._value.get()
+        client = src.k8s.Client(hedge_delay=0.01)
+
+        # Fast response: no hedge.
+        sess = FakeSession(ok(b"first"))
+        assert await client.get(sess, "url") == (200, b"first")
+        assert sess.calls == 1
+
+        # Slow first response: the hedge must win.
+        sess = FakeSession(ok(b"first", delay=1), ok(b"second"))
+        assert await client.get(sess, "url") == (200, b"second")
+        assert (sess.calls, sess.active) == (2, 0)
+        assert hedges.labels("issued")._value.get() == issued + 1
+        assert hedges.labels("won")._value.get() == won + 1
+
+        # Slow first response that still beats the hedge.
+        sess = FakeSession(ok(b"first", delay=0.02), ok(b"second", delay=1))
+        assert await client.get(sess, "url") == (200, b"first")
+
+        # The hedge fails but the original request succeeds.
+        sess = FakeSession(ok(b"first", delay=0.05), aiohttp.ClientConnectionError())
+        assert await client.get(sess, "url") == (200, b"first")
+
+        # Must raise the error of the request that failed last.
+        sess = FakeSession(
+            (asyncio.TimeoutError(), b"", {}, 0.02), aiohttp.ClientConnectionError())
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get(sess, "url")
+
+    async def test_hedge_cancel(self):
+        """Must cancel and wait for both requests if the caller is cancelled."""
+        client = src.k8s.Client(hedge_delay=0.01)
+        sess = FakeSession(ok(delay=10), ok(delay=10))
+
+        task = asyncio.create_task(client.get(sess, "url"))
+        await asyncio.sleep(0.05)
+        assert (sess.calls, sess.active) == (2, 2)
+        task.cancel()
+        await asyncio.wait([task])
+        assert task.cancelled() and sess.active == 0
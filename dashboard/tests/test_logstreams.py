@@ -1,9 +1,13 @@
 import json
 import logging
+import queue
 import sys
+import threading
+from pathlib import Path
 
 import src
 import src.logstreams
+import src.metrics
 
 # Convenience.
 logit = logging.getLogger("app")
@@ -68,10 +72,79 @@ class TestLogging:
                     else:
                         assert log.level == log_level_num
 
-                    # Must be normal StreamHandler but use our custom JSON formatter.
+                    # Must format the records with our custom JSON formatter
+                    # and queue them for the background thread.
                     handler = log.handlers[0]
-                    assert isinstance(handler, logging.StreamHandler)
+                    assert isinstance(handler, src.logstreams.DroppingQueueHandler)
                     assert isinstance(handler.formatter, src.logstreams.JsonFormatter)
+                    listener = src.logstreams.LISTENER
+                    assert listener is not None and listener.queue is handler.queue
+                    stream = listener.handlers[0]
+                    assert isinstance(stream, logging.StreamHandler)
+                    assert stream.formatter is None
+
+    def test_queue_full(self):
+        """Must drop new records instead of blocking if the queue is full."""
+        records: queue.Queue = queue.Queue(1)
+        handler = src.logstreams.DroppingQueueHandler(records)
+        dropped = src.metrics.PROM_LOG_DROPPED._value.get()
+
+        record = logging.makeLogRecord({"msg": "msg"})
+        for _ in range(3):
+            handler.handle(record)
+
+        # Must have queued the formatted record and dropped the others.
+        queued = records.get_nowait()
+        assert json.loads(queued.msg)["message"] == "msg"
+        assert src.metrics.PROM_LOG_DROPPED._value.get() == dropped + 2
+
+    def test_queue_format_in_caller(self):
+        """Must format the record before the caller can mutate its arguments."""
+        records: queue.Queue = queue.Queue()
+        handler = src.logstreams.DroppingQueueHandler(records)
+
+        data = {"foo": "bar"}
+        handler.handle(logging.makeLogRecord({"msg": "msg", "args": (data,)}))
+        data["foo"] = "mutated"
+
+        # The queued record must contain the JSON line as it was at log time
+        # and a plain `StreamHandler` must write it verbatim.
+        queued = records.get_nowait()
+        assert queued.args is None and queued.exc_info is None
+        line = logging.StreamHandler().format(queued)
+        assert json.loads(line)["data"] == [{"foo": "bar"}]
+
+    def test_listener_stop_full_queue(self):
+        """Must write all queued records on stop, even if the queue is full."""
+        release, handled = threading.Event(), []
+
+        class SlowHandler(logging.Handler):
+            def handle(self, record):
+                release.wait()
+                handled.append(record.msg)
+
+        records: queue.Queue = queue.Queue(1)
+        listener = src.logstreams.Listener(records, SlowHandler())
+        listener.start()
+
+        # The thread blocks on the first record and the second fills the queue.
+        records.put(logging.makeLogRecord({"msg": "foo"}))
+        records.put(logging.makeLogRecord({"msg": "bar"}))
+        threading.Timer(0.05, release.set).start()
+        listener.stop()
+        assert handled == ["foo", "bar"]
+
+    def test_stop(self):
+        """Must stop the writer thread and allow a new setup."""
+        assert src.logstreams.setup("debug", queue_size=10) is False
+        listener = src.logstreams.LISTENER
+        assert listener is not None and listener._thread is not None
+
+        src.logstreams.stop()
+        assert (src.logstreams.LISTENER, listener._thread) == (None, None)
+        src.logstreams.stop()
+
+        assert src.logstreams.setup("debug") is False
 
     def test_setup_invalid_log_levels(self):
         # Must return an error because the log level name is invalid.
@@ -118,6 +191,13 @@ class TestLogging:
             "data": {"foo": "bar"},
         }
 
+    def test_dumps(self):
+        """All encoders must produce the same JSON and stringify unknown types."""
+        msg = {"message": "msg", "data": [{"path": Path("/foo"), 200: 1}]}
+        expected = {"message": "msg", "data": [{"path": "/foo", "200": 1}]}
+        assert json.loads(src.logstreams._dumps_stdlib(msg)) == expected
+        assert json.loads(src.logstreams._dumps_orjson(msg)) == expected
+
     def test_formatter_exception(self):
         """Log last exception.
 
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import src.loopmon
+import src.metrics
+from src.loopmon import LoopMonitor
+
+
+def lag_samples() -> float:
+    """Return the number of loop lag samples so far."""
+    return sum(_.get() for _ in src.metrics.PROM_LOOP_LAG._buckets)
+
+
+class TestLoopMonitor:
+    @mock.patch.object(src.loopmon.logit, "warning")
+    def test_check(self, m_log):
+        """Must log the stack of the loop thread once per stall."""
+        monitor = LoopMonitor(interval=1, threshold=0.5)
+        monitor._thread_id = threading.get_ident()
+        monitor.clock = lambda: 100.0               # type: ignore
+        stalls = src.metrics.PROM_LOOP_STALLS._value.get()
+
+        # The sampling task is not overdue yet.
+        monitor.beat = 98.6
+        assert monitor.check() is False
+        assert not m_log.called
+
+        # Blocked for 0.6s longer than the sampling interval.
+        monitor.beat = 98.4
+        assert monitor.check() is True
+        msg, data = m_log.call_args[0]
+        assert msg == "Event loop blocked for more than 0.600s"
+        assert data["task"] is None
+        assert "test_check" in data["stack"]
+        assert src.metrics.PROM_LOOP_STALLS._value.get() == stalls + 1
+
+        # Must not report the same stall again.
+        assert monitor.check() is False
+        assert m_log.call_count == 1
+
+        # Unknown thread.
+        monitor._thread_id = -1
+        monitor.beat = 98.3
+        assert monitor.check() is True
+        assert m_log.call_args[0][1]["stack"] == ""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(src.loopmon.logit, "warning")
+    async def test_start_stop(self, m_log):
+        """Must sample the lag and catch the blocking callback in the act."""
+        monitor = LoopMonitor(interval=0.01, threshold=0.05)
+        samples = lag_samples()
+        monitor.start()
+
+        await asyncio.sleep(0.05)
+        assert lag_samples() > samples
+
+        # Block the event loop.
+        time.sleep(0.3)
+        await asyncio.sleep(0)
+        msg, data = m_log.call_args[0]
+        assert msg.startswith("Event loop blocked")
+        assert data["task"] == asyncio.current_task().get_name()   # type: ignore
+        assert "time.sleep(0.3)" in data["stack"]
+
+        await monitor.stop()
+        assert (monitor._task, monitor._watchdog) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_stop_nonblocking(self):
+        """Must not block the event loop while the watchdog finishes a check."""
+        monitor = LoopMonitor(interval=0.01, threshold=0.02)
+        busy, release = threading.Event(), threading.Event()
+
+        def check():
+            busy.set()
+            release.wait()
+            return False
+
+        # Release the watchdog eventually, even if `stop` blocks the loop.
+        timer = threading.Timer(1, release.set)
+        timer.start()
+        with mock.patch.object(monitor, "check", side_effect=check):
+            monitor.start()
+            await asyncio.get_running_loop().run_in_executor(None, busy.wait)
+
+            stop = asyncio.create_task(monitor.stop())
+            await asyncio.sleep(0.05)
+            assert not stop.done()
+
+            release.set()
+            await stop
+        timer.cancel()
+        assert (monitor._task, monitor._watchdog) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """An interval of zero must disable the monitor."""
+        monitor = LoopMonitor(interval=0, threshold=0.05)
+        monitor.start()
+        assert (monitor._task, monitor._watchdog) == (None, None)
+        await monitor.stop()
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+import tempfile
 from unittest import mock
 
 import src.k8s
@@ -5,7 +9,28 @@ import src.main
 
 
 class TestStartup:
-    @mock.patch.object(src.main.uvicorn, "run")
+    def test_import_lazy(self):
+        """Importing the application must be quick and must not setup K8s."""
+        code = (
+            "import sys, time; t0 = time.perf_counter(); import src.main; "
+            "print(time.perf_counter() - t0, "
+            "'config' in src.server.FASTAPI_APP.extra, "
+            "*[_ in sys.modules for _ in ('uvicorn', 'yaml', 'src.loopmon', "
+            "'src.shared')])"
+        )
+        out = subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout
+        elapsed, *loaded = out.split()
+
+        # Generous bound, because shared CI runners are slow. It takes about
+        # 0.2 s on a developer machine.
+        assert float(elapsed) < 5
+
+        # Neither the configuration and K8s session, nor the server or the
+        # optional subsystems that are disabled by default must be loaded.
+        assert loaded == ["False"] * 5
+
+    @mock.patch("uvicorn.run")
     def test_main_default(self, m_uv):
         """Main function must setup UV loop with correct parameters."""
         # Main function must exist with code 0.
@@ -19,11 +44,68 @@ class TestStartup:
             "host": "0.0.0.0",
             "port": 8080,
             "log_level": "info",
+            "workers": 1,
+            "loop": "auto",
+            "http": "auto",
             "access_log": False,
             "log_config": None,
         }
 
+    @mock.patch("uvicorn.run")
+    def test_main_workers(self, m_uv):
+        """Multiple workers must load the application from its import string."""
+        new_env = {
+            "WORKERS": "4",
+            "UVICORN_LOOP": "uvloop",
+            "UVICORN_HTTP": "httptools",
+            "PROMETHEUS_MULTIPROC_DIR": "/tmp/prometheus",
+        }
+        with mock.patch.dict("os.environ", values=new_env):
+            assert src.main.main() == 0
+
+        cargs = m_uv.call_args_list[0][1]
+        assert cargs["app"] == "src.main:FASTAPI_APP"
+        assert cargs["workers"] == 4
+        assert cargs["loop"] == "uvloop"
+        assert cargs["http"] == "httptools"
+
+        # The import string must resolve to the application.
+        assert src.main.FASTAPI_APP is src.server.FASTAPI_APP
+
+    @mock.patch("uvicorn.run")
+    def test_main_workers_err(self, m_uv):
+        """Must reject invalid worker configurations."""
+        # Not an integer.
+        with mock.patch.dict("os.environ", values={"WORKERS": "foo"}):
+            assert src.main.main() == 1
+
+        # Multiple workers without a directory for the Prometheus metrics.
+        with mock.patch.dict("os.environ", values={"WORKERS": "2"}):
+            os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            assert src.main.main() == 1
+        assert not m_uv.called
+
+    @mock.patch.object(src.main, "start_http_server")
+    def test_start_metrics_server(self, m_http):
+        """Must aggregate the metrics of all workers in multiprocess mode."""
+        with mock.patch.dict("os.environ"):
+            os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            src.main.start_metrics_server()
+        m_http.assert_called_once_with(port=8081, addr="0.0.0.0")
+
+        m_http.reset_mock()
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.dict("os.environ", values={"PROMETHEUS_MULTIPROC_DIR": tmp}):
+                src.main.start_metrics_server()
+        assert m_http.call_count == 1
+        assert "registry" in m_http.call_args_list[0][1]
+
     def test_missing_k8s_env_vars(self):
         """Server must exit with error if any environment variables are missing."""
         with mock.patch.dict("os.environ", values={}, clear=True):
             assert src.main.main() == 1
+
+    def test_invalid_env_vars(self):
+        """Server must exit with error if any environment variable is invalid."""
+        with mock.patch.dict("os.environ", values={"K8S_CACHE_SIZE": "foo"}):
+            assert src.main.main() == 1
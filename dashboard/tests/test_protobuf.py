@@ -0,0 +1,237 @@
+import json
+import os
+import re
+from typing import List
+from unittest import mock
+
+import aiohttp
+import pytest
+from aioresponses import aioresponses
+from yarl import URL
+
+import src.decoders
+import src.k8s
+import src.protobuf
+from src.informer import Informer
+from src.protobuf import DecodeError
+from tests.protobuf_encode import (
+    encode_message, encode_namespace, encode_status, encode_varint,
+    encode_watch_frame, namespace_list,
+)
+
+# Convenience.
+K8S_URL = os.environ["KUBERNETES_SERVICE_HOST"]
+NS_URL = K8S_URL + "/api/v1/namespaces"
+LIST_URL = NS_URL + "?limit=500"
+WATCH_URL = re.compile(re.escape(NS_URL) + r"\?.*watch=1.*")
+
+# Two namespaces with more fields than we care about.
+MANIFESTS: List[dict] = [
+    {
+        "metadata": {
+            "name": "foo",
+            "uid": "uid-foo",
+            "resourceVersion": "12",
+            "labels": {"app": "foo", "team": "a"},
+            "annotations": {"note": "dropped"},
+            "managedFields": [{"manager": "kubectl", "fieldsV1": {"f:metadata": {}}}],
+        },
+        "spec": {"finalizers": ["kubernetes"]},
+        "status": {"phase": "Active"},
+    },
+    {"metadata": {"name": "bar", "namespace": "ns"}},
+]
+
+
+def namespace_doc(name: str, rv: str) -> bytes:
+    """Return the K8s protobuf document of a minimal namespace."""
+    manifest = {"metadata": {"name": name, "resourceVersion": rv}}
+    return src.protobuf.MAGIC + encode_message([
+        (1, encode_message([(2, "Namespace")])), (2, encode_namespace(manifest)),
+    ])
+
+
+async def aiter_bytes(*chunks: bytes):
+    """Yield `chunks` like `aiohttp.StreamReader.iter_any`."""
+    for chunk in chunks:
+        yield chunk
+
+
+class TestDecode:
+    def test_fields(self):
+        """Must decode all wire types and reject invalid messages."""
+        buf = (
+            encode_message([(1, 300), (2, "foo")])
+            + encode_varint(3 << 3 | 1) + b"12345678"
+            + encode_varint(4 << 3 | 5) + b"1234"
+        )
+        ret = [(num, bytes(_) if isinstance(_, memoryview) else _)
+               for num, _ in src.protobuf.fields(buf)]
+        assert ret == [(1, 300), (2, b"foo"), (3, b"12345678"), (4, b"1234")]
+
+        # Groups (wire type 3) are deprecated and K8s does not use them.
+        with pytest.raises(DecodeError):
+            list(src.protobuf.fields(encode_varint(1 << 3 | 3)))
+        with pytest.raises(DecodeError):
+            list(src.protobuf.fields(encode_varint(1 << 3) + b"\x80"))
+        with pytest.raises(DecodeError):
+            list(src.protobuf.fields(encode_message([(1, "foo")])[:-1]))
+
+    def test_unwrap(self):
+        """Must return the kind and object of a K8s protobuf document."""
+        doc = namespace_doc("foo", "1")
+        assert src.protobuf.is_protobuf(doc)
+        kind, raw = src.protobuf.unwrap(doc)
+        assert kind == "Namespace"
+        assert src.protobuf.project(raw) == {
+            "metadata": {"name": "foo", "resourceVersion": "1"}}
+
+        # An object without metadata.
+        assert src.protobuf.project(b"") == {"metadata": {}}
+
+        assert not src.protobuf.is_protobuf(b'{"kind": "Namespace"}')
+        with pytest.raises(DecodeError):
+            src.protobuf.unwrap(b'{"kind": "Namespace"}')
+
+    @pytest.mark.parametrize("backend", src.decoders.available())
+    def test_loads_list_metadata(self, backend):
+        """Must return the same data as the JSON decoders."""
+        meta = {"resourceVersion": "123", "continue": "token", "remainingItemCount": 5}
+        body = namespace_list(MANIFESTS, meta)
+        expected = src.decoders.loads_list_metadata(
+            json.dumps({"metadata": meta, "items": MANIFESTS}).encode())
+
+        with mock.patch.object(src.decoders, "BACKEND", backend):
+            assert src.decoders.loads_list_metadata(body) == expected
+        assert expected["items"][0]["metadata"]["labels"] == {"app": "foo", "team": "a"}
+
+    def test_loads_watch_event(self):
+        """Must decode regular events and the status of ERROR events."""
+        frame = encode_watch_frame("ADDED", namespace_doc("foo", "1"))
+        assert src.protobuf.loads_watch_event(frame[4:]) == {
+            "type": "ADDED",
+            "object": {"metadata": {"name": "foo", "resourceVersion": "1"}},
+        }
+
+        frame = encode_watch_frame("ERROR", encode_status(410, "too old", "Expired"))
+        assert src.protobuf.loads_watch_event(frame[4:]) == {
+            "type": "ERROR",
+            "object": {"code": 410, "message": "too old", "reason": "Expired"},
+        }
+
+    def test_unknown_fields(self):
+        """Must skip fields it does not know, in whatever order they come."""
+        label = encode_message([(1, "k"), (15, "new"), (2, "v")])
+        meta = encode_message([(1, "foo"), (6, "1"), (11, label)])
+        obj = encode_message([(15, "new"), (2, b""), (1, meta)])
+        doc = src.protobuf.MAGIC + encode_message([
+            (15, "new"), (1, encode_message([(2, "Namespace")])), (2, obj)])
+        expected = {"metadata": {
+            "name": "foo", "resourceVersion": "1", "labels": {"k": "v"}}}
+        assert src.protobuf.project(obj) == expected
+
+        body = src.protobuf.MAGIC + encode_message([
+            (2, encode_message([(15, "new"), (2, obj)]))])
+        assert src.protobuf.loads_list_metadata(body) == {
+            "metadata": {}, "items": [expected]}
+
+        raw_ext = encode_message([(15, "new"), (1, doc)])
+        frame = encode_message([(15, "new"), (1, "ADDED"), (2, raw_ext)])
+        assert src.protobuf.loads_watch_event(frame) == {
+            "type": "ADDED", "object": expected}
+
+    @pytest.mark.asyncio
+    async def test_iter_frames(self):
+        """Must reassemble frames across chunk boundaries."""
+        stream = b"".join(encode_watch_frame("ADDED", namespace_doc(_, "1"))
+                          for _ in ("foo", "bar"))
+        resp = mock.MagicMock()
+        resp.content.iter_any.return_value = aiter_bytes(
+            stream[:2], stream[2:20], stream[20:])
+        frames = [_ async for _ in src.protobuf.iter_frames(resp)]
+        names = [src.protobuf.loads_watch_event(_)["object"]["metadata"]["name"]
+                 for _ in frames]
+        assert names == ["foo", "bar"]
+
+        resp.content.iter_any.return_value = aiter_bytes(stream[:-1])
+        with pytest.raises(DecodeError):
+            [_ async for _ in src.protobuf.iter_frames(resp)]
+
+
+@pytest.mark.asyncio
+class TestNegotiation:
+    async def test_list_pages(self):
+        """Must ask for protobuf only if it can decode the response."""
+        body = namespace_list(MANIFESTS, {"resourceVersion": "1"})
+        payload = {"metadata": {"resourceVersion": "1"}, "items": MANIFESTS}
+        client = src.k8s.Client(protobuf=True)
+        with aioresponses() as m:
+            m.get(LIST_URL, body=body, content_type=src.protobuf.CONTENT_TYPE)
+            m.get(LIST_URL, payload=payload, repeat=True)
+
+            async with aiohttp.ClientSession() as sess:
+                pages = [_ async for _ in src.k8s.list_pages(
+                    sess, NS_URL, metadata_only=True, client=client)]
+                names = [_["metadata"]["name"] for _ in pages[0]["items"]]
+                assert names == ["foo", "bar"]
+
+                # Neither for full manifests nor if the client is not configured to.
+                [_ async for _ in src.k8s.list_pages(sess, NS_URL, client=client)]
+                [_ async for _ in src.k8s.list_pages(sess, NS_URL, metadata_only=True)]
+
+            calls = m.requests[("GET", URL(LIST_URL))]
+            assert calls[0].kwargs["headers"] == {"accept": src.protobuf.ACCEPT}
+            assert calls[1].kwargs["headers"] is None
+            assert calls[2].kwargs["headers"] is None
+
+    async def test_list_pages_json_fallback(self):
+        """Must decode JSON if K8s does not support protobuf for a resource."""
+        client = src.k8s.Client(protobuf=True)
+        payload = {"metadata": {"resourceVersion": "1"}, "items": MANIFESTS}
+        with aioresponses() as m:
+            m.get(LIST_URL, payload=payload)
+
+            async with aiohttp.ClientSession() as sess:
+                pages = [_ async for _ in src.k8s.list_pages(
+                    sess, NS_URL, metadata_only=True, client=client)]
+        assert pages[0]["items"][1] == {"metadata": {"name": "bar", "namespace": "ns"}}
+
+    async def test_watch(self):
+        """The informer must follow protobuf and JSON watch streams."""
+        gone = encode_status(410, "too old", "Expired")
+        frames = [
+            encode_watch_frame("ADDED", namespace_doc("foo", "2")),
+            encode_watch_frame("DELETED", namespace_doc("bar", "3")),
+            encode_watch_frame("ERROR", gone),
+        ]
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces", metadata_only=True)
+        informer.items = {"bar": {"metadata": {"name": "bar", "resourceVersion": "1"}}}
+
+        with mock.patch.object(src.k8s, "CLIENT", src.k8s.Client(protobuf=True)):
+            with aioresponses() as m:
+                m.get(WATCH_URL, body=b"".join(frames),
+                      content_type=src.protobuf.CONTENT_TYPE)
+                async with aiohttp.ClientSession() as sess:
+                    informer.sess = sess
+                    assert await informer.watch() is True
+
+                # Must ask for the metadata of each object only.
+                call = list(m.requests.values())[0][0]
+                projection = src.k8s.WATCH_PROJECTIONS["metadata"]
+                assert call.kwargs["headers"]["accept"].split(", ") == [
+                    src.protobuf.CONTENT_TYPE + projection,
+                    "application/json" + projection,
+                    "application/json",
+                ]
+
+        assert informer.names() == ["foo"]
+        assert informer.resource_version == "3"
+
+        # A stream that simply ends must not require a new LIST.
+        with mock.patch.object(src.k8s, "CLIENT", src.k8s.Client(protobuf=True)):
+            with aioresponses() as m:
+                m.get(WATCH_URL, body=frames[0], content_type=src.protobuf.CONTENT_TYPE)
+                async with aiohttp.ClientSession() as sess:
+                    informer.sess = sess
+                    assert await informer.watch() is False
+        assert informer.resource_version == "2"
@@ -0,0 +1,230 @@
+import gzip
+import json
+from pathlib import Path
+
+import brotli
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import src.responses
+from src.models import Config
+
+
+def make_request(**headers) -> Request:
+    """Return a minimal Starlette request with `headers`."""
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+class TestResponses:
+    def test_encode(self):
+        """Must produce compact JSON, a strong ETag and optionally gzip."""
+        enc = src.responses.encode({"namespaces": ["foo", "bär"]})
+        assert enc.body == '{"namespaces":["foo","bär"]}'.encode()
+        assert enc.compressed == {}
+        assert enc.etag.startswith('"') and enc.etag.endswith('"')
+
+        # Same content, same ETag, with or without compression.
+        enc_gz = src.responses.encode({"namespaces": ["foo", "bär"]}, gzip_level=9)
+        assert enc_gz.etag == enc.etag
+        assert list(enc_gz.compressed) == ["gzip"]
+        assert gzip.decompress(enc_gz.compressed["gzip"]) == enc.body
+
+        # The compressed bytes must be deterministic.
+        assert src.responses.encode({"a": 1}, 6) == src.responses.encode({"a": 1}, 6)
+        assert src.responses.encode({"a": 1}).etag != src.responses.encode({"a": 2}).etag
+
+    def test_compress(self):
+        """Must only compress bodies of at least `min_size` bytes."""
+        body = b"x" * 100
+        assert src.responses.compress(b"", gzip_level=6) == {}
+        assert src.responses.compress(body, gzip_level=6, min_size=101) == {}
+        assert list(src.responses.compress(body, gzip_level=6, min_size=100)) == ["gzip"]
+
+    def test_compress_brotli(self):
+        """Must compress with brotli if enabled."""
+        body = b"x" * 100
+        ret = src.responses.compress(body, gzip_level=6, brotli_level=4)
+        assert set(ret) == {"br", "gzip"}
+        assert brotli.decompress(ret["br"]) == body
+
+    def test_etag_matches(self):
+        """Must implement the weak comparison of `If-None-Match`."""
+        etag = '"abc"'
+        assert not src.responses.etag_matches(make_request(), etag)
+        assert src.responses.etag_matches(make_request(if_none_match='"abc"'), etag)
+        assert src.responses.etag_matches(make_request(if_none_match='W/"abc"'), etag)
+        assert src.responses.etag_matches(make_request(if_none_match='"x", "abc"'), etag)
+        assert src.responses.etag_matches(make_request(if_none_match=" * "), etag)
+        assert not src.responses.etag_matches(make_request(if_none_match='"x"'), etag)
+
+    def test_coding_etag(self):
+        """Must derive a distinct ETag for every content coding."""
+        assert src.responses.coding_etag('"abc"', None) == '"abc"'
+        assert src.responses.coding_etag('"abc"', "br") == '"abc-br"'
+        assert src.responses.coding_etag('W/"abc"', "gzip") == 'W/"abc-gzip"'
+        assert src.responses.coding_etag("invalid", "gzip") == "invalid"
+
+    def test_accepted_codings(self):
+        """Must parse the `Accept-Encoding` header."""
+        def accepted(value):
+            headers = make_request(accept_encoding=value).headers
+            return src.responses.accepted_codings(headers)
+
+        assert src.responses.accepted_codings(make_request().headers) == [""]
+        assert accepted("gzip") == ["gzip"]
+        assert accepted("br, GZIP, deflate") == ["br", "gzip", "deflate"]
+        assert accepted("gzip;q=0.5") == ["gzip"]
+        assert accepted("br, gzip;q=0") == ["br"]
+        assert accepted("gzip; q=0.0") == []
+        assert accepted("gzip;q=invalid") == []
+
+    def test_choose_coding(self):
+        """Must prefer brotli over gzip if the client accepts both."""
+        def choose(value, available):
+            headers = make_request(accept_encoding=value).headers
+            return src.responses.choose_coding(headers, available)
+
+        assert choose("gzip, br", ["gzip", "br"]) == "br"
+        assert choose("gzip, br", ["gzip"]) == "gzip"
+        assert choose("gzip;q=0, br", ["gzip"]) is None
+        assert choose("deflate", ["gzip", "br"]) is None
+
+    def test_respond(self):
+        """Must serve the encoded body, the compressed one or a 304."""
+        enc = src.responses.encode({"a": 1}, gzip_level=6)
+
+        resp = src.responses.respond(make_request(), enc)
+        assert resp.status_code == 200
+        assert resp.body == enc.body
+        assert resp.headers["etag"] == enc.etag
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert "content-encoding" not in resp.headers
+
+        resp = src.responses.respond(make_request(accept_encoding="gzip"), enc)
+        assert resp.body == enc.compressed["gzip"]
+        assert resp.headers["content-encoding"] == "gzip"
+
+        # Every coding must have its own strong ETag.
+        etag_gzip = resp.headers["etag"]
+        assert etag_gzip == enc.etag[:-1] + '-gzip"'
+
+        resp = src.responses.respond(make_request(if_none_match=enc.etag), enc)
+        assert resp.status_code == 304
+        assert resp.body == b""
+        assert resp.headers["etag"] == enc.etag
+
+        # The ETag of one coding must not validate another one.
+        req = make_request(if_none_match=enc.etag, accept_encoding="gzip")
+        assert src.responses.respond(req, enc).status_code == 200
+        req = make_request(if_none_match=etag_gzip, accept_encoding="gzip")
+        assert src.responses.respond(req, enc).status_code == 304
+        req = make_request(if_none_match=etag_gzip)
+        assert src.responses.respond(req, enc).status_code == 200
+
+        # No `Vary` header if we never compress.
+        enc = src.responses.encode({"a": 1})
+        resp = src.responses.respond(make_request(accept_encoding="gzip"), enc)
+        assert json.loads(resp.body) == {"a": 1}
+        assert "vary" not in resp.headers
+
+    def test_encoded_cache(self):
+        """Must only rebuild the value if the key changes."""
+        cache = src.responses.EncodedCache()
+        calls = []
+
+        def build(val):
+            calls.append(val)
+            return src.responses.encode(val)
+
+        assert cache.get(1, lambda: build("a")).body == b'"a"'
+        assert cache.get(1, lambda: build("b")).body == b'"a"'
+        assert cache.get(2, lambda: build("c")).body == b'"c"'
+        assert calls == ["a", "c"]
+
+
+def make_app(**cfg) -> FastAPI:
+    """Return an app with the compression middleware and a few endpoints."""
+    app = FastAPI()
+    app.add_middleware(src.responses.CompressMiddleware)
+    app.extra["config"] = Config(
+        k8s_session=None, k8s_url="", k8s_creds_path=Path(), **cfg)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse("x" * 2000)
+
+    @app.get("/tagged")
+    def tagged():
+        return PlainTextResponse("x" * 2000, headers={"etag": '"abc"'})
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("x" * 10)
+
+    @app.get("/encoded")
+    def encoded():
+        enc = src.responses.encode("x" * 2000, gzip_level=1)
+        return src.responses.respond(make_request(accept_encoding="gzip"), enc)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter(["x" * 2000, "y" * 2000]))
+
+    return app
+
+
+class TestCompressMiddleware:
+    def get(self, client, path, coding):
+        return client.get(path, headers={"accept-encoding": coding})
+
+    def test_gzip(self):
+        """Must compress large responses for clients that accept it."""
+        client = TestClient(make_app(response_brotli_level=0))
+
+        resp = self.get(client, "/large", "gzip")
+        assert resp.text == "x" * 2000
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert int(resp.headers["content-length"]) < 100
+
+        # Must derive the ETag of the compressed body from the original one.
+        assert self.get(client, "/tagged", "gzip").headers["etag"] == '"abc-gzip"'
+        assert self.get(client, "/tagged", "deflate").headers["etag"] == '"abc"'
+
+        # Must not compress small responses or for clients that do not accept it.
+        assert "content-encoding" not in self.get(client, "/small", "gzip").headers
+        assert "content-encoding" not in self.get(client, "/large", "deflate").headers
+
+    def test_passthrough(self):
+        """Must neither compress streams nor already compressed responses."""
+        client = TestClient(make_app(response_brotli_level=0))
+
+        # This endpoint compresses with level 1, we would use 6.
+        resp = self.get(client, "/encoded", "gzip")
+        assert resp.headers["content-encoding"] == "gzip"
+        expected = src.responses.encode("x" * 2000, gzip_level=1).compressed["gzip"]
+        assert resp.headers["content-length"] == str(len(expected))
+
+        resp = self.get(client, "/stream", "gzip")
+        assert "content-encoding" not in resp.headers
+        assert resp.text == "x" * 2000 + "y" * 2000
+
+    def test_disabled(self):
+        """Must do nothing if compression or the configuration is missing."""
+        client = TestClient(make_app(response_gzip_level=0, response_brotli_level=0))
+        assert "content-encoding" not in self.get(client, "/large", "gzip").headers
+
+        app = make_app()
+        app.extra.clear()
+        resp = self.get(TestClient(app), "/large", "gzip")
+        assert "content-encoding" not in resp.headers
+
+    def test_brotli(self):
+        """Must prefer brotli if both sides support it."""
+        client = TestClient(make_app())
+        resp = self.get(client, "/large", "gzip, br")
+        assert resp.headers["content-encoding"] == "br"
+        assert resp.text == "x" * 2000
@@ -1,11 +1,17 @@
 import os
+import time
 from pathlib import Path
 from unittest import mock
 
+import aiohttp
 from fastapi.testclient import TestClient
 
+import src.clusters
 import src.k8s
+import src.metrics
 import src.server
+import src.shared
+import src.snapshot
 from src.models import Config
 
 
@@ -17,7 +23,10 @@ class TestEndpoints:
         cfg = Config(
             k8s_session=mock.AsyncMock(),
             k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
-            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"])
+            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+            k8s_credentials=mock.MagicMock(stop=mock.AsyncMock()),
+            loop_monitor_interval=10,
+            rate_limit=5,
         )
 
         # Mock the response of `create_session` to return our `cfg`.
@@ -25,11 +34,58 @@ class TestEndpoints:
 
         # Run through the startup and shutdown process of FastAPI.
         with TestClient(src.server.FASTAPI_APP):
-            pass
+            # Startup must have launched the namespace informer.
+            informer = src.server.FASTAPI_APP.extra["informer"]
+            assert informer._task is not None
+
+            # Startup must have started the optional loop monitor.
+            loopmon = src.server.FASTAPI_APP.extra["loopmon"]
+            assert loopmon._task is not None
+
+            # Startup must have configured the K8s response cache.
+            assert src.k8s.RESPONSE_CACHE.max_entries == cfg.k8s_cache_size
 
-        # The shutdown part must have closed the aiohttp session.
+            # Startup must have created the optional rate limiter.
+            assert src.server.FASTAPI_APP.extra["ratelimit"].rate == 5
+
+        # The shutdown part must have stopped the informer and health monitor...
+        assert informer._task is None
+        assert src.server.FASTAPI_APP.extra["health"]._task is None
+        assert loopmon._task is None
+
+        # ...and closed the aiohttp session after the credential reloader.
+        cfg.k8s_credentials.start.assert_called_once_with()
+        cfg.k8s_credentials.stop.assert_awaited_once_with()
         cfg.k8s_session.close.assert_called_once()
 
+    @mock.patch.object(src.k8s, "create_session")
+    def test_time_to_healthy(self, m_cs):
+        """Must be healthy right after startup and ready once the informer synced."""
+        cfg = Config(
+            k8s_session=mock.MagicMock(),
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"])
+        )
+        cfg.k8s_session.get = mock.MagicMock(side_effect=aiohttp.ClientConnectionError)
+        cfg.k8s_session.close = mock.AsyncMock()
+        m_cs.return_value = (cfg, False)
+
+        # Startup must not wait for K8s, which never answers here. The bound
+        # is generous because shared CI runners are slow.
+        start = time.perf_counter()
+        with TestClient(src.server.FASTAPI_APP) as client:
+            assert client.get("/healthz").status_code == 200
+            assert time.perf_counter() - start < 5
+
+            # Not ready until the informer has the namespaces.
+            informer = src.server.FASTAPI_APP.extra["informer"]
+            assert not informer.synced.is_set()
+            assert client.get("/readyz").status_code == 503
+            informer.synced.set()
+            informer.heartbeat = time.monotonic()
+            src.server.FASTAPI_APP.extra["health"].check(0)
+            assert client.get("/readyz").status_code == 200
+
     def test_exception(self, client):
         """Use test endpoint to trigger an exception in the server.
 
@@ -39,3 +95,101 @@ class TestEndpoints:
         """
         response = client.get("/exception")
         assert response.status_code == 418
+
+    def test_metrics(self, client):
+        """Must label the request metrics with the route template."""
+        def value(metric, *labels):
+            return metric.labels(*labels)._value.get()
+
+        def count(*labels):
+            hist = src.metrics.PROM_REQ_TIME.labels(*labels)
+            return sum(_.get() for _ in hist._buckets)
+
+        req = src.metrics.PROM_REQ_CNT
+        cnt_ok = value(req, "GET", "/healthz", 200)
+        cnt_404 = value(req, "GET", "<unmatched>", 404)
+        time_ok = count("GET", "/healthz")
+
+        assert client.get("/healthz").status_code == 200
+        assert client.get("/does/not/exist").status_code == 404
+
+        assert value(req, "GET", "/healthz", 200) == cnt_ok + 1
+        assert value(req, "GET", "<unmatched>", 404) == cnt_404 + 1
+        assert count("GET", "/healthz") == time_ok + 1
+
+        # No request must be in flight anymore.
+        assert src.metrics.PROM_REQ_INFLIGHT._value.get() == 0
+
+    @mock.patch.object(src.clusters, "create_clusters")
+    @mock.patch.object(src.k8s, "create_session")
+    def test_startup_shutdown_clusters(self, m_cs, m_cc):
+        """Must start and stop the sessions of additional clusters."""
+        cfg = Config(
+            k8s_session=mock.AsyncMock(),
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+            clusters_file=Path("clusters.yaml"),
+        )
+        cluster = mock.MagicMock(stop=mock.AsyncMock())
+        m_cs.return_value = (cfg, False)
+        m_cc.return_value = ({"other": cluster}, False)
+
+        with TestClient(src.server.FASTAPI_APP):
+            m_cc.assert_called_once_with(cfg)
+            cluster.start.assert_called_once_with()
+            assert src.server.FASTAPI_APP.extra["clusters"] == {"other": cluster}
+        cluster.stop.assert_awaited_once_with()
+
+    @mock.patch.object(src.k8s, "create_session")
+    def test_startup_worker(self, m_cs, tmp_path):
+        """Worker processes must load their own config and share the informer."""
+        app = src.server.FASTAPI_APP
+        app.extra.clear()
+
+        cfg = Config(
+            k8s_session=mock.AsyncMock(),
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+            shared_cache_dir=tmp_path,
+        )
+        m_cs.return_value = (cfg, False)
+
+        new_env = {"SHARED_CACHE_DIR": str(tmp_path), "PROMETHEUS_MULTIPROC_DIR": "/tmp"}
+        with mock.patch.dict("os.environ", values=new_env):
+            with mock.patch("prometheus_client.multiprocess.mark_process_dead") as m_dead:
+                with TestClient(app):
+                    # Must have loaded the config from the environment.
+                    assert m_cs.call_args[0][0].shared_cache_dir == tmp_path
+                    assert isinstance(app.extra["informer"], src.shared.SharedInformer)
+                m_dead.assert_called_once_with(os.getpid())
+
+    @mock.patch.object(src.k8s, "create_session")
+    def test_startup_snapshot(self, m_cs, tmp_path):
+        """Must restore the informer from the snapshot and save it on shutdown."""
+        app = src.server.FASTAPI_APP
+        app.extra.clear()
+        fname = tmp_path / "namespaces.snap"
+        src.snapshot.dump(
+            fname, "5", {"foo": {"metadata": {"name": "foo", "resourceVersion": "5"}}})
+
+        cfg = Config(
+            k8s_session=mock.AsyncMock(),
+            k8s_url="https://" + os.environ["KUBERNETES_SERVICE_HOST"],
+            k8s_creds_path=Path(os.environ["K8S_CREDENTIALS_PATH"]),
+            snapshot_dir=tmp_path,
+        )
+        m_cs.return_value = (cfg, False)
+
+        with mock.patch.dict("os.environ", values={"SNAPSHOT_DIR": str(tmp_path)}):
+            with TestClient(app):
+                snapshot = app.extra["snapshot"]
+                assert snapshot._task is not None
+                assert app.extra["informer"].names() == ["foo"]
+                assert app.extra["informer"].resource_version == "5"
+
+                # Must write the changes during shutdown.
+                app.extra["informer"].apply(
+                    "ADDED", {"metadata": {"name": "bar", "resourceVersion": "6"}})
+        assert snapshot._task is None
+        _, items = src.snapshot.load(fname)[0]
+        assert sorted(items) == ["bar", "foo"]
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+import pytest
+
+import src.shared
+from src.informer import Informer
+from src.shared import SharedInformer
+
+
+def make_shared(path, interval=0.01) -> SharedInformer:
+    """Return a `SharedInformer` whose informer never talks to K8s."""
+    informer = Informer(None, "", "/api/v1/namespaces")
+    informer.start = mock.MagicMock()              # type: ignore
+    informer.stop = mock.AsyncMock()               # type: ignore
+    return SharedInformer(informer, path, interval=interval)
+
+
+def add(informer: Informer, name: str) -> None:
+    """Add namespace `name` to `informer`."""
+    informer.apply("ADDED", {"metadata": {"name": name, "resourceVersion": "1"}})
+
+
+class TestSharedInformer:
+    def test_write_atomic(self, tmp_path):
+        """Must replace the file and not leave any temporary files behind."""
+        fname = tmp_path / "data"
+        src.shared.write_atomic(fname, b"foo")
+        src.shared.write_atomic(fname, b"bar")
+        assert fname.read_bytes() == b"bar"
+        assert list(tmp_path.iterdir()) == [fname]
+
+    def test_leader_election(self, tmp_path):
+        """Only one worker must run the informer at any given time."""
+        leader, follower = make_shared(tmp_path), make_shared(tmp_path)
+
+        leader.step()
+        follower.step()
+        assert (leader.leader, follower.leader) == (True, False)
+        leader.informer.start.assert_called_once_with()     # type: ignore
+        assert not follower.informer.start.called           # type: ignore
+
+        # The leader must not restart its informer.
+        leader.step()
+        leader.informer.start.assert_called_once_with()     # type: ignore
+
+        # The follower must take over once the leader released its lock.
+        asyncio.run(leader.stop())
+        assert leader._lock_fd is None
+        follower.step()
+        assert follower.leader
+        asyncio.run(follower.stop())
+
+    def test_publish_load(self, tmp_path):
+        """Followers must serve the data the leader published."""
+        leader, follower = make_shared(tmp_path), make_shared(tmp_path)
+        leader.step()
+
+        # Nothing to publish or load until the leader's informer has synced.
+        follower.step()
+        assert not leader.synced.is_set() and not follower.synced.is_set()
+        assert not leader.fname_data.exists()
+
+        assert leader.heartbeat == follower.heartbeat == 0
+        add(leader.informer, "foo")
+        leader.informer.synced.set()
+        leader.informer.heartbeat = 10
+        leader.step()
+        follower.step()
+        assert leader.synced.is_set() and follower.synced.is_set()
+
+        # The follower must see the heartbeat of the leader's informer.
+        assert leader.heartbeat == 10
+        assert follower.heartbeat == pytest.approx(10, abs=0.1)
+        assert leader.names() == follower.names() == ["foo"]
+        assert leader.version == follower.version == 1
+        data = json.loads(leader.fname_data.read_text())
+        wall = time.time() - time.monotonic() + 10
+        assert data.pop("heartbeat") == pytest.approx(wall, abs=1)
+        assert data == {"resourceVersion": "1", "names": ["foo"]}
+
+        # Must not republish unchanged data and not reload an unchanged file.
+        with mock.patch.object(src.shared, "write_atomic") as m_write:
+            leader.step()
+            assert not m_write.called
+        follower._names = ["unchanged"]
+        follower.step()
+        assert follower.names() == ["unchanged"]
+        assert leader.version == follower.version == 1
+        follower._names = ["foo"]
+
+        # The leader must republish an advancing heartbeat, but not too often.
+        leader.informer.heartbeat = 11
+        with mock.patch.object(src.shared, "write_atomic") as m_write:
+            leader.step()
+            assert not m_write.called
+        sub_follower = follower.subscribe(10)
+        leader.informer.heartbeat = 16
+        leader.step()
+        follower.step()
+        assert leader.heartbeat == 16
+        assert follower.heartbeat == pytest.approx(16, abs=0.1)
+        assert leader.version == follower.version == 1
+        assert list(sub_follower.events) == []
+        follower.unsubscribe(sub_follower)
+
+        # Changes must propagate, also to subscribers.
+        sub_leader, sub_follower = leader.subscribe(10), follower.subscribe(10)
+        add(leader.informer, "bar")
+        leader.step()
+        follower.step()
+        assert list(sub_leader.events) == list(sub_follower.events) == [("ADDED", "bar")]
+        assert leader.names() == follower.names() == ["bar", "foo"]
+        assert leader.version == follower.version == 2
+
+        asyncio.run(leader.stop())
+        asyncio.run(follower.stop())
+
+    @pytest.mark.asyncio
+    async def test_start_stop(self, tmp_path):
+        """Background task must synchronise and survive errors."""
+        shared = make_shared(tmp_path)
+        add(shared.informer, "foo")
+        shared.informer.synced.set()
+
+        with mock.patch.object(shared, "publish", side_effect=[ValueError, None, None]):
+            shared.start()
+            for _ in range(100):
+                if shared.publish.call_count >= 2:          # type: ignore
+                    break
+                await asyncio.sleep(0.01)
+            await shared.stop()
+
+        assert shared._task is None and shared._lock_fd is None
+        shared.informer.stop.assert_called_once_with()      # type: ignore
+
+        # Stopping again is harmless.
+        await shared.stop()
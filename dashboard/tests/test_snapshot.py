@@ -0,0 +1,132 @@
+import asyncio
+import os
+import re
+from unittest import mock
+
+import aiohttp
+import pytest
+from aioresponses import aioresponses
+
+import src.snapshot
+from src.informer import Informer
+from src.snapshot import Snapshotter
+
+# Convenience.
+K8S_URL = os.environ["KUBERNETES_SERVICE_HOST"]
+NS_URL = K8S_URL + "/api/v1/namespaces"
+WATCH_URL = re.compile(re.escape(NS_URL) + r"\?.*watch=1.*")
+
+
+def manifest(name: str, rv: str) -> dict:
+    """Return a minimal K8s namespace manifest."""
+    return {"metadata": {"name": name, "resourceVersion": rv, "labels": {"a": "ü"}}}
+
+
+class TestSnapshot:
+    def test_dump_load(self, tmp_path):
+        """Must restore exactly what it saved."""
+        fname = tmp_path / "snap"
+        items = {_: manifest(_, str(i)) for i, _ in enumerate(["foo", "bar", "x"])}
+        src.snapshot.dump(fname, "12345", items)
+        assert src.snapshot.load(fname) == (("12345", items), False)
+
+        # Resource versions of any length and no items.
+        for rv in ("1", "12", "123", "1234"):
+            src.snapshot.dump(fname, rv, {})
+            assert src.snapshot.load(fname) == ((rv, {}), False)
+
+    def test_load_err(self, tmp_path):
+        """Must reject missing, truncated, foreign and corrupt files."""
+        fname = tmp_path / "snap"
+        assert src.snapshot.load(fname) == (("", {}), True)
+
+        src.snapshot.dump(fname, "1", {"foo": manifest("foo", "1")})
+        data = fname.read_bytes()
+        invalid = [
+            b"",
+            data[:10],
+            b"X" + data[1:],
+            data[:-1] + b"X",
+        ]
+        for buf in invalid:
+            fname.write_bytes(buf)
+            assert src.snapshot.load(fname) == (("", {}), True)
+
+
+@pytest.mark.asyncio
+class TestSnapshotter:
+    async def test_restore_save(self, tmp_path):
+        """Must only save changed data and restore it into a fresh informer."""
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces")
+        snap = Snapshotter(informer, tmp_path, interval=0.01)
+
+        # Nothing to restore and nothing to save until the informer synced.
+        assert snap.restore() is True
+        snap.save()
+        assert not snap.fname.exists()
+
+        informer.apply("ADDED", manifest("foo", "7"))
+        informer.synced.set()
+        with mock.patch.object(src.snapshot, "dump", wraps=src.snapshot.dump) as m_dump:
+            snap.save()
+            snap.save()
+            assert m_dump.call_count == 1
+
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces")
+        snap = Snapshotter(informer, tmp_path)
+        assert snap.restore() is False
+        assert informer.synced.is_set()
+        assert informer.names() == ["foo"]
+        assert informer.resource_version == "7"
+
+        # Must not save the data it has just restored.
+        with mock.patch.object(src.snapshot, "dump") as m_dump:
+            snap.save()
+            assert not m_dump.called
+
+    async def test_start_stop(self, tmp_path):
+        """Must save periodically, survive errors and save once more on stop."""
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces")
+        informer.synced.set()
+        snap = Snapshotter(informer, tmp_path, interval=0.01)
+
+        with mock.patch.object(src.snapshot, "dump", side_effect=OSError) as m_dump:
+            snap.start()
+            await asyncio.sleep(0.05)
+            assert m_dump.call_count > 1
+            await snap.stop()
+        assert snap._task is None
+
+        await snap.stop()
+        assert src.snapshot.load(snap.fname) == (("", {}), False)
+
+    async def test_informer_resume(self, tmp_path):
+        """A restored informer must WATCH from the snapshot without a LIST."""
+        items = {"foo": manifest("foo", "5")}
+        src.snapshot.dump(tmp_path / "namespaces.snap", "5", items)
+        informer = Informer(None, K8S_URL, "/api/v1/namespaces", retry_delay=0)
+        assert Snapshotter(informer, tmp_path).restore() is False
+
+        # The second watch blocks until we stop the informer.
+        async def block(url, **kwargs):
+            await asyncio.Event().wait()
+
+        added = {"type": "ADDED", "object": manifest("bar", "6")}
+        with aioresponses() as m:
+            m.get(WATCH_URL, payload=added)
+            m.get(WATCH_URL, callback=block)
+            async with aiohttp.ClientSession() as sess:
+                informer.sess = sess
+                informer.start()
+                for _ in range(100):
+                    if "bar" in informer.items:
+                        break
+                    await asyncio.sleep(0.01)
+                await informer.stop()
+
+            # Only WATCH requests, starting from the resource version of the
+            # snapshot.
+            urls = [str(url) for _, url in m.requests]
+            assert all("watch=1" in _ for _ in urls)
+            assert "resourceVersion=5" in urls[0]
+        assert informer.names() == ["bar", "foo"]